@@ -11,142 +11,231 @@ from datetime import timedelta
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from utilities.bitget_futures import BitgetFutures
-from utilities.strategy_logic import calculate_envelope_indicators
+from utilities.indicator_cache import INDICATOR_CACHE
+from analysis.candle_store import store_path, read_meta, read_candles, migrate_csv, missing_segments, merge_candles, to_ms
+from analysis.backtest_engine import prepare_arrays, prepare_sets, run_simulation, trade_log_array, FEE_PCT, LOG_SET, STOP_NAMES
 
 def load_data(symbol, timeframe, start_date_str, end_date_str):
     cache_dir = os.path.join(os.path.dirname(__file__), '..', 'analysis', 'historical_data')
     os.makedirs(cache_dir, exist_ok=True)
-    symbol_filename = symbol.replace('/', '-').replace(':', '-')
-    cache_file = os.path.join(cache_dir, f"{symbol_filename}_{timeframe}.csv")
-    if os.path.exists(cache_file):
-        data = pd.read_csv(cache_file, index_col='timestamp', parse_dates=True)
-        data.index = pd.to_datetime(data.index, utc=True)
-        required_start = pd.to_datetime(start_date_str, utc=True)
-        if data.index.min() <= required_start and data.index.max() >= pd.to_datetime(end_date_str, utc=True):
-            return data.loc[start_date_str:end_date_str]
-    try:
-        project_root = os.path.join(os.path.dirname(__file__), '..', '..')
-        key_path = os.path.abspath(os.path.join(project_root, 'secret.json'))
-        with open(key_path, "r") as f: secrets = json.load(f)
-        api_setup = secrets.get('envelope', secrets.get('bitget_example'))
-        bitget = BitgetFutures(api_setup)
-        download_start = (pd.to_datetime(start_date_str) - timedelta(days=50)).strftime('%Y-%m-%d')
-        download_end = (pd.to_datetime(end_date_str) + timedelta(days=1)).strftime('%Y-%m-%d')
-        full_data = bitget.fetch_historical_ohlcv(symbol, timeframe, download_start, download_end)
-        if full_data is not None and not full_data.empty:
-            full_data.to_csv(cache_file)
-            return full_data.loc[start_date_str:end_date_str]
-        else: return pd.DataFrame()
-    except Exception as e:
-        print(f"Fehler beim Daten-Download für {timeframe}: {e}"); return pd.DataFrame()
-
-def run_envelope_backtest(data, params):
-    # <<< ÄNDERUNG: Cooldown-Option aus Parametern lesen >>>
-    use_cooldown = params.get('behavior', {}).get('use_cooldown_after_sl', True)
-    
-    balance_fraction = params.get('balance_fraction_pct', 100) / 100
-    stop_loss_pct = params.get('stop_loss_pct', 0.4) / 100
-    envelopes = params.get('envelopes_pct', [])
-    fee_pct = 0.05 / 100
-    start_capital = params.get('start_capital', 1000)
-    
-    current_capital = start_capital
-    trades_count, wins_count = 0, 0
-    trade_log = []
-    peak_capital = start_capital
-    max_drawdown_pct = 0.0
-    open_positions = []
-    
-    # <<< ÄNDERUNG: Status-Management für den Backtest >>>
-    bot_status = "ok_to_trade"
-    last_side_closed = None
-
-    for i in range(1, len(data)):
-        current_candle = data.iloc[i]
-        
-        # <<< ÄNDERUNG: Cooldown-Logik im Backtest >>>
-        if bot_status == "waiting_for_reentry":
-            resume_price = current_candle['average']
-            if (last_side_closed == 'long' and current_candle['high'] >= resume_price) or \
-               (last_side_closed == 'short' and current_candle['low'] <= resume_price):
-                bot_status = "ok_to_trade"
-            else:
-                continue # Überspringe diese Kerze, da wir im Cooldown sind
-        
-        if open_positions:
-            avg_entry_price = np.mean([p['entry_price'] for p in open_positions])
-            total_amount = sum([p['amount'] for p in open_positions])
-            side = open_positions[0]['side']
-            avg_leverage = np.mean([p['leverage'] for p in open_positions])
-
-            sl_price = avg_entry_price * (1 - stop_loss_pct) if side == 'long' else avg_entry_price * (1 + stop_loss_pct)
-            tp_price = current_candle['average']
-            exit_price = None
-            reason = None
-
-            if (side == 'long' and current_candle['low'] <= sl_price) or (side == 'short' and current_candle['high'] >= sl_price):
-                exit_price = sl_price
-                reason = "Stop-Loss"
-
-            if not exit_price and ((side == 'long' and current_candle['high'] >= tp_price) or (side == 'short' and current_candle['low'] <= tp_price)):
-                exit_price = tp_price
-                reason = "Take-Profit"
-
-            if exit_price is not None:
-                pnl = (exit_price - avg_entry_price) * total_amount if side == 'long' else (avg_entry_price - exit_price) * total_amount
-                entry_value = avg_entry_price * total_amount
-                exit_value = exit_price * total_amount
-                total_fees = (entry_value * fee_pct) + (exit_value * fee_pct)
-                pnl -= total_fees
-                
-                current_capital += pnl
-                trades_count += 1
-                if reason == "Take-Profit": wins_count += 1
-                
-                trade_log.append({
-                    "timestamp": str(current_candle.name), "side": side, "entry": avg_entry_price, 
-                    "exit": exit_price, "pnl": pnl, "balance": current_capital, "reason": reason, 
-                    "leverage": avg_leverage, "stop_loss_price": sl_price, "take_profit_price": tp_price
-                })
-                open_positions = []
-                
-                # <<< ÄNDERUNG: Status nach Trade-Schließung setzen >>>
-                if reason == "Stop-Loss" and use_cooldown:
-                    bot_status = "waiting_for_reentry"
-                    last_side_closed = side
-                else:
-                    bot_status = "ok_to_trade"
-
-            if not open_positions:
-                if current_capital <= 0: current_capital = 0
-                peak_capital = max(peak_capital, current_capital)
-                drawdown = (peak_capital - current_capital) / peak_capital if peak_capital > 0 else 0
-                max_drawdown_pct = max(max_drawdown_pct, drawdown)
-                if current_capital == 0: break
-                continue
-
-        if not open_positions and bot_status == "ok_to_trade":
-            leverage = params.get('base_leverage', 10) # Vereinfacht für Backtest
-            
-            for j, e_pct in enumerate(envelopes):
-                band_low = current_candle[f'band_low_{j+1}']
-                if current_candle['low'] <= band_low:
-                    amount = (current_capital * balance_fraction / len(envelopes)) * leverage / band_low
-                    open_positions.append({'side': 'long', 'entry_price': band_low, 'amount': amount, 'leverage': leverage})
-
-            if not open_positions:
-                for j, e_pct in enumerate(envelopes):
-                    band_high = current_candle[f'band_high_{j+1}']
-                    if current_candle['high'] >= band_high:
-                        amount = (current_capital * balance_fraction / len(envelopes)) * leverage / band_high
-                        open_positions.append({'side': 'short', 'entry_price': band_high, 'amount': amount, 'leverage': leverage})
+    store = store_path(cache_dir, symbol, timeframe)
+    legacy_csv = f"{store}.csv"
+    if read_meta(store) is None and os.path.exists(legacy_csv):
+        migrate_csv(legacy_csv, store, symbol, timeframe)
+
+    # Nur fehlende Abschnitte (Anfang, Ende, interne Lücken) werden nachgeladen; die Abdeckung
+    # wird aus dem Header und den gemappten Zeitstempeln bestimmt, ohne die Daten zu parsen.
+    download_start = (pd.to_datetime(start_date_str) - timedelta(days=50)).strftime('%Y-%m-%d')
+    download_end = (pd.to_datetime(end_date_str) + timedelta(days=1)).strftime('%Y-%m-%d')
+    segments = missing_segments(store, timeframe, to_ms(start_date_str), to_ms(end_date_str),
+                                to_ms(download_start), to_ms(download_end))
+    if segments:
+        try:
+            project_root = os.path.join(os.path.dirname(__file__), '..', '..')
+            key_path = os.path.abspath(os.path.join(project_root, 'secret.json'))
+            with open(key_path, "r") as f: secrets = json.load(f)
+            api_setup = secrets.get('envelope', secrets.get('bitget_example'))
+            # ccxt nur laden, wenn tatsächlich heruntergeladen wird (nicht in Optimierer-Workern)
+            from utilities.bitget_futures import BitgetFutures
+            bitget = BitgetFutures(api_setup)
+            downloaded = [bitget.fetch_ohlcv_range(symbol, timeframe, seg_start, seg_end + 1) for seg_start, seg_end in segments]
+            downloaded = [df for df in downloaded if df is not None and not df.empty]
+            merge_candles(store, pd.concat(downloaded) if downloaded else None, symbol, timeframe, checked_gaps=segments)
+        except Exception as e:
+            print(f"Fehler beim Daten-Download für {timeframe}: {e}"); return pd.DataFrame()
+    return read_candles(store, start_date_str, end_date_str)
+
+def format_time(seconds):
+    if seconds < 60: return f"{seconds:.1f} Sekunden"
+    minutes = int(seconds // 60)
+    remaining_seconds = int(seconds % 60)
+    if minutes < 60: return f"{minutes} Minuten und {remaining_seconds} Sekunden"
+    hours = int(minutes // 60)
+    remaining_minutes = int(minutes % 60)
+    return f"{hours} Stunden, {remaining_minutes} Minuten und {remaining_seconds} Sekunden"
 
+def _build_result(params, run, s):
+    start_capital = params.get('start_capital', 1000)
+    end_capital = run['capital'][s]
+    trades_count = int(run['trades'][s])
+    wins_count = int(run['wins'][s])
     win_rate = (wins_count / trades_count * 100) if trades_count > 0 else 0
-    final_pnl_pct = ((current_capital / start_capital) - 1) * 100
-    
+    final_pnl_pct = ((end_capital / start_capital) - 1) * 100
     return {
         "total_pnl_pct": final_pnl_pct, "trades_count": trades_count,
-        "win_rate": win_rate, "params": params, "end_capital": current_capital,
-        "max_drawdown_pct": max_drawdown_pct, "trade_log": trade_log
+        "win_rate": win_rate, "params": params, "end_capital": end_capital,
+        "max_drawdown_pct": run['max_drawdown'][s], "worst_trade_pnl": run['worst_trade_pnl'][s],
+        "stop_reason": STOP_NAMES[int(run['stop_reason'][s])]
+    }
+
+def _timestamps_ms(index):
+    index = pd.DatetimeIndex(index)
+    index = index.tz_localize('UTC') if index.tz is None else index.tz_convert('UTC')
+    return index.as_unit('ms').asi8
+
+def _checkpoint_bars(n, checkpoints):
+    # Eine Zahl teilt den Zeitraum in gleich lange Abschnitte, sonst sind es Kerzen-Indizes
+    if isinstance(checkpoints, (int, np.integer)):
+        return [n * c // checkpoints for c in range(1, checkpoints)] if checkpoints > 1 else []
+    return list(checkpoints)
+
+def run_envelope_backtest(data, params, trade_log=True, stop_conditions=None, checkpoints=(), on_checkpoint=None):
+    """
+    Backtest eines Parameter-Sets auf einem DataFrame mit berechneten Indikatoren.
+    Mit `trade_log=False` werden nur die laufenden Kennzahlen geführt (PnL, Drawdown, Trades,
+    Gewinner, schlechtester Trade); sonst enthält das Ergebnis ein strukturiertes Array
+    `trade_log` (siehe `TRADE_LOG_DTYPE`, als DataFrame über `trade_log_frame`).
+    `stop_conditions`, `checkpoints` und `on_checkpoint` wie bei `run_envelope_backtest_sets`.
+    """
+    envelopes = params.get('envelopes_pct', [])
+
+    # Die Simulation läuft über zusammenhängende Arrays statt über data.iloc[i]
+    arrays = prepare_arrays(data, len(envelopes))
+    sets = prepare_sets([params], [list(range(len(envelopes)))], stop_conditions=stop_conditions)
+    valid = np.ones((len(data), 1), dtype=np.bool_)
+    run = run_simulation(
+        arrays['high'], arrays['low'], arrays['average'].reshape(-1, 1), valid, np.zeros(1, dtype=np.int64),
+        arrays['band_low'], arrays['band_high'], sets, FEE_PCT, trade_log,
+        _checkpoint_bars(len(data), checkpoints), on_checkpoint
+    )
+
+    result = _build_result(params, run, 0)
+    if trade_log:
+        result["trade_log"] = trade_log_array(_timestamps_ms(data.index), run['log'])
+    return result
+
+def indicator_key(params):
+    """Schlüssel der Indikator-Spalte, die ein Parameter-Set benötigt (Durchschnitt, ATR, Trend-Filter)."""
+    trend_filter_params = params.get('trend_filter', {})
+    return (
+        params.get('average_type', 'DCM'), int(params.get('average_period', 5)), params.get('atr_period', 14),
+        trend_filter_params.get('period', 200) if trend_filter_params.get('enabled', False) else None
+    )
+
+def evaluation_key(params):
+    """
+    Alles, was die Kennzahlen eines Backtests bestimmt, mit den Standardwerten der Engine (siehe `prepare_sets`).
+    Nicht verwendete Felder (z.B. `target_atr_pct`, `max_leverage`) fehlen, damit gleiche Läufe gleich heißen.
+    """
+    return {
+        'indicator': list(indicator_key(params)),
+        'envelopes_pct': [float(e) for e in params.get('envelopes_pct', [])],
+        'start_capital': float(params.get('start_capital', 1000)),
+        'balance_fraction_pct': float(params.get('balance_fraction_pct', 100)),
+        'stop_loss_pct': float(params.get('stop_loss_pct', 0.4)),
+        'base_leverage': float(params.get('base_leverage', 10)),
+        'use_cooldown': bool(params.get('behavior', {}).get('use_cooldown_after_sl', True)),
+        'fee_pct': FEE_PCT,
     }
+
+class FrameIndicatorSource:
+    """
+    Liefert Preis-Arrays und Indikator-Matrizen eines DataFrames für den Batch-Kernel.
+    Durchschnitt und ATR kommen aus dem Indikator-Cache.
+    """
+    def __init__(self, data, cache=INDICATOR_CACHE):
+        self.data = data
+        self.cache = cache
+        self.timestamps = _timestamps_ms(data.index)
+        self.high = np.ascontiguousarray(data['high'].to_numpy(dtype=np.float64))
+        self.low = np.ascontiguousarray(data['low'].to_numpy(dtype=np.float64))
+        self.close = np.ascontiguousarray(data['close'].to_numpy(dtype=np.float64))
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def fingerprint(self):
+        return self.cache.fingerprint(self.data)
+
+    def indicator_matrices(self, keys):
+        """
+        Baut für die eindeutigen Schlüssel eine (Kerzen x Spalten)-Matrix der Durchschnitte und die
+        passende Gültigkeitsmaske (entspricht `dropna()`); gibt zusätzlich die Spalte je Schlüssel zurück.
+        """
+        columns = {}
+        key_columns = np.array([columns.setdefault(key, len(columns)) for key in keys], dtype=np.int64)
+
+        base_valid = self.data.notna().all(axis=1).to_numpy()
+        average = np.empty((len(self.data), len(columns)), dtype=np.float64)
+        valid = np.empty((len(self.data), len(columns)), dtype=np.bool_)
+        atr_valid = {}
+        for (avg_type, avg_period, atr_period, trend_period), g in columns.items():
+            if atr_period not in atr_valid:
+                atr = self.cache.atr(self.data, atr_period)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    atr_valid[atr_period] = ~np.isnan(atr) & ~np.isnan((atr / self.close) * 100)
+            avg = self.cache.average(self.data, avg_type, avg_period)
+            average[:, g] = avg
+            valid[:, g] = base_valid & atr_valid[atr_period] & ~np.isnan(avg)
+            if trend_period is not None:
+                valid[:, g] &= ~np.isnan(self.cache.trend_sma(self.data, trend_period))
+        return average, valid, key_columns
+
+def run_envelope_backtest_sets(source, params_list, trade_log=False, stop_conditions=None, checkpoints=(), on_checkpoint=None,
+                               evaluation_cache=None):
+    """
+    Bewertet viele Parameter-Sets in einem gemeinsamen Kernel-Durchlauf über die Arrays einer
+    Indikator-Quelle (`FrameIndicatorSource` oder `SharedDataset`). Die Bänder werden im Kernel aus
+    dem Durchschnitt abgeleitet. Standardmäßig nur Kennzahlen inkl. `worst_trade_pnl` (größter
+    Einzelverlust, 0 wenn kein Verlust-Trade); mit `trade_log=True` zusätzlich das strukturierte Trade-Log.
+
+    `stop_conditions` ({'max_trade_loss_pct': ..., 'max_drawdown_pct': ...}) beendet ein Set, sobald
+    eine Grenze überschritten ist; `stop_reason` im Ergebnis nennt den Grund. `checkpoints` (Anzahl
+    gleich langer Abschnitte oder Kerzen-Indizes) ruft dazwischen `on_checkpoint(step, capital,
+    max_drawdown)` auf; eine zurückgegebene Maske beendet die markierten Sets ('pruned').
+
+    Mit `evaluation_cache` (siehe `EvaluationCache`, nur ohne Trade-Log) werden bekannte Sets nicht
+    gerechnet und gleiche Sets im selben Aufruf nur einmal; `on_checkpoint` sieht dann nur die gerechneten.
+    """
+    if not params_list:
+        return []
+    if evaluation_cache is not None and not trade_log:
+        return _run_sets_cached(source, params_list, evaluation_cache, stop_conditions, checkpoints, on_checkpoint)
+
+    average, valid, set_group = source.indicator_matrices([indicator_key(p) for p in params_list])
+    sets = prepare_sets(params_list, set_group, stop_conditions=stop_conditions)
+    for s, params in enumerate(params_list):
+        for j, e_pct in enumerate(params.get('envelopes_pct', [])):
+            e = e_pct / 100
+            sets['band_low_factor'][s, j] = 1 - e
+            sets['band_high_factor'][s, j] = 1 + e
+
+    run = run_simulation(
+        source.high, source.low, average, valid, set_group, average, average, sets, FEE_PCT, trade_log,
+        _checkpoint_bars(len(source), checkpoints), on_checkpoint
+    )
+
+    results = []
+    for s, params in enumerate(params_list):
+        result = _build_result(params, run, s)
+        if trade_log:
+            result["trade_log"] = trade_log_array(source.timestamps, run['log'][run['log'][:, LOG_SET] == s])
+        results.append(result)
+    return results
+
+def _run_sets_cached(source, params_list, evaluation_cache, stop_conditions, checkpoints, on_checkpoint):
+    dataset = source.fingerprint
+    keys = [evaluation_key(params) for params in params_list]
+    cached = evaluation_cache.lookup(dataset, keys, stop_conditions)
+    # Pro fehlendem Schlüssel ein Lauf, auch wenn er mehrfach vorkommt
+    pending = {}
+    for s, result in enumerate(cached):
+        if result is None:
+            pending.setdefault(json.dumps(keys[s], sort_keys=True), []).append(s)
+    if pending:
+        first = [indices[0] for indices in pending.values()]
+        fresh = run_envelope_backtest_sets(source, [params_list[s] for s in first], stop_conditions=stop_conditions,
+                                           checkpoints=checkpoints, on_checkpoint=on_checkpoint)
+        evaluation_cache.store(dataset, [(keys[s], result) for s, result in zip(first, fresh)], stop_conditions)
+        for indices, result in zip(pending.values(), fresh):
+            for s in indices:
+                cached[s] = result
+    return [{**result, 'params': params} for result, params in zip(cached, params_list)]
+
+def run_envelope_backtest_batch(data, params_list, cache=INDICATOR_CACHE, trade_log=False, **kwargs):
+    """
+    Bewertet viele Parameter-Sets in einem gemeinsamen Durchlauf über die Rohdaten (ohne Indikatoren).
+    Durchschnitt und ATR kommen aus dem Indikator-Cache, Sets mit gleichem Durchschnitt teilen sich eine Spalte.
+    """
+    return run_envelope_backtest_sets(FrameIndicatorSource(data, cache), params_list, trade_log, **kwargs)
@@ -0,0 +1,457 @@
+# code/analysis/backtest_engine.py
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # Ohne numba laufen die Kernel als normaler Python-Code.
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+FEE_PCT = 0.05 / 100
+
+# Spalten der Trade-Log-Matrix, die der Kernel zurückgibt
+LOG_INDEX = 0
+LOG_SIDE = 1
+LOG_ENTRY = 2
+LOG_EXIT = 3
+LOG_PNL = 4
+LOG_BALANCE = 5
+LOG_REASON = 6
+LOG_LEVERAGE = 7
+LOG_STOP_LOSS = 8
+LOG_TAKE_PROFIT = 9
+LOG_SET = 10
+LOG_COLUMNS = 11
+
+SIDE_LONG = 1
+SIDE_SHORT = -1
+REASON_STOP_LOSS = 0
+REASON_TAKE_PROFIT = 1
+
+# Zustand eines Simulationslaufs pro Set, damit der Kernel abschnittsweise (bis zu einem
+# Checkpoint) laufen und danach fortgesetzt werden kann
+STATE_CAPITAL = 0
+STATE_PEAK = 1
+STATE_MAX_DRAWDOWN = 2
+STATE_WORST_PNL = 3
+STATE_FLOAT_COLUMNS = 4
+
+STATE_TRADES = 0
+STATE_WINS = 1
+STATE_N_POS = 2
+STATE_SIDE = 3
+STATE_STARTED = 4
+STATE_WAITING = 5
+STATE_LAST_SIDE = 6
+STATE_STOP = 7
+STATE_INT_COLUMNS = 8
+
+POS_ENTRY = 0
+POS_AMOUNT = 1
+POS_LEVERAGE = 2
+
+# Gründe, aus denen ein Set vorzeitig beendet wurde
+STOP_NONE = 0
+STOP_CAPITAL = 1
+STOP_TRADE_LOSS = 2
+STOP_DRAWDOWN = 3
+STOP_PRUNED = 4
+STOP_NAMES = {STOP_NONE: None, STOP_CAPITAL: 'capital', STOP_TRADE_LOSS: 'trade_loss',
+              STOP_DRAWDOWN: 'drawdown', STOP_PRUNED: 'pruned'}
+
+# Kompaktes Trade-Log: ein strukturiertes Array statt einer Liste von Dicts
+TRADE_LOG_DTYPE = np.dtype([
+    ('timestamp', 'datetime64[ms]'), ('side', 'i1'), ('entry', 'f8'), ('exit', 'f8'), ('pnl', 'f8'),
+    ('balance', 'f8'), ('reason', 'i1'), ('leverage', 'f8'), ('stop_loss_price', 'f8'), ('take_profit_price', 'f8'),
+])
+
+
+def prepare_arrays(data, n_envelopes):
+    """
+    Zieht OHLC, Durchschnitt und alle Bänder einmalig als zusammenhängende
+    float64-Arrays aus dem DataFrame. Die Bänder liegen als (Kerzen x Envelopes) vor.
+    """
+    def column(name):
+        return np.ascontiguousarray(data[name].to_numpy(dtype=np.float64))
+
+    n = len(data)
+    band_low = np.empty((n, n_envelopes), dtype=np.float64)
+    band_high = np.empty((n, n_envelopes), dtype=np.float64)
+    for j in range(n_envelopes):
+        band_low[:, j] = data[f'band_low_{j + 1}'].to_numpy(dtype=np.float64)
+        band_high[:, j] = data[f'band_high_{j + 1}'].to_numpy(dtype=np.float64)
+
+    return {
+        'high': column('high'),
+        'low': column('low'),
+        'average': column('average'),
+        'band_low': band_low,
+        'band_high': band_high,
+    }
+
+
+def prepare_sets(params_list, band_columns, n_envelopes_max=None, stop_conditions=None):
+    """
+    Legt die Parameter-Arrays für die Set-Achse des Kernels an. `band_columns[s]`
+    gibt pro Set die Spalten der Band-Quelle an, aus denen die Bänder gelesen werden.
+    `stop_conditions` (optional) beendet ein Set vorzeitig: `max_trade_loss_pct` (Verlust eines
+    Trades in % des Startkapitals) und `max_drawdown_pct` (in %). Kapital 0 beendet immer.
+    """
+    stop_conditions = stop_conditions or {}
+    m = len(params_list)
+    if n_envelopes_max is None:
+        n_envelopes_max = max([len(p.get('envelopes_pct', [])) for p in params_list] + [1])
+    sets = {
+        'band_col': np.zeros((m, n_envelopes_max), dtype=np.int64),
+        'band_low_factor': np.ones((m, n_envelopes_max), dtype=np.float64),
+        'band_high_factor': np.ones((m, n_envelopes_max), dtype=np.float64),
+        'n_envelopes': np.zeros(m, dtype=np.int64),
+        'start_capital': np.empty(m, dtype=np.float64),
+        'balance_fraction': np.empty(m, dtype=np.float64),
+        'stop_loss_pct': np.empty(m, dtype=np.float64),
+        'leverage': np.empty(m, dtype=np.float64),
+        'use_cooldown': np.empty(m, dtype=np.bool_),
+        'max_trade_loss': np.full(m, np.inf, dtype=np.float64),
+        'max_drawdown': np.full(m, np.inf, dtype=np.float64),
+    }
+    for s, params in enumerate(params_list):
+        n_envelopes = len(params.get('envelopes_pct', []))
+        sets['n_envelopes'][s] = n_envelopes
+        sets['band_col'][s, :n_envelopes] = band_columns[s]
+        sets['start_capital'][s] = params.get('start_capital', 1000)
+        sets['balance_fraction'][s] = params.get('balance_fraction_pct', 100) / 100
+        sets['stop_loss_pct'][s] = params.get('stop_loss_pct', 0.4) / 100
+        sets['leverage'][s] = params.get('base_leverage', 10) # Vereinfacht für Backtest
+        sets['use_cooldown'][s] = params.get('behavior', {}).get('use_cooldown_after_sl', True)
+        if stop_conditions.get('max_trade_loss_pct') is not None:
+            sets['max_trade_loss'][s] = sets['start_capital'][s] * stop_conditions['max_trade_loss_pct'] / 100
+        if stop_conditions.get('max_drawdown_pct') is not None:
+            sets['max_drawdown'][s] = stop_conditions['max_drawdown_pct'] / 100
+    return sets
+
+
+def new_state(start_capital, n_envelopes_max):
+    """Startzustand für `simulate_envelope_sets`: (Float-Zustand, Int-Zustand, offene Positionen)."""
+    m = len(start_capital)
+    state_f = np.zeros((m, STATE_FLOAT_COLUMNS), dtype=np.float64)
+    state_f[:, STATE_CAPITAL] = start_capital
+    state_f[:, STATE_PEAK] = start_capital
+    state_i = np.zeros((m, STATE_INT_COLUMNS), dtype=np.int64)
+    positions = np.empty((3, m, max(n_envelopes_max, 1)), dtype=np.float64)
+    return state_f, state_i, positions
+
+
+@njit(cache=True)
+def _pairwise_block(values, start, n):
+    # Blattfall der paarweisen Summation von numpy (n <= 128).
+    if n < 8:
+        res = 0.0
+        for i in range(n):
+            res += values[start + i]
+        return res
+    r0 = values[start]
+    r1 = values[start + 1]
+    r2 = values[start + 2]
+    r3 = values[start + 3]
+    r4 = values[start + 4]
+    r5 = values[start + 5]
+    r6 = values[start + 6]
+    r7 = values[start + 7]
+    i = 8
+    while i < n - (n % 8):
+        r0 += values[start + i]
+        r1 += values[start + i + 1]
+        r2 += values[start + i + 2]
+        r3 += values[start + i + 3]
+        r4 += values[start + i + 4]
+        r5 += values[start + i + 5]
+        r6 += values[start + i + 6]
+        r7 += values[start + i + 7]
+        i += 8
+    res = ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+    while i < n:
+        res += values[start + i]
+        i += 1
+    return res
+
+
+@njit(cache=True)
+def _pairwise_sum(values, start, n):
+    """
+    Exakte Nachbildung der paarweisen Summation von numpy (np.sum / np.mean), damit der
+    Kernel bitgleiche Durchschnittspreise liefert. Die Rekursion von numpy wird über einen
+    expliziten Stapel abgebildet, da rekursive Funktionen nicht sicher im numba-Cache landen.
+    """
+    if n <= 128:
+        return _pairwise_block(values, start, n)
+    # Aufgaben: Teilsumme berechnen (n >= 0) oder die obersten zwei Ergebnisse addieren (n == -1)
+    task_start = np.empty(256, dtype=np.int64)
+    task_n = np.empty(256, dtype=np.int64)
+    partial = np.empty(128, dtype=np.float64)
+    n_tasks = 1
+    n_partial = 0
+    task_start[0] = start
+    task_n[0] = n
+    while n_tasks > 0:
+        n_tasks -= 1
+        t_start = task_start[n_tasks]
+        t_n = task_n[n_tasks]
+        if t_n == -1:
+            n_partial -= 1
+            partial[n_partial - 1] = partial[n_partial - 1] + partial[n_partial]
+        elif t_n <= 128:
+            partial[n_partial] = _pairwise_block(values, t_start, t_n)
+            n_partial += 1
+        else:
+            n2 = t_n // 2
+            n2 -= n2 % 8
+            task_n[n_tasks] = -1
+            task_start[n_tasks + 1] = t_start + n2
+            task_n[n_tasks + 1] = t_n - n2
+            task_start[n_tasks + 2] = t_start
+            task_n[n_tasks + 2] = n2
+            n_tasks += 3
+    return partial[0]
+
+
+@njit(cache=True)
+def simulate_envelope_sets(high, low, average, valid, set_group, band_low_src, band_high_src,
+                           band_col, band_low_factor, band_high_factor, n_envelopes, balance_fraction,
+                           stop_loss_pct, leverage, use_cooldown, max_trade_loss, max_drawdown, fee_pct,
+                           state_f, state_i, positions, i_start, i_end, record_log):
+    """
+    Zustandsmaschine des Envelope-Backtests über reine Arrays. Alle Parameter-Sets
+    (zweite Achse) laufen gemeinsam Kerze für Kerze über dieselben Preis-Arrays.
+
+    Set `s` nutzt die Durchschnitts-Spalte `set_group[s]` und überspringt Kerzen, für die
+    `valid[i, set_group[s]]` falsch ist (entspricht `dropna()`). Das Band `j` ergibt sich
+    aus `band_*_src[i, band_col[s, j]] * band_*_factor[s, j]`.
+    Verarbeitet die Kerzen [i_start, i_end) und schreibt den Zustand (siehe `new_state`) in place fort,
+    so dass ein weiterer Aufruf ab i_end nahtlos fortsetzt. Ein Set endet, sobald eine Stop-Bedingung
+    greift (`state_i[s, STATE_STOP]`). Gibt die Trade-Log-Matrix (nur bei `record_log`) und die
+    erste nicht verarbeitete Kerze zurück.
+    """
+    m = set_group.shape[0]
+
+    pos_entry = positions[POS_ENTRY]
+    pos_amount = positions[POS_AMOUNT]
+    pos_leverage = positions[POS_LEVERAGE]
+
+    n_finished = 0
+    for s in range(m):
+        if state_i[s, STATE_STOP] != STOP_NONE:
+            n_finished += 1
+
+    log_capacity = m * ((i_end - i_start) // 2 + 1) if record_log else 0
+    log = np.empty((log_capacity, LOG_COLUMNS), dtype=np.float64)
+    n_log = 0
+
+    i = i_start
+    while i < i_end and n_finished < m:
+        for s in range(m):
+            if state_i[s, STATE_STOP] != STOP_NONE:
+                continue
+            g = set_group[s]
+            if not valid[i, g]:
+                continue
+            # Die erste gültige Kerze dient (wie im ursprünglichen Loop ab Index 1) nur als Start.
+            if state_i[s, STATE_STARTED] == 0:
+                state_i[s, STATE_STARTED] = 1
+                continue
+
+            if state_i[s, STATE_WAITING] != 0:
+                resume_price = average[i, g]
+                last_side_closed = state_i[s, STATE_LAST_SIDE]
+                if (last_side_closed == SIDE_LONG and high[i] >= resume_price) or \
+                   (last_side_closed == SIDE_SHORT and low[i] <= resume_price):
+                    state_i[s, STATE_WAITING] = 0
+                else:
+                    continue
+
+            side = state_i[s, STATE_SIDE]
+            if state_i[s, STATE_N_POS] > 0:
+                count = state_i[s, STATE_N_POS]
+                avg_entry_price = _pairwise_sum(pos_entry[s], 0, count) / count
+                total_amount = 0.0
+                for p in range(count):
+                    total_amount += pos_amount[s, p]
+                avg_leverage = _pairwise_sum(pos_leverage[s], 0, count) / count
+
+                if side == SIDE_LONG:
+                    sl_price = avg_entry_price * (1 - stop_loss_pct[s])
+                else:
+                    sl_price = avg_entry_price * (1 + stop_loss_pct[s])
+                tp_price = average[i, g]
+                has_exit = False
+                exit_price = 0.0
+                reason = REASON_STOP_LOSS
+
+                if (side == SIDE_LONG and low[i] <= sl_price) or (side == SIDE_SHORT and high[i] >= sl_price):
+                    has_exit = True
+                    exit_price = sl_price
+                    reason = REASON_STOP_LOSS
+
+                # Ein Exit-Preis von 0 zählt (wie im ursprünglichen Loop) als "kein Exit".
+                if (not has_exit or exit_price == 0.0) and \
+                   ((side == SIDE_LONG and high[i] >= tp_price) or (side == SIDE_SHORT and low[i] <= tp_price)):
+                    has_exit = True
+                    exit_price = tp_price
+                    reason = REASON_TAKE_PROFIT
+
+                if has_exit:
+                    if side == SIDE_LONG:
+                        pnl = (exit_price - avg_entry_price) * total_amount
+                    else:
+                        pnl = (avg_entry_price - exit_price) * total_amount
+                    entry_value = avg_entry_price * total_amount
+                    exit_value = exit_price * total_amount
+                    total_fees = (entry_value * fee_pct) + (exit_value * fee_pct)
+                    pnl -= total_fees
+
+                    current_capital = state_f[s, STATE_CAPITAL] + pnl
+                    state_i[s, STATE_TRADES] += 1
+                    if reason == REASON_TAKE_PROFIT:
+                        state_i[s, STATE_WINS] += 1
+                    if pnl < state_f[s, STATE_WORST_PNL]:
+                        state_f[s, STATE_WORST_PNL] = pnl
+
+                    if n_log < log_capacity:
+                        log[n_log, LOG_INDEX] = i
+                        log[n_log, LOG_SIDE] = side
+                        log[n_log, LOG_ENTRY] = avg_entry_price
+                        log[n_log, LOG_EXIT] = exit_price
+                        log[n_log, LOG_PNL] = pnl
+                        log[n_log, LOG_BALANCE] = current_capital
+                        log[n_log, LOG_REASON] = reason
+                        log[n_log, LOG_LEVERAGE] = avg_leverage
+                        log[n_log, LOG_STOP_LOSS] = sl_price
+                        log[n_log, LOG_TAKE_PROFIT] = tp_price
+                        log[n_log, LOG_SET] = s
+                        n_log += 1
+                    state_i[s, STATE_N_POS] = 0
+
+                    if reason == REASON_STOP_LOSS and use_cooldown[s]:
+                        state_i[s, STATE_WAITING] = 1
+                        state_i[s, STATE_LAST_SIDE] = side
+
+                    if current_capital <= 0:
+                        current_capital = 0.0
+                    state_f[s, STATE_CAPITAL] = current_capital
+                    if current_capital > state_f[s, STATE_PEAK]:
+                        state_f[s, STATE_PEAK] = current_capital
+                    peak_capital = state_f[s, STATE_PEAK]
+                    if peak_capital > 0:
+                        drawdown = (peak_capital - current_capital) / peak_capital
+                    else:
+                        drawdown = 0.0
+                    if drawdown > state_f[s, STATE_MAX_DRAWDOWN]:
+                        state_f[s, STATE_MAX_DRAWDOWN] = drawdown
+
+                    if current_capital == 0:
+                        state_i[s, STATE_STOP] = STOP_CAPITAL
+                    elif -pnl > max_trade_loss[s]:
+                        state_i[s, STATE_STOP] = STOP_TRADE_LOSS
+                    elif drawdown > max_drawdown[s]:
+                        state_i[s, STATE_STOP] = STOP_DRAWDOWN
+                    if state_i[s, STATE_STOP] != STOP_NONE:
+                        n_finished += 1
+                continue
+
+            envelopes = n_envelopes[s]
+            n_pos = 0
+            current_capital = state_f[s, STATE_CAPITAL]
+            for j in range(envelopes):
+                entry = band_low_src[i, band_col[s, j]] * band_low_factor[s, j]
+                if low[i] <= entry:
+                    pos_entry[s, n_pos] = entry
+                    pos_amount[s, n_pos] = (current_capital * balance_fraction[s] / envelopes) * leverage[s] / entry
+                    pos_leverage[s, n_pos] = leverage[s]
+                    n_pos += 1
+            if n_pos > 0:
+                state_i[s, STATE_SIDE] = SIDE_LONG
+            else:
+                for j in range(envelopes):
+                    entry = band_high_src[i, band_col[s, j]] * band_high_factor[s, j]
+                    if high[i] >= entry:
+                        pos_entry[s, n_pos] = entry
+                        pos_amount[s, n_pos] = (current_capital * balance_fraction[s] / envelopes) * leverage[s] / entry
+                        pos_leverage[s, n_pos] = leverage[s]
+                        n_pos += 1
+                if n_pos > 0:
+                    state_i[s, STATE_SIDE] = SIDE_SHORT
+            state_i[s, STATE_N_POS] = n_pos
+        i += 1
+
+    return log[:n_log], i
+
+
+def run_simulation(high, low, average, valid, set_group, band_low_src, band_high_src, sets, fee_pct,
+                   record_log=False, checkpoints=(), on_checkpoint=None):
+    """
+    Führt `simulate_envelope_sets` über alle Kerzen aus, bei Bedarf in Abschnitten bis zu den
+    Kerzen-Indizes in `checkpoints`. Dort wird `on_checkpoint(step, capital, max_drawdown)` mit dem
+    Zwischenstand aller Sets aufgerufen; gibt der Callback eine Maske zurück, werden die markierten
+    Sets als 'pruned' beendet. Läuft nur so weit, wie noch ein Set aktiv ist.
+    """
+    n = high.shape[0]
+    state_f, state_i, positions = new_state(sets['start_capital'], sets['band_col'].shape[1])
+    bounds = sorted({int(c) for c in checkpoints if 0 < c < n}) + [n]
+    logs = []
+    i = 0
+    for step, bound in enumerate(bounds):
+        log, i = simulate_envelope_sets(
+            high, low, average, valid, set_group, band_low_src, band_high_src,
+            sets['band_col'], sets['band_low_factor'], sets['band_high_factor'], sets['n_envelopes'],
+            sets['balance_fraction'], sets['stop_loss_pct'], sets['leverage'], sets['use_cooldown'],
+            sets['max_trade_loss'], sets['max_drawdown'], fee_pct, state_f, state_i, positions, i, bound, record_log
+        )
+        logs.append(log)
+        if i < bound:
+            break
+        if bound < n and on_checkpoint is not None:
+            prune = on_checkpoint(step, state_f[:, STATE_CAPITAL].copy(), state_f[:, STATE_MAX_DRAWDOWN].copy())
+            if prune is not None:
+                active = state_i[:, STATE_STOP] == STOP_NONE
+                state_i[active & np.asarray(prune, dtype=np.bool_), STATE_STOP] = STOP_PRUNED
+                if not (state_i[:, STATE_STOP] == STOP_NONE).any():
+                    break
+
+    return {
+        'capital': state_f[:, STATE_CAPITAL], 'trades': state_i[:, STATE_TRADES], 'wins': state_i[:, STATE_WINS],
+        'max_drawdown': state_f[:, STATE_MAX_DRAWDOWN], 'worst_trade_pnl': state_f[:, STATE_WORST_PNL],
+        'stop_reason': state_i[:, STATE_STOP], 'bars': i,
+        'log': np.concatenate(logs) if len(logs) > 1 else logs[0],
+    }
+
+
+def trade_log_array(timestamps_ms, log):
+    """Wandelt die Trade-Log-Matrix des Kernels (Zeilen eines Sets) in ein strukturiertes Array um."""
+    trade_log = np.empty(len(log), dtype=TRADE_LOG_DTYPE)
+    trade_log['timestamp'] = np.asarray(timestamps_ms, dtype=np.int64)[log[:, LOG_INDEX].astype(np.int64)]
+    trade_log['side'] = log[:, LOG_SIDE]
+    trade_log['entry'] = log[:, LOG_ENTRY]
+    trade_log['exit'] = log[:, LOG_EXIT]
+    trade_log['pnl'] = log[:, LOG_PNL]
+    trade_log['balance'] = log[:, LOG_BALANCE]
+    trade_log['reason'] = log[:, LOG_REASON]
+    trade_log['leverage'] = log[:, LOG_LEVERAGE]
+    trade_log['stop_loss_price'] = log[:, LOG_STOP_LOSS]
+    trade_log['take_profit_price'] = log[:, LOG_TAKE_PROFIT]
+    return trade_log
+
+
+def trade_log_frame(trade_log):
+    """Erzeugt erst bei Bedarf einen DataFrame (UTC-Zeitstempel, 'long'/'short', 'Take-Profit'/'Stop-Loss')."""
+    import pandas as pd
+    frame = pd.DataFrame({name: trade_log[name] for name in TRADE_LOG_DTYPE.names})
+    frame['timestamp'] = pd.to_datetime(trade_log['timestamp'].astype(np.int64), unit='ms', utc=True)
+    frame['side'] = np.where(trade_log['side'] == SIDE_LONG, 'long', 'short')
+    frame['reason'] = np.where(trade_log['reason'] == REASON_TAKE_PROFIT, 'Take-Profit', 'Stop-Loss')
+    return frame
@@ -0,0 +1,218 @@
+# code/analysis/candle_store.py
+
+import os
+import json
+import glob
+import argparse
+import numpy as np
+import pandas as pd
+
+# Spaltenweiser Kerzen-Cache: pro Symbol/Timeframe ein Verzeichnis mit einer .npy-Datei je Spalte
+# (Zeitstempel als int64 Epoch-Millisekunden) und einer kleinen meta.json mit Zeitraum und Anzahl.
+STORE_VERSION = 1
+TIMESTAMP_FILE = 'timestamp.npy'
+META_FILE = 'meta.json'
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'historical_data')
+
+
+def store_path(cache_dir, symbol, timeframe):
+    symbol_filename = symbol.replace('/', '-').replace(':', '-')
+    return os.path.join(cache_dir, f"{symbol_filename}_{timeframe}")
+
+
+def read_meta(path):
+    """Liest nur den Header (Zeitraum, Anzahl Kerzen) ohne die Daten anzufassen."""
+    try:
+        with open(os.path.join(path, META_FILE), 'r') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return meta if meta.get('version') == STORE_VERSION else None
+
+
+def to_ms(value):
+    """Datum/Zeitpunkt (ohne Zeitzone als UTC interpretiert) in Epoch-Millisekunden."""
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    return int(ts.value // 1_000_000)
+
+
+def timeframe_to_ms(timeframe):
+    """Wandelt ccxt-Timeframes wie '15m', '4h' oder '1d' in Millisekunden um."""
+    units = {'m': 60, 'h': 60 * 60, 'd': 24 * 60 * 60, 'w': 7 * 24 * 60 * 60}
+    return int(timeframe[:-1]) * units[timeframe[-1]] * 1000
+
+
+def find_gaps(timestamps, timeframe_ms, start_ms, end_ms, known_gaps=()):
+    """
+    Sucht Lücken (fehlende Kerzen) innerhalb von [start_ms, end_ms] in den sortierten Zeitstempeln.
+    Bereits geprüfte Lücken, für die die Börse keine Daten hat, werden übersprungen.
+    Gibt eine Liste von (von_ms, bis_ms) der fehlenden Kerzen zurück.
+    """
+    lo = int(np.searchsorted(timestamps, start_ms, side='left'))
+    hi = int(np.searchsorted(timestamps, end_ms, side='right'))
+    window = np.asarray(timestamps[max(lo - 1, 0):hi])
+    if len(window) < 2:
+        return []
+    holes = np.nonzero(np.diff(window) > timeframe_ms)[0]
+    known = {tuple(gap) for gap in known_gaps}
+    gaps = []
+    for i in holes:
+        gap = (int(window[i]) + timeframe_ms, int(window[i + 1]) - timeframe_ms)
+        if gap not in known:
+            gaps.append(gap)
+    return gaps
+
+
+def missing_segments(path, timeframe, start_ms, end_ms, download_start_ms, download_end_ms):
+    """
+    Bestimmt, welche Abschnitte nachgeladen werden müssen, damit [start_ms, end_ms] abgedeckt ist:
+    fehlender Anfang (ab download_start_ms), fehlendes Ende (bis download_end_ms) und interne Lücken.
+    """
+    meta = read_meta(path)
+    if meta is None or meta['count'] == 0:
+        return [(download_start_ms, download_end_ms)]
+    timeframe_ms = timeframe_to_ms(timeframe)
+    segments = []
+    # history_start_ms: die Börse hat nachweislich keine älteren Kerzen (z.B. Listing-Datum)
+    if meta['start_ms'] > start_ms and meta.get('history_start_ms') != meta['start_ms']:
+        segments.append((download_start_ms, meta['start_ms'] - timeframe_ms))
+    timestamps = np.load(os.path.join(path, TIMESTAMP_FILE), mmap_mode='r')
+    segments.extend(find_gaps(timestamps, timeframe_ms, download_start_ms, download_end_ms, meta.get('known_gaps', [])))
+    if meta['end_ms'] < end_ms:
+        segments.append((meta['end_ms'] + timeframe_ms, download_end_ms))
+    return segments
+
+
+def merge_candles(path, data, symbol=None, timeframe=None, checked_gaps=()):
+    """
+    Führt neu geladene Kerzen mit dem bestehenden Cache zusammen. Bei doppelten Zeitstempeln gewinnen
+    die neuen Daten (die letzte Kerze eines früheren Downloads kann unvollständig gewesen sein).
+    Abschnitte aus `checked_gaps`, für die auch der Download nichts geliefert hat, werden im Header
+    vermerkt (interne Lücken bzw. Beginn der verfügbaren Historie), damit sie nicht erneut geladen werden.
+    """
+    meta = read_meta(path)
+    if meta is not None and meta['count'] > 0:
+        existing = arrays_to_frame(read_arrays(path, mmap=False))
+        data = pd.concat([existing, data]) if data is not None and not data.empty else existing
+        data = data[~data.index.duplicated(keep='last')]
+    if data is None or data.empty:
+        return meta
+    known_gaps = [tuple(gap) for gap in (meta or {}).get('known_gaps', [])]
+    history_start_ms = (meta or {}).get('history_start_ms')
+    timestamps = np.sort(data.index.tz_convert('UTC').as_unit('ms').asi8)
+    for gap_start, gap_end in checked_gaps:
+        # Ab gap_start angefragt, aber erst später Daten erhalten: älter geht es an der Börse nicht
+        if gap_start < timestamps[0]:
+            history_start_ms = int(timestamps[0])
+        # Lücken, die nach dem Download im geprüften Abschnitt verbleiben, fehlen auch an der Börse
+        if timeframe is not None:
+            for gap in find_gaps(timestamps, timeframe_to_ms(timeframe), gap_start, gap_end):
+                if gap not in known_gaps:
+                    known_gaps.append(gap)
+    return write_candles(path, data, symbol, timeframe, known_gaps=known_gaps, history_start_ms=history_start_ms)
+
+
+def write_candles(path, data, symbol=None, timeframe=None, known_gaps=(), history_start_ms=None):
+    """
+    Schreibt einen OHLCV-DataFrame (DatetimeIndex in UTC) in den Spalten-Cache.
+    Die Dateien werden erst unter temporärem Namen geschrieben und dann ersetzt; meta.json kommt zuletzt.
+    """
+    os.makedirs(path, exist_ok=True)
+    data = data[~data.index.duplicated(keep='first')].sort_index()
+    timestamps = data.index.tz_convert('UTC').as_unit('ms').asi8.astype(np.int64)
+
+    def save(filename, values):
+        tmp = os.path.join(path, f".{filename}.tmp")
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(values))
+        os.replace(tmp, os.path.join(path, filename))
+
+    save(TIMESTAMP_FILE, timestamps)
+    columns = [c for c in OHLCV_COLUMNS if c in data.columns]
+    for column in columns:
+        save(f"{column}.npy", data[column].to_numpy(dtype=np.float64))
+
+    meta = {
+        'version': STORE_VERSION, 'symbol': symbol, 'timeframe': timeframe,
+        'columns': columns, 'count': int(len(timestamps)),
+        'start_ms': int(timestamps[0]) if len(timestamps) else None,
+        'end_ms': int(timestamps[-1]) if len(timestamps) else None,
+        'known_gaps': [list(gap) for gap in known_gaps],
+        'history_start_ms': history_start_ms,
+    }
+    tmp = os.path.join(path, f".{META_FILE}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=4)
+    os.replace(tmp, os.path.join(path, META_FILE))
+    return meta
+
+
+def read_arrays(path, start_ms=None, end_ms=None, mmap=True):
+    """
+    Liefert die Spalten als (memory-mapped) NumPy-Views, optional auf [start_ms, end_ms] begrenzt.
+    Die Grenzen werden per Binärsuche auf den sortierten Zeitstempeln bestimmt.
+    """
+    meta = read_meta(path)
+    if meta is None:
+        return None
+    mode = 'r' if mmap else None
+    timestamps = np.load(os.path.join(path, TIMESTAMP_FILE), mmap_mode=mode)
+    lo = 0 if start_ms is None else int(np.searchsorted(timestamps, start_ms, side='left'))
+    hi = len(timestamps) if end_ms is None else int(np.searchsorted(timestamps, end_ms, side='right'))
+    arrays = {'timestamp': timestamps[lo:hi]}
+    for column in meta['columns']:
+        arrays[column] = np.load(os.path.join(path, f"{column}.npy"), mmap_mode=mode)[lo:hi]
+    return arrays
+
+
+def arrays_to_frame(arrays):
+    index = pd.DatetimeIndex(pd.to_datetime(np.asarray(arrays['timestamp']), unit='ms', utc=True), name='timestamp')
+    return pd.DataFrame({c: np.asarray(v) for c, v in arrays.items() if c != 'timestamp'}, index=index)
+
+
+def read_candles(path, start_date_str=None, end_date_str=None):
+    """
+    Lädt den Zeitraum als DataFrame. Nur der benötigte Ausschnitt wird aus den gemappten Dateien kopiert;
+    die endgültige Auswahl erfolgt wie bisher über `.loc[start:end]` (inkl. ganzem Endtag).
+    """
+    start_ms = to_ms(start_date_str) if start_date_str else None
+    # Ein Tag Puffer, damit `.loc` Datumsangaben ohne Uhrzeit weiterhin bis Tagesende einschließt
+    end_ms = to_ms(end_date_str) + 24 * 60 * 60 * 1000 if end_date_str else None
+    arrays = read_arrays(path, start_ms, end_ms)
+    if arrays is None:
+        return pd.DataFrame()
+    data = arrays_to_frame(arrays)
+    if start_date_str or end_date_str:
+        data = data.loc[start_date_str:end_date_str]
+    return data
+
+
+def migrate_csv(csv_file, path, symbol=None, timeframe=None):
+    """Einmalige Umwandlung einer alten CSV-Cache-Datei; die CSV wird danach entfernt."""
+    data = pd.read_csv(csv_file, index_col='timestamp', parse_dates=True)
+    data.index = pd.to_datetime(data.index, utc=True)
+    meta = write_candles(path, data, symbol, timeframe)
+    os.remove(csv_file)
+    return meta
+
+
+def migrate_csv_cache(cache_dir=DEFAULT_CACHE_DIR):
+    migrated = []
+    for csv_file in sorted(glob.glob(os.path.join(cache_dir, '*.csv'))):
+        name = os.path.splitext(os.path.basename(csv_file))[0]
+        timeframe = name.rpartition('_')[2]
+        meta = migrate_csv(csv_file, os.path.join(cache_dir, name), timeframe=timeframe)
+        migrated.append(name)
+        print(f"{name}: {meta['count']} Kerzen migriert.")
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Wandelt alte CSV-Caches in den spaltenweisen Kerzen-Cache um.")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Verzeichnis des Daten-Caches.')
+    args = parser.parse_args()
+    if not migrate_csv_cache(args.cache_dir):
+        print("Keine CSV-Dateien zum Migrieren gefunden.")
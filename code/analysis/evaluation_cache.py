@@ -0,0 +1,161 @@
+# code/analysis/evaluation_cache.py
+
+import os
+import json
+import sqlite3
+import threading
+
+DEFAULT_EVALUATION_DB = os.path.join(os.path.dirname(__file__), 'evaluation_cache.db')
+# Bei Änderungen an der Backtest-Engine erhöhen: alte Ergebnisse passen dann nicht mehr
+CACHE_VERSION = 1
+
+# Kennzahlen, die gespeichert werden (ohne Trade-Log)
+RESULT_FIELDS = ('total_pnl_pct', 'trades_count', 'win_rate', 'end_capital', 'max_drawdown_pct', 'worst_trade_pnl', 'stop_reason')
+# Abbruchgründe, die nicht von den Abbruchbedingungen abhängen (None = bis zum Ende gerechnet)
+UNCONDITIONAL_STOPS = (None, 'capital')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    dataset TEXT NOT NULL,
+    params TEXT NOT NULL,
+    stop TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (dataset, params, stop)
+) WITHOUT ROWID;
+"""
+
+SELECT_RESULT = "SELECT stop, result FROM evaluations WHERE dataset = ? AND params = ? AND stop IN ('', ?)"
+INSERT_RESULT = "INSERT OR IGNORE INTO evaluations (dataset, params, stop, result) VALUES (?, ?, ?, ?)"
+
+
+def canonical_json(value):
+    """Eindeutige Textform eines Schlüssels (sortierte Felder, ganzzahlige Floats als int)."""
+    def normalize(v):
+        if isinstance(v, dict):
+            return {str(k): normalize(x) for k, x in v.items()}
+        if isinstance(v, (list, tuple)):
+            return [normalize(x) for x in v]
+        if isinstance(v, bool) or v is None or isinstance(v, str):
+            return v
+        v = float(v)
+        return int(v) if v.is_integer() else v
+    return json.dumps(normalize(value), sort_keys=True, separators=(',', ':'))
+
+
+def _within_stop_conditions(key, result, stop_conditions):
+    # Ein Lauf ohne Abbruchbedingungen ist identisch mit dem Lauf mit Bedingungen, wenn keine davon je
+    # gegriffen hätte: schlechtester Trade und maximaler Drawdown liegen innerhalb der Grenzen
+    # (gleiche Rechnung wie `prepare_sets` und der Kernel)
+    if stop_conditions.get('max_trade_loss_pct') is not None:
+        if -result['worst_trade_pnl'] > key['start_capital'] * stop_conditions['max_trade_loss_pct'] / 100:
+            return False
+    if stop_conditions.get('max_drawdown_pct') is not None:
+        if result['max_drawdown_pct'] > stop_conditions['max_drawdown_pct'] / 100:
+            return False
+    return True
+
+
+class EvaluationCache:
+    """
+    Dauerhafter Speicher für Backtest-Kennzahlen, Schlüssel: (Fingerprint des Datensatzes, kanonische
+    Parameter laut `evaluation_key`, Abbruchbedingungen). Gilt für beide Optimierungsstufen und über Läufe
+    hinweg. Vollständig gerechnete Ergebnisse werden ohne Abbruchbedingung abgelegt und auch für Anfragen
+    mit Bedingungen verwendet, sofern keine davon gegriffen hätte; vorzeitig abgebrochene nur für genau
+    dieselben Bedingungen. Jeder Prozess (Pool-Worker) öffnet seine eigene Verbindung (WAL-Modus),
+    Threads eines Prozesses teilen sie sich hinter einer Sperre.
+    """
+
+    def __init__(self, path=DEFAULT_EVALUATION_DB):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Nur der Pfad wandert in andere Prozesse; die Verbindung wird dort neu geöffnet
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.executescript(SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def lookup(self, dataset, keys, stop_conditions=None):
+        """Gespeicherte Kennzahlen je Schlüssel (in Eingabereihenfolge), None wo es keinen Treffer gibt."""
+        stop_conditions = {k: v for k, v in (stop_conditions or {}).items() if v is not None}
+        stop = canonical_json(stop_conditions) if stop_conditions else ''
+        results = []
+        with self._lock:
+            conn = self._connection()
+            for key in keys:
+                found = None
+                for row_stop, result in conn.execute(SELECT_RESULT, (dataset, canonical_json([CACHE_VERSION, key]), stop)).fetchall():
+                    result = json.loads(result)
+                    if row_stop == stop or _within_stop_conditions(key, result, stop_conditions):
+                        found = result
+                        break
+                results.append(found)
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def store(self, dataset, entries, stop_conditions=None):
+        """Legt Ergebnisse (key, result) in einer Transaktion ab; abgebrochene ('pruned') werden nicht gespeichert."""
+        stop_conditions = {k: v for k, v in (stop_conditions or {}).items() if v is not None}
+        stop = canonical_json(stop_conditions) if stop_conditions else ''
+        rows = []
+        for key, result in entries:
+            if result.get('stop_reason') == 'pruned':
+                continue
+            values = {field: result[field] for field in RESULT_FIELDS}
+            values = {k: (v if v is None or isinstance(v, str) else float(v)) for k, v in values.items()}
+            values['trades_count'] = int(values['trades_count'])
+            rows.append((dataset, canonical_json([CACHE_VERSION, key]),
+                         '' if result.get('stop_reason') in UNCONDITIONAL_STOPS else stop, json.dumps(values)))
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(INSERT_RESULT, rows)
+
+    def take_stats(self):
+        """Treffer und Fehlschläge seit dem letzten Aufruf (für die Summen über Pool-Worker)."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            self.hits = self.misses = 0
+        return hits, misses
+
+
+_CACHES = {}
+
+
+def get_evaluation_cache(path):
+    """Eine Instanz pro Pfad und Prozess (für Pool-Worker, die nur den Pfad kennen)."""
+    cache = _CACHES.get(path)
+    if cache is None:
+        cache = _CACHES[path] = EvaluationCache(path)
+    return cache
+
+
+def format_hit_rate(hits, misses):
+    total = hits + misses
+    return f"{hits}/{total} Treffer ({hits / total * 100:.1f} %)" if total else "keine Anfragen"
@@ -1,99 +1,363 @@
 # code/analysis/global_optimizer_pymoo.py
 
 import json
+import glob
 import time
 import numpy as np
 import os
 import sys
 import argparse
+import threading
+from queue import Queue, Empty, Full
+from collections import OrderedDict
 from multiprocessing import Pool
 from tqdm import tqdm
 
-from pymoo.core.problem import StarmapParallelization, Problem
+from pymoo.core.problem import Problem
+from pymoo.core.population import Population
 from pymoo.algorithms.moo.nsga2 import NSGA2
-from pymoo.optimize import minimize
 from pymoo.termination import get_termination
-from pymoo.core.callback import Callback
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from analysis.backtest import load_data, run_envelope_backtest
-from utilities.strategy_logic import calculate_envelope_indicators
+from analysis.backtest import load_data, format_time, run_envelope_backtest_sets, FrameIndicatorSource
+from analysis.shared_dataset import SharedDataset
+from analysis.evaluation_cache import DEFAULT_EVALUATION_DB, get_evaluation_cache, format_hit_rate
 
 HISTORICAL_DATA = None
 START_CAPITAL = 1000.0
 MAX_LOSS_PER_TRADE_PCT = 2.0
 MINIMUM_TRADES = 10
 AVERAGE_TYPE_GLOBAL = 'DCM'
+# Bewertungs-Cache (gemeinsam mit Stufe 2); None schaltet ihn ab
+EVALUATION_CACHE_FILE = DEFAULT_EVALUATION_DB
+POP_SIZE = 100
+SEED = 1
 
-class TqdmCallback(Callback):
-    def __init__(self, pbar):
-        super().__init__()
-        self.pbar = pbar
+# Zwischenstände laufender Optimierungen (eine Datei pro Symbol/Zeitfenster/Durchschnittstyp) und das
+# Protokoll des Laufs (Eingaben und fertige Kombinationen samt Kandidaten)
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), 'checkpoints')
+RUN_FILE = os.path.join(CHECKPOINT_DIR, 'run.json')
+CHECKPOINT_EVERY = 1
 
-    def notify(self, algorithm):
-        self.pbar.update(1)
+# Scheduler: so viele Kombinationen laufen gleichzeitig im selben Pool. Während eine ihre Generation im
+# Hauptprozess auswertet (Selektion) oder auf den letzten Block wartet, halten die anderen die Worker beschäftigt.
+MAX_ACTIVE_CELLS = 2
+# So viele Datensätze (Kerzen + Indikatoren im Shared Memory) werden im Hintergrund vorausgeladen
+PREFETCH_CELLS = 2
+CANDIDATES_FILE = os.path.join(os.path.dirname(__file__), 'optimization_candidates.json')
+# Job-Datei statt Eingaben (siehe `load_job_spec`); fehlende optionale Felder erhalten diese Werte
+JOB_SPEC_DEFAULTS = {'avg_types': ['DCM'], 'start_capital': 1000.0, 'max_loss_per_trade_pct': 2.0, 'minimum_trades': 20}
+JOB_SPEC_REQUIRED = ('symbols', 'timeframes', 'start_date', 'end_date')
 
-def format_time(seconds):
-    if seconds < 60: return f"{seconds:.1f} Sekunden"
-    minutes = int(seconds // 60)
-    remaining_seconds = int(seconds % 60)
-    if minutes < 60: return f"{minutes} Minuten und {remaining_seconds} Sekunden"
-    hours = int(minutes // 60)
-    remaining_minutes = int(minutes % 60)
-    return f"{hours} Stunden, {remaining_minutes} Minuten und {remaining_seconds} Sekunden"
+def _write_json(path, data, indent=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def cell_key(symbol, timeframe, avg_type):
+    return f"{symbol}|{timeframe}|{avg_type}"
+
+def checkpoint_file(symbol, timeframe, avg_type, checkpoint_dir=CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, f"nsga2_{symbol.split(':')[0].replace('/', '-')}_{timeframe}_{avg_type}.json")
+
+def save_checkpoint(path, algorithm):
+    """
+    Speichert den Zustand nach einer abgeschlossenen Generation: Population (X, F, Rang, Crowding-Distanz),
+    Generation, Zahl der Bewertungen und Zustand des Zufallsgenerators. Mehr braucht NSGA-II zum Weiterrechnen nicht.
+    """
+    pop = algorithm.pop
+    _write_json(path, {
+        'n_gen': algorithm.n_iter - 1, 'n_eval': algorithm.evaluator.n_eval,
+        'rng': algorithm.random_state.bit_generator.state,
+        'X': pop.get('X').tolist(), 'F': pop.get('F').tolist(),
+        'rank': pop.get('rank').tolist(), 'crowding': pop.get('crowding').tolist(),
+    })
+
+def restore_algorithm(problem, checkpoint, n_gen, pop_size=POP_SIZE, seed=SEED):
+    """
+    Baut NSGA-II aus einem Zwischenstand wieder auf: die gespeicherte Population dient als bereits bewertete
+    Start-Population, danach werden Rang, Crowding-Distanz, Zähler und Zufallsgenerator übernommen. Der Lauf
+    geht damit genau so weiter, als wäre er nie unterbrochen worden.
+    """
+    pop = Population.new(X=np.array(checkpoint['X']), F=np.array(checkpoint['F']))
+    for individual in pop:
+        individual.evaluated = {'F', 'G', 'H'}
+    algorithm = NSGA2(pop_size=pop_size, sampling=pop)
+    algorithm.setup(problem, termination=get_termination("n_gen", n_gen), seed=seed, verbose=False)
+    # Initialisierung ohne Bewertung (alle Individuen haben schon F)
+    algorithm.next()
+    algorithm.pop.set('rank', np.array(checkpoint['rank']))
+    algorithm.pop.set('crowding', np.array(checkpoint['crowding']))
+    algorithm.evaluator.n_eval = checkpoint['n_eval']
+    algorithm.random_state.bit_generator.state = checkpoint['rng']
+    algorithm.n_iter = checkpoint['n_gen']
+    algorithm.termination.update(algorithm)
+    algorithm.n_iter += 1
+    return algorithm
+
+def current_settings():
+    """Bewertungs-Einstellungen als picklebares Dict, damit auch 'spawn'-Worker sie kennen."""
+    return {
+        'start_capital': START_CAPITAL, 'max_loss_per_trade_pct': MAX_LOSS_PER_TRADE_PCT,
+        'minimum_trades': MINIMUM_TRADES, 'average_type': AVERAGE_TYPE_GLOBAL,
+        'evaluation_cache': EVALUATION_CACHE_FILE,
+    }
+
+def average_period_keys(average_type, problem):
+    """Alle Indikator-Schlüssel, die der Suchraum für `average_period` erreichen kann."""
+    return [(average_type, period, 14, None) for period in range(int(problem.xl[0]), int(problem.xu[0]) + 1)]
+
+def evaluate_individuals(x, source, settings):
+    """Bewertet die Parametervektoren `x` gemeinsam gegen eine Indikator-Quelle und gibt F (n x 2) zurück."""
+    start_capital = settings['start_capital']
+    results = np.empty((len(x), 2))
+    params_list, batch_rows = [], []
+    for row, individual in enumerate(x):
+        avg_period = int(round(individual[0]))
+        sl_pct = round(individual[1], 2)
+        base_lev = int(round(individual[2]))
+        target_atr = round(individual[3], 2)
+        env_start = round(individual[4], 2)
+        env_step = round(individual[5], 2)
+        env_count = int(round(individual[6]))
+        balance_fraction = round(individual[7], 2) # --- NEU --- Holt den neuen Wert.
+        
+        envelopes = [round(env_start + i * env_step, 2) for i in range(env_count)]
+        if any(e >= 100.0 for e in envelopes):
+            results[row] = [-1003, 1003]
+            continue
+
+        params_list.append({
+            'average_period': avg_period, 'stop_loss_pct': sl_pct,
+            'base_leverage': base_lev, 'max_leverage': 50.0,
+            'target_atr_pct': target_atr,
+            'envelopes_pct': envelopes,
+            'start_capital': start_capital,
+            'average_type': settings['average_type'],
+            'balance_fraction_pct': balance_fraction # --- NEU --- Fügt den Wert zu den Parametern hinzu.
+        })
+        batch_rows.append(row)
+
+    # Sets, deren Einzelverlust die Grenze reißt, werden ohnehin bestraft und brechen daher sofort ab
+    stop_conditions = {'max_trade_loss_pct': settings['max_loss_per_trade_pct']}
+    evaluation_cache = get_evaluation_cache(settings['evaluation_cache']) if settings.get('evaluation_cache') else None
+    batch_results = run_envelope_backtest_sets(source, params_list, stop_conditions=stop_conditions,
+                                               evaluation_cache=evaluation_cache) if params_list else []
+    for row, result in zip(batch_rows, batch_results):
+        pnl = result.get('total_pnl_pct', -1000)
+        drawdown = result.get('max_drawdown_pct', 1.0) * 100
+        if pnl > 50000: pnl = -1002
+        if result['trades_count'] < settings['minimum_trades']: pnl = -1000
+        worst_trade_pnl = result['worst_trade_pnl']
+        if worst_trade_pnl < 0 and abs(worst_trade_pnl / start_capital * 100) > settings['max_loss_per_trade_pct']:
+            pnl = -1001
+        if pnl <= -1000:
+            # Bestrafte Sets: fester Drawdown wie bei ungültigen Envelopes, nicht der eines abgebrochenen Laufs
+            drawdown = -pnl
+        results[row] = [-pnl, drawdown]
+    return results
+
+def evaluate_with_stats(x, source, settings):
+    """Wie `evaluate_individuals`, zusätzlich (Treffer, Fehlschläge) des Bewertungs-Caches in diesem Prozess."""
+    F = evaluate_individuals(x, source, settings)
+    path = settings.get('evaluation_cache')
+    return F, (get_evaluation_cache(path).take_stats() if path else (0, 0))
+
+# Zustand der Pool-Worker: angehängte Shared-Memory-Datensätze der laufenden Kombinationen (zuletzt benutzte zuerst)
+WORKER_DATASETS = OrderedDict()
+
+def _worker_dataset(descriptor):
+    dataset = WORKER_DATASETS.pop(descriptor['name'], None)
+    if dataset is None:
+        dataset = SharedDataset.attach(descriptor)
+    WORKER_DATASETS[descriptor['name']] = dataset
+    # Datensätze beendeter Kombinationen freigeben (der Hauptprozess hat sie bereits entfernt)
+    while len(WORKER_DATASETS) > MAX_ACTIVE_CELLS + 1:
+        WORKER_DATASETS.popitem(last=False)[1].close_segment()
+    return dataset
+
+def _evaluate_chunk(task):
+    descriptor, settings, x_chunk = task
+    return evaluate_with_stats(x_chunk, _worker_dataset(descriptor), settings)
 
 class EnvelopeOptimizationProblem(Problem):
-    def __init__(self, **kwargs):
+    def __init__(self, source=None, settings=None, **kwargs):
         # --- GEÄNDERT ---
         # n_var von 7 auf 8 erhöht, um balance_fraction_pct zu optimieren.
         # xl und xu um den Bereich für balance_fraction_pct erweitert (hier 1% bis 10%).
         super().__init__(n_var=8, n_obj=2, n_constr=0, 
                          xl=[5, 0.5, 1, 1.0, 2.0, 1.0, 1, 1.0], 
                          xu=[89, 5.0, 50, 5.0, 10.0, 10.0, 4, 10.0], **kwargs)
+        self.source = source
+        self.settings = settings
+        # Vom Scheduler im Pool berechnete Zielwerte der angefragten Generation (siehe `CellRun.tell`)
+        self.pending_F = None
 
     def _evaluate(self, x, out, *args, **kwargs):
-        results = []
-        for individual in x:
-            avg_period = int(round(individual[0]))
-            sl_pct = round(individual[1], 2)
-            base_lev = int(round(individual[2]))
-            target_atr = round(individual[3], 2)
-            env_start = round(individual[4], 2)
-            env_step = round(individual[5], 2)
-            env_count = int(round(individual[6]))
-            balance_fraction = round(individual[7], 2) # --- NEU --- Holt den neuen Wert.
-            
-            envelopes = [round(env_start + i * env_step, 2) for i in range(env_count)]
-            if any(e >= 100.0 for e in envelopes):
-                results.append([-1003, 1003])
-                continue
+        if self.pending_F is not None:
+            if len(self.pending_F) != len(x):
+                raise Exception(f"Vorberechnete Bewertungen passen nicht zur Generation ({len(self.pending_F)} statt {len(x)}).")
+            out["F"], self.pending_F = self.pending_F, None
+            return
+        source = self.source if self.source is not None else FrameIndicatorSource(HISTORICAL_DATA)
+        out["F"] = evaluate_individuals(x, source, self.settings or current_settings())
+
+class CellRun:
+    """
+    NSGA-II einer Kombination (Symbol, Zeitfenster, Durchschnittstyp) im Frage-Antwort-Betrieb: `ask` liefert die
+    zu bewertenden Parametervektoren der nächsten Generation, `tell` nimmt die Zielwerte entgegen (berechnet im
+    gemeinsamen Pool) und führt den Schritt aus. Das Ergebnis ist dasselbe wie mit `algorithm.next()`.
+    Nach jeweils `checkpoint_every` Generationen wird ein Zwischenstand geschrieben; liegt unter
+    `checkpoint_path` bereits einer, wird dort fortgesetzt.
+    """
+
+    def __init__(self, cell, dataset, settings, n_gen, pop_size=POP_SIZE, seed=SEED,
+                 checkpoint_path=None, checkpoint_every=CHECKPOINT_EVERY):
+        self.cell = cell
+        self.dataset = dataset
+        self.settings = settings
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.infills = None
+        self.open_rows = []
+        # Laufende Blöcke der aktuellen Generation im Pool (vom Scheduler gesetzt)
+        self.pending = None
+        self.problem = EnvelopeOptimizationProblem(source=dataset, settings=settings)
+        checkpoint = _read_json(checkpoint_path) if checkpoint_path else None
+        if checkpoint is not None and len(checkpoint.get('X', [])) == pop_size:
+            self.algorithm = restore_algorithm(self.problem, checkpoint, n_gen, pop_size, seed)
+            self.restored_gen = checkpoint['n_gen']
+        else:
+            self.algorithm = NSGA2(pop_size=pop_size)
+            self.algorithm.setup(self.problem, termination=get_termination("n_gen", n_gen), seed=seed, verbose=False)
+            self.restored_gen = 0
+
+    def ask(self):
+        """Parametervektoren der nächsten Generation, None wenn die Optimierung beendet ist."""
+        if not self.algorithm.has_next():
+            return None
+        self.infills = self.algorithm.infill()
+        # Genau die Individuen, die der Evaluator von pymoo bewerten würde (bereits bewertete überspringt er)
+        evaluate = self.algorithm.evaluator.evaluate_values_of
+        self.open_rows = [i for i, ind in enumerate(self.infills) if not all(e in ind.evaluated for e in evaluate)]
+        return self.infills[self.open_rows].get('X') if self.open_rows else np.empty((0, self.problem.n_var))
+
+    def tell(self, results):
+        """Übernimmt die Ergebnisse (F, (Treffer, Fehlschläge)) der Blöcke in Reihenfolge und rechnet weiter."""
+        if results:
+            self.problem.pending_F = np.vstack([F for F, _ in results])
+            self.cache_hits += sum(hits for _, (hits, _) in results)
+            self.cache_misses += sum(misses for _, (_, misses) in results)
+        self.algorithm.evaluator.eval(self.problem, self.infills, algorithm=self.algorithm)
+        self.algorithm.advance(infills=self.infills)
+        self.infills = None
+        if self.checkpoint_path and self.algorithm.has_next() and (self.algorithm.n_iter - 1) % self.checkpoint_every == 0:
+            save_checkpoint(self.checkpoint_path, self.algorithm)
+
+    def champions(self, start_date, end_date, start_capital, count=5):
+        """Die besten gültigen Lösungen (nach PnL) als Kandidaten für Stufe 2."""
+        symbol, timeframe, avg_type = self.cell
+        res = self.algorithm.result()
+        champions = []
+        valid_indices = [i for i, f in enumerate(res.F) if f[0] < 0]
+        best_indices = sorted(valid_indices, key=lambda i: res.F[i][0])[:count]
 
-            params = {
-                'average_period': avg_period, 'stop_loss_pct': sl_pct,
-                'base_leverage': base_lev, 'max_leverage': 50.0,
-                'target_atr_pct': target_atr,
-                'envelopes_pct': envelopes,
-                'start_capital': START_CAPITAL,
-                'average_type': AVERAGE_TYPE_GLOBAL,
-                'balance_fraction_pct': balance_fraction # --- NEU --- Fügt den Wert zu den Parametern hinzu.
+        for i in best_indices:
+            params = res.X[i]
+            param_dict = {
+                'symbol': symbol, 'timeframe': timeframe, 'start_date': start_date,
+                'end_date': end_date, 'start_capital': start_capital,
+                'pnl': float(-res.F[i][0]), 'drawdown': float(res.F[i][1]),
+                'params': {
+                    'average_type': avg_type, 'average_period': int(round(params[0])),
+                    'stop_loss_pct': round(float(params[1]), 2), 'base_leverage': int(round(params[2])),
+                    'target_atr_pct': round(float(params[3]), 2),
+                    'envelopes_pct': [round(round(float(params[4]), 2) + j * round(float(params[5]), 2), 2) for j in range(int(round(params[6])))],
+                    'balance_fraction_pct': round(float(params[7]), 2) # --- NEU --- Schreibt den Wert in die Kandidaten-Datei.
+                }
             }
-            data_with_indicators = calculate_envelope_indicators(HISTORICAL_DATA.copy(), params)
-            result = run_envelope_backtest(data_with_indicators.dropna(), params)
-            pnl = result.get('total_pnl_pct', -1000)
-            drawdown = result.get('max_drawdown_pct', 1.0) * 100
-            if pnl > 50000: pnl = -1002
-            if result['trades_count'] < MINIMUM_TRADES: pnl = -1000
-            if result["trade_log"]:
-                for trade in result["trade_log"]:
-                    loss_pct = abs(trade['pnl'] / START_CAPITAL * 100)
-                    if trade['pnl'] < 0 and loss_pct > MAX_LOSS_PER_TRADE_PCT:
-                        pnl = -1001
-                        break
-            results.append([-pnl, drawdown])
-        out["F"] = np.array(results)
+            champions.append(param_dict)
+        return champions
 
-def main(n_procs, n_gen_default):
-    print("\n--- [Stufe 1/2] Globale Suche mit Pymoo ---")
+class DatasetPrefetcher(threading.Thread):
+    """
+    Lädt im Hintergrund die Kerzen der nächsten Kombinationen (Download nur bei Lücken) und veröffentlicht
+    Kerzen + Indikatoren als Shared-Memory-Datensatz, während der Pool noch an den vorherigen rechnet.
+    Liefert (Kombination, Datensatz) in Reihenfolge über `next_cell`; Datensatz None heißt: keine Daten.
+    """
+
+    def __init__(self, cells, start_date, end_date, lookahead=PREFETCH_CELLS):
+        super().__init__(daemon=True)
+        self.cells = list(cells)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.queue = Queue(maxsize=max(1, lookahead))
+        self.error = None
+        self._stop_event = threading.Event()
+        self._bounds = EnvelopeOptimizationProblem()
+
+    def run(self):
+        frames = {}
+        try:
+            for index, (symbol, timeframe, avg_type) in enumerate(self.cells):
+                if (symbol, timeframe) not in frames:
+                    frames[(symbol, timeframe)] = load_data(symbol, timeframe, self.start_date, self.end_date)
+                data = frames[(symbol, timeframe)]
+                # Kerzen nur so lange halten, wie noch eine Kombination sie braucht
+                if all((s, t) != (symbol, timeframe) for s, t, _ in self.cells[index + 1:]):
+                    del frames[(symbol, timeframe)]
+                dataset = None if data.empty else SharedDataset.publish(data, average_period_keys(avg_type, self._bounds))
+                if not self._put(((symbol, timeframe, avg_type), dataset)):
+                    return
+        except Exception as e:
+            self.error = e
+        self._put(None)
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        if item is not None and item[1] is not None:
+            item[1].close_segment()
+        return False
+
+    def next_cell(self, block=True):
+        """Nächste (Kombination, Datensatz); None wenn alle geliefert sind, Empty wenn (noch) nichts bereitliegt."""
+        item = self.queue.get(block=block)
+        if item is None:
+            self.queue.put(None)
+            if self.error is not None:
+                raise self.error
+        return item
+
+    def close(self):
+        """Bricht ab und gibt nicht mehr abgeholte Datensätze frei."""
+        self._stop_event.set()
+        self.join()
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                return
+            if item is not None and item[1] is not None:
+                item[1].close_segment()
+
+def ask_run_config(n_gen_default):
+    """Fragt die Eingaben eines neuen Laufs ab."""
     symbol_input = input("Handelspaar(e) eingeben (z.B. BTC ETH): ")
     timeframe_input = input("Zeitfenster eingeben (z.B. 1h 4h): ")
     start_date = input("Startdatum eingeben (JJJJ-MM-TT): ")
@@ -113,93 +377,242 @@ def main(n_procs, n_gen_default):
     elif avg_choice == '4': avg_types_to_run = ['DCM', 'SMA', 'WMA']
     else: avg_types_to_run = ['DCM']
 
+    return {
+        'symbols': symbol_input.split(), 'timeframes': timeframe_input.split(),
+        'start_date': start_date, 'end_date': end_date, 'n_gen': n_gen, 'avg_types': avg_types_to_run,
+        'start_capital': float(input("Startkapital in USDT eingeben (z.B. 1000): ")),
+        'max_loss_per_trade_pct': float(input("Maximaler Verlust pro Trade in % (z.B. 2.0): ")),
+        'minimum_trades': int(input("Mindestanzahl an Trades (z.B. 20): ")),
+    }
+
+def load_job_spec(path, n_gen_default, extra_defaults=None):
+    """
+    Liest die Eingaben eines Laufs aus einer JSON-Datei (für den Betrieb ohne Terminal), z.B.
+    {"symbols": ["BTC", "ETH"], "timeframes": ["1h", "4h"], "start_date": "2023-01-01", "end_date": "2024-01-01",
+     "n_gen": 50, "avg_types": ["DCM", "SMA"], "start_capital": 1000, "max_loss_per_trade_pct": 2.0, "minimum_trades": 20}
+    Symbole und Zeitfenster dürfen auch durch Leerzeichen getrennt in einem String stehen.
+    `extra_defaults` erlaubt weitere Felder (z.B. für den Walk-Forward-Modus) und übernimmt sie unverändert.
+    """
+    spec = _read_json(path)
+    if not isinstance(spec, dict):
+        raise Exception(f"Job-Datei '{path}' fehlt oder ist kein JSON-Objekt.")
+    missing = [key for key in JOB_SPEC_REQUIRED if not spec.get(key)]
+    if missing:
+        raise Exception(f"Job-Datei '{path}': Pflichtfelder fehlen: {', '.join(missing)}")
+    extra_defaults = extra_defaults or {}
+    unknown = set(spec) - set(JOB_SPEC_REQUIRED) - set(JOB_SPEC_DEFAULTS) - set(extra_defaults) - {'n_gen'}
+    if unknown:
+        raise Exception(f"Job-Datei '{path}': unbekannte Felder: {', '.join(sorted(unknown))}")
+    spec = {**JOB_SPEC_DEFAULTS, 'n_gen': n_gen_default, **spec}
+    as_list = lambda value: value.split() if isinstance(value, str) else list(value)
+    invalid = [avg_type for avg_type in as_list(spec['avg_types']) if avg_type not in ('DCM', 'SMA', 'WMA')]
+    if invalid:
+        raise Exception(f"Job-Datei '{path}': unbekannte Durchschnittstypen: {', '.join(invalid)}")
+    return {
+        'symbols': as_list(spec['symbols']), 'timeframes': as_list(spec['timeframes']),
+        'start_date': str(spec['start_date']), 'end_date': str(spec['end_date']), 'n_gen': int(spec['n_gen']),
+        'avg_types': as_list(spec['avg_types']), 'start_capital': float(spec['start_capital']),
+        'max_loss_per_trade_pct': float(spec['max_loss_per_trade_pct']), 'minimum_trades': int(spec['minimum_trades']),
+        **{key: spec.get(key, default) for key, default in extra_defaults.items()},
+    }
+
+def expand_cells(config):
+    """Das ganze Raster als Aufgabenliste (Symbol, Zeitfenster, Durchschnittstyp) in fester Reihenfolge."""
+    return [(f"{symbol_short.upper()}/USDT:USDT", timeframe, avg_type)
+            for symbol_short in config['symbols'] for timeframe in config['timeframes'] for avg_type in config['avg_types']]
+
+def write_candidates(run, cells):
+    """Schreibt die Kandidaten aller bisher fertigen Kombinationen (Reihenfolge des Rasters); gibt ihre Anzahl zurück."""
+    champions = [champion for cell in cells for champion in run['completed'].get(cell_key(*cell), [])]
+    if champions:
+        _write_json(CANDIDATES_FILE, champions, indent=4)
+    return len(champions)
+
+def run_cells(cells, config, n_procs, run, checkpoint_every=CHECKPOINT_EVERY):
+    """
+    Scheduler für alle offenen Kombinationen: ein Pool für den ganzen Lauf, bis zu `MAX_ACTIVE_CELLS` Kombinationen
+    gleichzeitig, deren Generationen als Blöcke in den Pool gehen. Die Daten der nächsten Kombination werden
+    im Hintergrund vorbereitet. Jede fertige Kombination wird sofort im Protokoll und in der Kandidaten-Datei
+    festgehalten.
+    """
+    start_date, end_date, n_gen = config['start_date'], config['end_date'], config['n_gen']
+    # Pool vor dem Lade-Thread starten: Worker werden (bei 'fork') nicht mitten aus einem laufenden Thread kopiert
+    pool = Pool(n_procs) if n_procs > 1 else None
+    prefetcher = DatasetPrefetcher(cells, start_date, end_date)
+    prefetcher.start()
+    # Wird von jedem fertigen Block gesetzt, damit der Hauptprozess ohne Verzögerung weiterrechnet
+    block_done = threading.Event()
+    notify = lambda _: block_done.set()
+    active = []
+    estimated = False
+    try:
+        with tqdm(total=n_gen * len(cells), desc="Generationen") as pbar:
+            exhausted = False
+            while active or not exhausted:
+                # Neue Kombinationen aufnehmen; blockierend nur, wenn sonst nichts zu tun ist
+                while not exhausted and len(active) < MAX_ACTIVE_CELLS:
+                    try:
+                        item = prefetcher.next_cell(block=not active)
+                    except Empty:
+                        break
+                    if item is None:
+                        exhausted = True
+                        break
+                    cell, dataset = item
+                    symbol, timeframe, avg_type = cell
+                    if dataset is None:
+                        tqdm.write(f"Keine Daten für {symbol} ({timeframe}). Überspringe {avg_type}.")
+                        pbar.update(n_gen)
+                        continue
+                    if not estimated:
+                        estimate_duration(dataset, cells, config, n_procs)
+                        estimated = True
+                    settings = {**current_settings(), 'average_type': avg_type}
+                    cell_run = CellRun(cell, dataset, settings, n_gen, checkpoint_path=checkpoint_file(*cell),
+                                       checkpoint_every=checkpoint_every)
+                    tqdm.write(f"===== Optimiere {symbol} auf {timeframe} mit {avg_type} =====")
+                    if cell_run.restored_gen:
+                        tqdm.write(f"Setze bei Generation {cell_run.restored_gen} fort.")
+                        pbar.update(cell_run.restored_gen)
+                    cell_run.pending = _submit(pool, cell_run, n_procs, notify)
+                    active.append(cell_run)
+
+                if not active:
+                    continue
+                # Die erste Kombination, deren Generation vollständig bewertet ist, rechnet weiter
+                cell_run = next((run_ for run_ in active if all(job.ready() for job in run_.pending)), None)
+                if cell_run is None:
+                    block_done.wait(1.0)
+                    block_done.clear()
+                    continue
+                cell_run.tell([job.get() for job in cell_run.pending])
+                pbar.update(1)
+                cell_run.pending = _submit(pool, cell_run, n_procs, notify)
+                if cell_run.pending is None:
+                    active.remove(cell_run)
+                    _finish_cell(cell_run, config, run, cells)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        prefetcher.close()
+        for cell_run in active:
+            cell_run.dataset.close_segment()
+
+class _Done:
+    """Sofort fertiges Ergebnis (ohne Pool), mit derselben Schnittstelle wie `AsyncResult`."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def ready(self):
+        return True
+
+    def wait(self, timeout=None):
+        pass
+
+    def get(self):
+        return self.value
+
+def _submit(pool, cell_run, n_chunks, notify=None):
+    """Schickt die nächste Generation in Blöcken los; None, wenn die Kombination fertig ist."""
+    x = cell_run.ask()
+    if x is None:
+        return None
+    chunks = [chunk for chunk in np.array_split(x, n_chunks) if len(chunk)]
+    if pool is None:
+        return [_Done(evaluate_with_stats(chunk, cell_run.dataset, cell_run.settings)) for chunk in chunks]
+    descriptor = cell_run.dataset.descriptor()
+    return [pool.apply_async(_evaluate_chunk, ((descriptor, cell_run.settings, chunk),), callback=notify, error_callback=notify)
+            for chunk in chunks]
+
+def _finish_cell(cell_run, config, run, cells):
+    symbol, timeframe, avg_type = cell_run.cell
+    if EVALUATION_CACHE_FILE:
+        tqdm.write(f"{symbol} ({timeframe}, {avg_type}) Bewertungs-Cache: {format_hit_rate(cell_run.cache_hits, cell_run.cache_misses)}")
+    champions = cell_run.champions(config['start_date'], config['end_date'], config['start_capital'])
+    cell_run.dataset.close_segment()
+    # Kombination als fertig vermerken; ein Neustart überspringt sie. Die Kandidaten-Datei wächst mit.
+    run['completed'][cell_key(*cell_run.cell)] = champions
+    _write_json(RUN_FILE, run)
+    count = write_candidates(run, cells)
+    if cell_run.checkpoint_path and os.path.exists(cell_run.checkpoint_path):
+        os.remove(cell_run.checkpoint_path)
+    tqdm.write(f"{symbol} ({timeframe}, {avg_type}) fertig: {len(champions)} Kandidat(en), insgesamt {count} gespeichert.")
+
+def estimate_duration(dataset, cells, config, n_procs):
+    """Kurzer Benchmark auf dem ersten Datensatz (ohne Bewertungs-Cache) für die Zeitschätzung."""
+    problem_for_benchmark = EnvelopeOptimizationProblem(source=dataset, settings={**current_settings(), 'evaluation_cache': None})
+    sample_population = np.random.rand(POP_SIZE, 8) * (problem_for_benchmark.xu - problem_for_benchmark.xl) + problem_for_benchmark.xl
+    start_b = time.time()
+    problem_for_benchmark._evaluate(sample_population, out={})
+    time_per_eval = (time.time() - start_b) / POP_SIZE
+    estimated_time = (POP_SIZE * config['n_gen'] * len(cells) * time_per_eval) / n_procs
+    tqdm.write(f"Geschätzte Gesamtdauer für Stufe 1: {format_time(estimated_time)} ({len(cells)} Kombination(en))")
+
+def main(n_procs, n_gen_default, resume=False, checkpoint_every=CHECKPOINT_EVERY, job_config=None):
+    print("\n--- [Stufe 1/2] Globale Suche mit Pymoo ---")
+    run = _read_json(RUN_FILE)
+    config = job_config
+    unfinished = run is not None and not run.get('finished')
+    if unfinished and not resume:
+        if config is not None:
+            # Ohne Terminal: derselbe Job wird fortgesetzt, ein anderer beginnt neu
+            resume = run['config'] == config
+        else:
+            answer = input(f"Unterbrochener Lauf gefunden ({len(run['completed'])} Kombination(en) fertig). Fortsetzen? [j/N]: ")
+            resume = answer.strip().lower() in ('j', 'ja')
+    if resume:
+        if not unfinished:
+            print("Kein unterbrochener Lauf zum Fortsetzen gefunden.")
+            return
+        config = run['config']
+        print(f"Setze Lauf fort: {' '.join(config['symbols'])} / {' '.join(config['timeframes'])} / {' '.join(config['avg_types'])}, "
+              f"{config['start_date']} bis {config['end_date']}, {config['n_gen']} Generationen")
+    else:
+        config = config or ask_run_config(n_gen_default)
+        # Neuer Lauf: alte Zwischenstände und Kandidaten verwerfen
+        for path in glob.glob(os.path.join(CHECKPOINT_DIR, 'nsga2_*.json')) + [CANDIDATES_FILE]:
+            if os.path.exists(path):
+                os.remove(path)
+        run = {'config': config, 'completed': {}}
+        _write_json(RUN_FILE, run)
+
     global START_CAPITAL, MAX_LOSS_PER_TRADE_PCT, MINIMUM_TRADES
-    START_CAPITAL = float(input("Startkapital in USDT eingeben (z.B. 1000): "))
-    MAX_LOSS_PER_TRADE_PCT = float(input("Maximaler Verlust pro Trade in % (z.B. 2.0): "))
-    MINIMUM_TRADES = int(input("Mindestanzahl an Trades (z.B. 20): "))
-    
-    symbols_to_run = symbol_input.split()
-    timeframes_to_run = timeframe_input.split()
-    all_champions = []
-
-    for symbol_short in symbols_to_run:
-        for timeframe in timeframes_to_run:
-            symbol = f"{symbol_short.upper()}/USDT:USDT"
-            
-            global HISTORICAL_DATA
-            HISTORICAL_DATA = load_data(symbol, timeframe, start_date, end_date)
-            if HISTORICAL_DATA.empty:
-                print(f"Keine Daten für {symbol} ({timeframe}). Überspringe.")
-                continue
-            
-            print("\nFühre kurzen Benchmark zur Zeitschätzung durch...")
-            problem_for_benchmark = EnvelopeOptimizationProblem()
-            sample_individual = np.random.rand(1, 8) * (problem_for_benchmark.xu - problem_for_benchmark.xl) + problem_for_benchmark.xl
-            start_b = time.time()
-            problem_for_benchmark._evaluate(sample_individual, out={})
-            end_b = time.time()
-            time_per_eval = end_b - start_b
-            
-            pop_size = 100
-            total_evals = (pop_size * n_gen) * len(avg_types_to_run)
-            estimated_time = (total_evals * time_per_eval) / n_procs
-            print(f"Geschätzte Gesamtdauer für Stufe 1: {format_time(estimated_time)}")
-            
-            for avg_type in avg_types_to_run:
-                global AVERAGE_TYPE_GLOBAL
-                AVERAGE_TYPE_GLOBAL = avg_type
-                
-                print(f"\n===== Optimiere {symbol} auf {timeframe} mit {avg_type} =====")
-
-                with Pool(n_procs) as pool:
-                    problem = EnvelopeOptimizationProblem(parallelization=StarmapParallelization(pool.starmap))
-                    algorithm = NSGA2(pop_size=pop_size)
-                    termination = get_termination("n_gen", n_gen)
-
-                    with tqdm(total=n_gen, desc="Generationen") as pbar:
-                        callback = TqdmCallback(pbar)
-                        res = minimize(problem,
-                                       algorithm,
-                                       termination,
-                                       seed=1,
-                                       callback=callback,
-                                       verbose=False,
-                                       save_history=False)
-
-                    valid_indices = [i for i, f in enumerate(res.F) if f[0] < 0]
-                    if not valid_indices: continue
-                    
-                    best_indices = sorted(valid_indices, key=lambda i: res.F[i][0])[:5]
-                    
-                    for i in best_indices:
-                        params = res.X[i]
-                        param_dict = {
-                            'symbol': symbol, 'timeframe': timeframe, 'start_date': start_date,
-                            'end_date': end_date, 'start_capital': START_CAPITAL,
-                            'pnl': -res.F[i][0], 'drawdown': res.F[i][1],
-                            'params': {
-                                'average_type': avg_type, 'average_period': int(round(params[0])),
-                                'stop_loss_pct': round(params[1], 2), 'base_leverage': int(round(params[2])),
-                                'target_atr_pct': round(params[3], 2),
-                                'envelopes_pct': [round(round(params[4], 2) + j * round(params[5], 2), 2) for j in range(int(round(params[6])))],
-                                'balance_fraction_pct': round(params[7], 2) # --- NEU --- Schreibt den Wert in die Kandidaten-Datei.
-                            }
-                        }
-                        all_champions.append(param_dict)
-
-    if not all_champions:
+    START_CAPITAL = config['start_capital']
+    MAX_LOSS_PER_TRADE_PCT = config['max_loss_per_trade_pct']
+    MINIMUM_TRADES = config['minimum_trades']
+
+    cells = expand_cells(config)
+    open_cells = [cell for cell in cells if cell_key(*cell) not in run['completed']]
+    if len(open_cells) < len(cells):
+        print(f"{len(cells) - len(open_cells)} von {len(cells)} Kombination(en) bereits fertig. Überspringe.")
+    if open_cells:
+        run_cells(open_cells, config, n_procs, run, checkpoint_every)
+
+    run['finished'] = True
+    _write_json(RUN_FILE, run)
+    if not write_candidates(run, cells):
         print("\nKeine vielversprechenden Kandidaten gefunden.")
         return
-
-    output_file = os.path.join(os.path.dirname(__file__), 'optimization_candidates.json')
-    with open(output_file, 'w') as f:
-        json.dump(all_champions, f, indent=4)
-        
-    print(f"\n--- Globale Suche beendet. Top-Kandidaten in '{output_file}' gespeichert. ---")
+    print(f"\n--- Globale Suche beendet. Top-Kandidaten in '{CANDIDATES_FILE}' gespeichert. ---")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Stufe 1: Globale Parameter-Optimierung mit Pymoo.")
     parser.add_argument('--jobs', type=int, default=1, help='Anzahl der CPU-Kerne für die Optimierung.')
     parser.add_argument('--gen', type=int, default=50, help='Standard-Anzahl der Generationen.')
+    parser.add_argument('--resume', action='store_true', help='Unterbrochenen Lauf ab dem letzten Zwischenstand fortsetzen.')
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY, help='Zwischenstand alle N Generationen speichern.')
+    parser.add_argument('--no-eval-cache', action='store_true', help='Bewertungs-Cache (evaluation_cache.db) nicht verwenden.')
+    parser.add_argument('--job-spec', help='JSON-Datei mit den Eingaben des Laufs (ohne Rückfragen, z.B. aus der Pipeline).')
     args = parser.parse_args()
-    main(n_procs=args.jobs, n_gen_default=args.gen)
+    if args.no_eval_cache:
+        EVALUATION_CACHE_FILE = None
+    job_config = None
+    if args.job_spec:
+        try:
+            job_config = load_job_spec(args.job_spec, args.gen)
+        except Exception as e:
+            parser.error(str(e))
+    main(n_procs=max(1, args.jobs), n_gen_default=args.gen, resume=args.resume,
+         checkpoint_every=max(1, args.checkpoint_every), job_config=job_config)
@@ -0,0 +1,98 @@
+# code/analysis/import_budget.py
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Einstiegspunkte: Name -> (Verzeichnis für sys.path, Modulname)
+ENTRY_POINTS = {
+    'run.py': (os.path.join(CODE_DIR, 'strategies', 'envelope'), 'run'),
+    'run_multi.py': (os.path.join(CODE_DIR, 'strategies', 'envelope'), 'run_multi'),
+    'run_backtest.py': (CODE_DIR, 'analysis.run_backtest'),
+    'global_optimizer_pymoo.py': (CODE_DIR, 'analysis.global_optimizer_pymoo'),
+    'local_refiner_optuna.py': (CODE_DIR, 'analysis.local_refiner_optuna'),
+}
+
+# Obergrenzen in Millisekunden für `--check` (kalter Import auf einem kleinen VPS)
+STARTUP_BUDGET_MS = {
+    'run.py': 1500,
+    'run_multi.py': 1500,
+    'run_backtest.py': 1500,
+    'global_optimizer_pymoo.py': 2000,
+    'local_refiner_optuna.py': 1500,
+}
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure(entry_point, python=sys.executable):
+    """
+    Importiert einen Einstiegspunkt in einem frischen Interpreter mit `-X importtime` und gibt die
+    Liste (Modul, eigene Zeit µs, kumulierte Zeit µs, Tiefe) sowie die Gesamtzeit in µs zurück.
+    """
+    path, module = ENTRY_POINTS[entry_point]
+    code = f"import sys; sys.path.insert(0, {path!r}); sys.path.insert(0, {CODE_DIR!r}); import {module}"
+    proc = subprocess.run([python, '-X', 'importtime', '-c', code], capture_output=True, text=True, cwd=CODE_DIR)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Import von {entry_point} fehlgeschlagen:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    total_us = sum(self_us for _, self_us, _, _ in rows)
+    return rows, total_us
+
+
+def by_package(rows):
+    """Summiert die eigene Importzeit je Top-Level-Paket (z.B. alle `pandas.*` zusammen)."""
+    packages = {}
+    for name, self_us, _, _ in rows:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def report(entry_points, top=10, repeat=1):
+    results = {}
+    for entry_point in entry_points:
+        # Bei mehreren Läufen zählt der schnellste (Dateisystem-Cache warm)
+        rows, total_us = min((measure(entry_point) for _ in range(repeat)), key=lambda r: r[1])
+        results[entry_point] = {'total_ms': total_us / 1000,
+                                'packages': [(p, us / 1000) for p, us in by_package(rows)[:top]]}
+        print(f"\n{entry_point}: {total_us / 1000:.0f} ms (Budget {STARTUP_BUDGET_MS.get(entry_point, '-')} ms)")
+        for package, us in by_package(rows)[:top]:
+            print(f"  {package:<28} {us / 1000:8.1f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Misst die Importzeit der Einstiegspunkte (python -X importtime).")
+    parser.add_argument('entry_points', nargs='*', default=list(ENTRY_POINTS), help='Einstiegspunkte (Standard: alle).')
+    parser.add_argument('--top', type=int, default=10, help='Anzahl der teuersten Pakete pro Einstiegspunkt.')
+    parser.add_argument('--repeat', type=int, default=3, help='Messungen pro Einstiegspunkt (der schnellste zählt).')
+    parser.add_argument('--check', action='store_true', help='Mit Fehlercode beenden, wenn ein Budget überschritten wird.')
+    parser.add_argument('--json', help='Ergebnisse zusätzlich als JSON in diese Datei schreiben.')
+    args = parser.parse_args()
+
+    results = report(args.entry_points, args.top, args.repeat)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    over_budget = [name for name, result in results.items()
+                   if name in STARTUP_BUDGET_MS and result['total_ms'] > STARTUP_BUDGET_MS[name]]
+    if over_budget:
+        print(f"\nBudget überschritten: {', '.join(over_budget)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
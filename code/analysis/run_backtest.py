@@ -48,7 +48,7 @@ def main():
     # Führe den Backtest durch
     print("Berechne Indikatoren und führe Backtest aus...")
     data_with_indicators = calculate_envelope_indicators(data.copy(), params)
-    result = run_envelope_backtest(data_with_indicators.dropna(), params)
+    result = run_envelope_backtest(data_with_indicators.dropna(), params, trade_log=False)
 
     # Gib die Ergebnisse aus
     print("\n" + "="*50)
@@ -0,0 +1,125 @@
+# code/analysis/shared_dataset.py
+
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+from analysis.backtest import FrameIndicatorSource
+from utilities.indicator_cache import IndicatorCache, INDICATOR_CACHE
+
+ALIGNMENT = 64
+
+
+def _attach_segment(name):
+    # Nur der Besitzer gibt das Segment frei; Worker dürfen es beim Beenden nicht über den
+    # resource_tracker entfernen (ab Python 3.13 gibt es dafür track=False). Ältere Versionen
+    # melden das Segment beim Anhängen an; bei 'spawn' teilen sich Worker und Hauptprozess den
+    # Tracker, daher wird die Anmeldung dort unterdrückt statt nachträglich zurückgenommen.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedDataset:
+    """
+    Kerzen und vorberechnete Indikator-Matrizen in einem einzigen Shared-Memory-Segment.
+    Der Hauptprozess veröffentlicht die Daten einmal (`publish`), Worker hängen sich über den
+    kleinen, picklebaren `descriptor()` an (`attach`) und erhalten schreibgeschützte NumPy-Views,
+    ohne die Daten zu kopieren. Funktioniert auch mit der Startmethode 'spawn'.
+    Implementiert dieselbe Schnittstelle wie `FrameIndicatorSource` für `run_envelope_backtest_sets`.
+    """
+
+    def __init__(self, segment, layout, columns, owner, fingerprint=None):
+        self._segment = segment
+        # Fingerprint der Kerzen (wie `dataset_fingerprint`), Schlüssel des Bewertungs-Caches
+        self.fingerprint = fingerprint
+        self._layout = layout
+        self._owner = owner
+        self.columns = dict(columns)
+        self.arrays = {}
+        for name, (offset, dtype, shape) in layout.items():
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[name] = array
+        self.high = self.arrays['high']
+        self.low = self.arrays['low']
+        self.close = self.arrays['close']
+        self.timestamps = self.arrays['timestamp']
+        self._fallback = None
+
+    @classmethod
+    def publish(cls, data, keys, cache=INDICATOR_CACHE):
+        """Berechnet die Indikatoren für `keys` (siehe `indicator_key`) und legt alles im Shared Memory ab."""
+        source = FrameIndicatorSource(data, cache)
+        average, valid, key_columns = source.indicator_matrices(keys)
+        arrays = {
+            'timestamp': np.asarray(source.timestamps, dtype=np.int64),
+            'high': source.high, 'low': source.low, 'close': source.close,
+            'average': np.ascontiguousarray(average), 'valid': np.ascontiguousarray(valid),
+        }
+
+        layout, offset = {}, 0
+        for name, array in arrays.items():
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            layout[name] = (offset, array.dtype.str, array.shape)
+            offset += array.nbytes
+
+        segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, array in arrays.items():
+            start, dtype, shape = layout[name]
+            np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf, offset=start)[...] = array
+        columns = {key: int(column) for key, column in zip(keys, key_columns)}
+        return cls(segment, layout, columns, owner=True, fingerprint=source.fingerprint)
+
+    def descriptor(self):
+        return {'name': self._segment.name, 'layout': self._layout, 'columns': list(self.columns.items()),
+                'fingerprint': self.fingerprint}
+
+    @classmethod
+    def attach(cls, descriptor):
+        return cls(_attach_segment(descriptor['name']), descriptor['layout'], descriptor['columns'], owner=False,
+                   fingerprint=descriptor.get('fingerprint'))
+
+    def __len__(self):
+        return len(self.high)
+
+    @property
+    def nbytes(self):
+        return self._segment.size
+
+    def indicator_matrices(self, keys):
+        """Zero-Copy, solange alle Schlüssel veröffentlicht wurden; sonst Berechnung im eigenen Prozess."""
+        if all(key in self.columns for key in keys):
+            key_columns = np.array([self.columns[key] for key in keys], dtype=np.int64)
+            return self.arrays['average'], self.arrays['valid'], key_columns
+        if self._fallback is None:
+            self._fallback = FrameIndicatorSource(self.to_frame(), IndicatorCache())
+        return self._fallback.indicator_matrices(keys)
+
+    def to_frame(self):
+        index = pd.DatetimeIndex(pd.to_datetime(self.arrays['timestamp'], unit='ms', utc=True), name='timestamp')
+        return pd.DataFrame({'high': self.high, 'low': self.low, 'close': self.close}, index=index)
+
+    def close_segment(self):
+        self.arrays = {}
+        self.high = self.low = self.close = self.timestamps = None
+        try:
+            self._segment.close()
+        except BufferError:
+            # Es existieren noch Views (z.B. in laufenden Ergebnissen); sie bleiben bis Prozessende gültig.
+            pass
+        if self._owner:
+            self._segment.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close_segment()
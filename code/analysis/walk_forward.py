@@ -0,0 +1,299 @@
+# code/analysis/walk_forward.py
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+import optuna
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from analysis.backtest import load_data, format_time, run_envelope_backtest_sets
+from analysis.shared_dataset import SharedDataset
+from analysis.evaluation_cache import DEFAULT_EVALUATION_DB, CACHE_VERSION, canonical_json, get_evaluation_cache, format_hit_rate
+from analysis.global_optimizer_pymoo import CellRun, evaluate_with_stats, load_job_spec, _write_json, _read_json, SEED
+from analysis.local_refiner_optuna import evaluate_trial, params_from_trial
+
+WALK_FORWARD_DIR = os.path.join(os.path.dirname(__file__), 'walk_forward')
+# Zusätzliche Felder der Job-Datei (Fenster in Tagen; step_days None = Testlänge, d.h. lückenlose Testfenster)
+WALK_FORWARD_DEFAULTS = {'train_days': 180, 'test_days': 30, 'step_days': None, 'trials': 100, 'refine_top': 3}
+DEFAULT_GENERATIONS = 30
+# Vorlauf vor dem ersten Trainingsfenster, damit die Indikatoren dort bereits gültig sind
+WARMUP_DAYS = 50
+# Kerzen vor einem Fenster, die noch in dessen Indikatoren eingehen (länger als die längste Periode)
+WARMUP_BARS = 250
+# Stufe 1 sucht Perioden 5..89, Stufe 2 bis zu 10 darüber; alle liegen vorberechnet im Shared Memory
+AVERAGE_PERIODS = range(5, 100)
+ATR_PERIOD = 14
+
+
+class SliceSource:
+    """
+    Ausschnitt [start, stop) einer Indikator-Quelle (`SharedDataset` über die ganze Historie) mit derselben
+    Schnittstelle wie `FrameIndicatorSource`. Preise und Indikator-Matrizen sind Views, nichts wird neu
+    berechnet; die Indikatoren am Fensteranfang enthalten damit den Vorlauf aus der Historie.
+    """
+
+    def __init__(self, source, start, stop):
+        self.source = source
+        self.start = start
+        self.stop = stop
+        self.high = source.high[start:stop]
+        self.low = source.low[start:stop]
+        self.close = source.close[start:stop]
+        self.timestamps = source.timestamps[start:stop]
+        # Schlüssel des Bewertungs-Caches: Fenster samt Vorlauf, unabhängig vom Beginn der geladenen Historie
+        h = hashlib.blake2b(digest_size=16)
+        first = max(0, start - WARMUP_BARS)
+        for array in (source.timestamps, source.high, source.low, source.close):
+            h.update(np.ascontiguousarray(array[first:stop]).tobytes())
+        self.fingerprint = h.hexdigest()
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def indicator_matrices(self, keys):
+        average, valid, key_columns = self.source.indicator_matrices(keys)
+        return average[self.start:self.stop], valid[self.start:self.stop], key_columns
+
+
+def _to_ms(date):
+    return int(pd.Timestamp(date, tz='UTC').value // 1_000_000)
+
+
+def _iso(ms):
+    return pd.Timestamp(int(ms), unit='ms', tz='UTC').strftime('%Y-%m-%d %H:%M')
+
+
+def make_folds(timestamps, start_date, end_date, train_days, test_days, step_days=None):
+    """
+    Rollierende Fenster ab `start_date`: Training [t, t+train), Test [t+train, t+train+test), dann um `step_days`
+    weiter, solange das Testfenster vor dem Ende (inkl. Endtag) liegt. Die Fenster hängen nur vom Startdatum ab,
+    ein späteres Enddatum fügt also nur neue Folds hinzu. Gibt Kerzen-Indizes und Zeiträume zurück.
+    """
+    day_ms = 24 * 60 * 60 * 1000
+    step_days = step_days or test_days
+    end_ms = _to_ms(end_date) + day_ms
+    folds = []
+    train_start = _to_ms(start_date)
+    while train_start + (train_days + test_days) * day_ms <= end_ms:
+        train_end = train_start + train_days * day_ms
+        test_end = train_end + test_days * day_ms
+        rows = np.searchsorted(timestamps, [train_start, train_end, test_end], side='left')
+        if rows[1] - rows[0] > WARMUP_BARS and rows[2] > rows[1]:
+            folds.append({
+                'fold': len(folds) + 1,
+                'train': [_iso(train_start), _iso(train_end)], 'test': [_iso(train_end), _iso(test_end)],
+                'train_rows': [int(rows[0]), int(rows[1])], 'test_rows': [int(rows[1]), int(rows[2])],
+            })
+        train_start += step_days * day_ms
+    return folds
+
+
+def fold_key(fold, train, test, config):
+    """Kennung eines Folds: Fenster, Daten (Fingerprints) und alle Einstellungen, die das Ergebnis bestimmen."""
+    settings = {key: config[key] for key in ('avg_types', 'n_gen', 'trials', 'refine_top', 'start_capital',
+                                             'max_loss_per_trade_pct', 'minimum_trades')}
+    return hashlib.sha1(canonical_json([CACHE_VERSION, fold['train'], fold['test'], train.fingerprint, test.fingerprint,
+                                        settings]).encode()).hexdigest()
+
+
+def run_fold(source, symbol, timeframe, fold, config, evaluation_cache_path=DEFAULT_EVALUATION_DB):
+    """
+    Ein Fold: Stufe 1 (NSGA-II je Durchschnittstyp) und Stufe 2 (Optuna um die besten `refine_top` Kandidaten)
+    auf dem Trainingsfenster, danach wird der Gewinner unverändert auf dem folgenden Testfenster bewertet.
+    """
+    started = time.perf_counter()
+    start_capital = config['start_capital']
+    train = SliceSource(source, *fold['train_rows'])
+    test = SliceSource(source, *fold['test_rows'])
+
+    candidates = []
+    for avg_type in config['avg_types']:
+        settings = {'start_capital': start_capital, 'max_loss_per_trade_pct': config['max_loss_per_trade_pct'],
+                    'minimum_trades': config['minimum_trades'], 'average_type': avg_type,
+                    'evaluation_cache': evaluation_cache_path}
+        cell_run = CellRun((symbol, timeframe, avg_type), train, settings, config['n_gen'])
+        while (x := cell_run.ask()) is not None:
+            cell_run.tell([evaluate_with_stats(x, train, settings)] if len(x) else [])
+        candidates += cell_run.champions(fold['train'][0], fold['train'][1], start_capital)
+    candidates = sorted(candidates, key=lambda c: c['pnl'], reverse=True)[:config['refine_top']]
+
+    # Stufe 2 ohne Bewertungs-Cache: Treffer melden keine Zwischenstände an den Pruner, das Ergebnis eines
+    # Folds soll aber bei jedem Lauf gleich sein
+    best_score, best_params = None, None
+    for candidate in candidates:
+        study = optuna.create_study(direction="maximize", sampler=optuna.samplers.TPESampler(seed=SEED),
+                                    pruner=optuna.pruners.MedianPruner(n_startup_trials=10, n_warmup_steps=1))
+        study.optimize(lambda trial: evaluate_trial(trial, train, candidate['params'], start_capital), n_trials=config['trials'])
+        if not study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)):
+            continue
+        if best_score is None or study.best_value > best_score:
+            best_score = study.best_value
+            best_params = params_from_trial(study.best_trial.params, candidate['params'], start_capital)
+
+    result = {**fold, 'params': best_params, 'train_score': best_score}
+    if best_params is None:
+        # Kein gültiger Kandidat: im Testfenster wird nicht gehandelt
+        result.update({'train_pnl_pct': None, 'test_pnl_pct': 0.0, 'test_max_drawdown_pct': 0.0, 'test_trades': 0,
+                       'test_win_rate': 0.0, 'equity': []})
+    else:
+        train_result = run_envelope_backtest_sets(train, [best_params])[0]
+        test_result = run_envelope_backtest_sets(test, [best_params], trade_log=True)[0]
+        trade_log = test_result['trade_log']
+        result.update({
+            'train_pnl_pct': float(train_result['total_pnl_pct']),
+            'test_pnl_pct': float(test_result['total_pnl_pct']),
+            'test_max_drawdown_pct': float(test_result['max_drawdown_pct']) * 100,
+            'test_trades': int(test_result['trades_count']), 'test_win_rate': float(test_result['win_rate']),
+            # Kontostand nach jedem Trade relativ zum Startkapital (die Engine rechnet linear im Kapital)
+            'equity': [[int(ts), float(balance) / start_capital]
+                       for ts, balance in zip(trade_log['timestamp'].astype(np.int64), trade_log['balance'])],
+        })
+    hits, misses = get_evaluation_cache(evaluation_cache_path).take_stats() if evaluation_cache_path else (0, 0)
+    result.update({'cache_hits': hits, 'cache_misses': misses, 'seconds': round(time.perf_counter() - started, 2)})
+    return result
+
+
+# Zustand der Pool-Worker: angehängte Datensätze je Segment
+WORKER_DATASETS = {}
+
+def _run_fold_task(task):
+    descriptor, symbol, timeframe, fold, config, evaluation_cache_path = task
+    if descriptor['name'] not in WORKER_DATASETS:
+        WORKER_DATASETS[descriptor['name']] = SharedDataset.attach(descriptor)
+    result = run_fold(WORKER_DATASETS[descriptor['name']], symbol, timeframe, fold, config, evaluation_cache_path)
+    return symbol, timeframe, result
+
+
+def stitch_equity(folds, start_capital):
+    """
+    Verkettet die Testfenster zu einer Out-of-Sample-Kurve: jedes Fenster startet mit dem Endstand des
+    vorherigen. Offene Positionen am Ende eines Testfensters zählen nicht.
+    """
+    rows, factor = [], 1.0
+    for fold in folds:
+        rows.append((fold['test'][0], start_capital * factor, fold['fold']))
+        for ts, relative in fold['equity']:
+            rows.append((_iso(ts), start_capital * factor * relative, fold['fold']))
+        if fold['equity']:
+            factor *= fold['equity'][-1][1]
+    if folds:
+        rows.append((folds[-1]['test'][1], start_capital * factor, folds[-1]['fold']))
+    equity = pd.DataFrame(rows, columns=['timestamp', 'equity', 'fold'])
+    peak = equity['equity'].cummax()
+    max_drawdown = float(((peak - equity['equity']) / peak).max() * 100) if len(equity) else 0.0
+    return equity, (factor - 1) * 100, max_drawdown
+
+
+def result_files(symbol, timeframe, output_dir=WALK_FORWARD_DIR):
+    name = f"wf_{symbol.split(':')[0].replace('/', '-')}_{timeframe}"
+    return os.path.join(output_dir, f"{name}.json"), os.path.join(output_dir, f"{name}_equity.csv")
+
+
+def report(symbol, timeframe, folds, config, output_dir=WALK_FORWARD_DIR):
+    """Schreibt Folds (JSON) und Equity-Kurve (CSV) und gibt die Übersicht aus."""
+    json_file, csv_file = result_files(symbol, timeframe, output_dir)
+    equity, total_pnl, max_drawdown = stitch_equity(folds, config['start_capital'])
+    _write_json(json_file, {'symbol': symbol, 'timeframe': timeframe, 'config': config, 'folds': folds,
+                            'oos_pnl_pct': total_pnl, 'oos_max_drawdown_pct': max_drawdown}, indent=4)
+    tmp_path = f"{csv_file}.tmp"
+    equity.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_file)
+
+    print(f"\n===== Walk-Forward {symbol} ({timeframe}): {len(folds)} Folds =====")
+    print("  {:>4} | {:<16} | {:<16} | {:<4} | {:>7} | {:<26} | {:>10} | {:>9} | {:>6}".format(
+        "Fold", "Training ab", "Test ab", "Typ", "Periode", "Envelopes", "Train-PnL", "Test-PnL", "Trades"))
+    for fold in folds:
+        params = fold['params'] or {}
+        envelopes = ', '.join(f"{e:g}" for e in params.get('envelopes_pct', [])) or '-'
+        train_pnl = f"{fold['train_pnl_pct']:+.1f} %" if fold['train_pnl_pct'] is not None else '-'
+        print("  {:>4} | {:<16} | {:<16} | {:<4} | {:>7} | {:<26} | {:>10} | {:>9} | {:>6}".format(
+            fold['fold'], fold['train'][0], fold['test'][0], params.get('average_type', '-'), params.get('average_period', '-'),
+            envelopes, train_pnl, f"{fold['test_pnl_pct']:+.1f} %", fold['test_trades']))
+    positive = sum(fold['test_pnl_pct'] > 0 for fold in folds)
+    print(f"  Out-of-Sample gesamt: {total_pnl:+.2f} %, max. Drawdown {max_drawdown:.2f} %, "
+          f"{sum(fold['test_trades'] for fold in folds)} Trades, {positive}/{len(folds)} Folds positiv")
+    print(f"  Folds: {json_file}\n  Equity-Kurve: {csv_file}")
+
+
+def main(config, n_jobs, output_dir=WALK_FORWARD_DIR, use_evaluation_cache=True):
+    print("\n--- Walk-Forward-Optimierung (Stufe 1 + 2 je Trainingsfenster, Bewertung im Testfenster) ---")
+    evaluation_cache_path = DEFAULT_EVALUATION_DB if use_evaluation_cache else None
+    warmup_start = (pd.Timestamp(config['start_date']) - pd.Timedelta(days=WARMUP_DAYS)).strftime('%Y-%m-%d')
+    datasets, folds_by_series, tasks = {}, {}, []
+    started = time.perf_counter()
+    try:
+        for symbol_short in config['symbols']:
+            for timeframe in config['timeframes']:
+                symbol = f"{symbol_short.upper()}/USDT:USDT"
+                data = load_data(symbol, timeframe, warmup_start, config['end_date'])
+                if data.empty:
+                    print(f"Keine Daten für {symbol} ({timeframe}). Überspringe.")
+                    continue
+                # Indikatoren einmal über die ganze Historie; die Folds lesen nur Ausschnitte davon
+                keys = [(avg_type, period, ATR_PERIOD, None) for avg_type in config['avg_types'] for period in AVERAGE_PERIODS]
+                dataset = SharedDataset.publish(data, keys)
+                datasets[(symbol, timeframe)] = dataset
+                folds = make_folds(dataset.timestamps, config['start_date'], config['end_date'],
+                                   config['train_days'], config['test_days'], config['step_days'])
+                if not folds:
+                    print(f"{symbol} ({timeframe}): Zeitraum zu kurz für ein Trainings- und Testfenster.")
+                    continue
+                # Folds mit gleicher Kennung aus dem letzten Lauf übernehmen (z.B. nächtlich nur die neuen rechnen)
+                previous = {fold.get('key'): fold for fold in (_read_json(result_files(symbol, timeframe, output_dir)[0]) or {}).get('folds', [])}
+                results = folds_by_series[(symbol, timeframe)] = {}
+                for fold in folds:
+                    fold['key'] = fold_key(fold, SliceSource(dataset, *fold['train_rows']), SliceSource(dataset, *fold['test_rows']), config)
+                    if fold['key'] in previous:
+                        results[fold['fold']] = previous[fold['key']]
+                    else:
+                        tasks.append((dataset.descriptor(), symbol, timeframe, fold, config, evaluation_cache_path))
+
+        reused = sum(len(results) for results in folds_by_series.values())
+        print(f"{len(tasks)} Fold(s) zu rechnen, {reused} aus früheren Läufen übernommen, {n_jobs} Prozess(e).")
+        hits = misses = 0
+        if tasks:
+            with tqdm(total=len(tasks), desc="Folds") as pbar:
+                if n_jobs > 1:
+                    with Pool(min(n_jobs, len(tasks))) as pool:
+                        for symbol, timeframe, result in pool.imap_unordered(_run_fold_task, tasks):
+                            folds_by_series[(symbol, timeframe)][result['fold']] = result
+                            hits, misses = hits + result['cache_hits'], misses + result['cache_misses']
+                            pbar.update(1)
+                else:
+                    for descriptor, symbol, timeframe, fold, _, _ in tasks:
+                        result = run_fold(datasets[(symbol, timeframe)], symbol, timeframe, fold, config, evaluation_cache_path)
+                        folds_by_series[(symbol, timeframe)][result['fold']] = result
+                        hits, misses = hits + result['cache_hits'], misses + result['cache_misses']
+                        pbar.update(1)
+    finally:
+        for dataset in datasets.values():
+            dataset.close_segment()
+
+    for (symbol, timeframe), results in folds_by_series.items():
+        report(symbol, timeframe, [results[index] for index in sorted(results)], config, output_dir)
+    if use_evaluation_cache and tasks:
+        print(f"\nBewertungs-Cache (Stufe 1): {format_hit_rate(hits, misses)}")
+    print(f"Walk-Forward beendet nach {format_time(time.perf_counter() - started)}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-Forward-Optimierung mit rollierenden Trainings- und Testfenstern.")
+    parser.add_argument('--job-spec', required=True, help='JSON-Datei wie für Stufe 1, zusätzlich train_days, test_days, step_days, trials, refine_top.')
+    parser.add_argument('--jobs', type=int, default=1, help='Anzahl der Prozesse (Folds laufen parallel).')
+    parser.add_argument('--gen', type=int, default=DEFAULT_GENERATIONS, help='Standard-Anzahl der Generationen je Fold.')
+    parser.add_argument('--output-dir', default=WALK_FORWARD_DIR, help='Verzeichnis für Fold-Ergebnisse und Equity-Kurven.')
+    parser.add_argument('--no-eval-cache', action='store_true', help='Bewertungs-Cache (evaluation_cache.db) nicht verwenden.')
+    args = parser.parse_args()
+    try:
+        job_config = load_job_spec(args.job_spec, args.gen, WALK_FORWARD_DEFAULTS)
+        job_config.update({key: int(job_config[key]) for key in ('train_days', 'test_days', 'trials', 'refine_top')})
+        job_config['step_days'] = int(job_config['step_days']) if job_config['step_days'] else None
+    except Exception as e:
+        parser.error(str(e))
+    main(job_config, max(1, args.jobs), args.output_dir, use_evaluation_cache=not args.no_eval_cache)
@@ -0,0 +1,4 @@
+# Passe den Pfad an dein System an, falls nötig
+# Alle Konfigurationen aus strategies/envelope/configs/*.json in einem Prozess
+source /home/ubuntu/LiveTradingBots/code/.venv/bin/activate
+python3 /home/ubuntu/LiveTradingBots/code/strategies/envelope/run_multi.py
@@ -3,17 +3,22 @@
 import os
 import sys
 import json
+import time
 import logging
+import argparse
 import pandas as pd
 import traceback
-import sqlite3
+from contextlib import contextmanager
 
 PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..', '..', '..')
 sys.path.append(os.path.join(PROJECT_ROOT, 'code'))
 
 from utilities.bitget_futures import BitgetFutures
-from utilities.strategy_logic import calculate_envelope_indicators
-from utilities.telegram_handler import send_telegram_message
+from utilities.streaming_indicators import StreamingEnvelopeIndicators
+from utilities.order_reconciler import OrderReconciler, reserved_margin, DEFAULT_PRICE_TOLERANCE_PCT, DEFAULT_AMOUNT_TOLERANCE_PCT
+from utilities.telegram_handler import queue_telegram_message
+from utilities.state_store import StateStore, KIND_CYCLE, KIND_ORDER, KIND_FILL, KIND_CLOSE
+from utilities.metrics import metrics, enable_metrics, PHASE
 
 LOG_DIR = os.path.join(PROJECT_ROOT, 'logs')
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -21,128 +26,216 @@ LOG_FILE = os.path.join(LOG_DIR, 'livetradingbot.log')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s UTC: %(message)s', datefmt='%Y-%m-%d %H:%M:%S', handlers=[logging.FileHandler(LOG_FILE), logging.StreamHandler()])
 logger = logging.getLogger('envelope_bot')
 
-def load_config():
-    config_path = os.path.join(os.path.dirname(__file__), 'config.json')
-    with open(config_path, 'r') as f:
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'config.json')
+STATE_DIR = os.path.dirname(__file__)
+WARMUP_CANDLES = 200
+
+def load_config(path=CONFIG_FILE):
+    with open(path, 'r') as f:
         return json.load(f)
 
-params = load_config()
-SYMBOL = params['market']['symbol']
-DB_FILE = os.path.join(os.path.dirname(__file__), f"bot_state_{SYMBOL.replace('/', '-')}.db")
-
-def setup_database():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bot_state (
-            symbol TEXT PRIMARY KEY,
-            status TEXT NOT NULL,
-            last_side TEXT
-        )
-    ''')
-    cursor.execute("INSERT OR IGNORE INTO bot_state (symbol, status, last_side) VALUES (?, ?, ?)",
-                   (SYMBOL, 'ok_to_trade', None))
-    conn.commit()
-    conn.close()
-
-def get_bot_status():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT status, last_side FROM bot_state WHERE symbol = ?", (SYMBOL,))
-    result = cursor.fetchone()
-    conn.close()
-    if result:
-        return {"status": result[0], "last_side": result[1]}
-    return {"status": "ok_to_trade", "last_side": None}
-
-def update_bot_status(status: str, last_side: str = None):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE bot_state SET status = ?, last_side = ? WHERE symbol = ?",
-                   (status, last_side, SYMBOL))
-    conn.commit()
-    conn.close()
+def load_secrets():
+    """Liest API-Zugang und Telegram-Konfiguration aus secret.json: (api_setup, bot_token, chat_id)."""
+    key_path = os.path.abspath(os.path.join(PROJECT_ROOT, 'secret.json'))
+    with open(key_path, "r") as f: secrets = json.load(f)
+    api_setup = secrets['envelope']
+    telegram_config = secrets.get('telegram', {})
+    return api_setup, telegram_config.get('bot_token'), telegram_config.get('chat_id')
 
-def main():
-    logger.info(f">>> Starte Ausführung für {SYMBOL}")
-    
-    try:
-        key_path = os.path.abspath(os.path.join(PROJECT_ROOT, 'secret.json'))
-        with open(key_path, "r") as f: secrets = json.load(f)
-        api_setup = secrets['envelope']
-        telegram_config = secrets.get('telegram', {})
-        bot_token = telegram_config.get('bot_token')
-        chat_id = telegram_config.get('chat_id')
-    except Exception as e:
-        logger.critical(f"Fehler beim Laden der API-Schlüssel: {e}")
-        sys.exit(1)
+class EnvelopeBot:
+    """
+    Ein Handelszyklus (offene Orders → Marktdaten → Indikatoren → Orderabgleich) für ein Symbol.
+    Status und Journal liegen im gemeinsamen `StateStore`, der Indikator-Snapshot pro Symbol in einer eigenen
+    Datei; Börsen-Session und Store werden übergeben und können von mehreren Bots gleichzeitig genutzt werden.
+    """
 
-    bitget = BitgetFutures(api_setup)
-    setup_database()
-    
-    try:
-        timeframe = params['market']['timeframe']
-        
-        logger.info("Storniere alte Limit-Orders...")
-        orders = bitget.fetch_open_orders(SYMBOL)
-        for order in orders:  
-            bitget.cancel_order(order['id'], SYMBOL)
-
-        logger.info("Storniere alte Trigger-Orders (TP/SL)...")
-        trigger_orders = bitget.fetch_open_trigger_orders(SYMBOL)
-        for order in trigger_orders:
-            bitget.cancel_trigger_order(order['id'], SYMBOL)
-
-        logger.info("Lade Marktdaten...")
-        data = bitget.fetch_recent_ohlcv(SYMBOL, timeframe, 200)
-        data = calculate_envelope_indicators(data, {**params['strategy'], **params['risk']})
-        latest_complete_candle = data.iloc[-2]
-        logger.info("Indikatoren berechnet.")
-
-        bot_state = get_bot_status()
+    def __init__(self, params, bitget, bot_token=None, chat_id=None, logger=logger, state_dir=STATE_DIR, store=None):
+        self.params = params
+        self.symbol = params['market']['symbol']
+        self.bitget = bitget
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.logger = logger
+        self.store = store if store is not None else StateStore()
+        symbol_filename = self.symbol.replace('/', '-')
+        # Frühere Status-Datenbank pro Symbol; wird beim ersten Start in den StateStore übernommen
+        self.db_file = os.path.join(state_dir, f"bot_state_{symbol_filename}.db")
+        self.indicator_file = os.path.join(state_dir, f"indicators_{symbol_filename}.json")
+        self.indicator_params = {**params['strategy'], **params['risk']}
+        behavior = params.get('behavior', {})
+        self.reconciler = OrderReconciler(bitget, self.symbol,
+                                          price_tolerance_pct=behavior.get('order_price_tolerance_pct', DEFAULT_PRICE_TOLERANCE_PCT),
+                                          amount_tolerance_pct=behavior.get('order_amount_tolerance_pct', DEFAULT_AMOUNT_TOLERANCE_PCT),
+                                          logger=logger)
+        self.last_reconcile = None
+
+    def notify(self, message):
+        # Nur einreihen; gesendet wird im Hintergrund, damit Telegram den Orderpfad nicht verzögert
+        queue_telegram_message(self.bot_token, self.chat_id, message)
+
+    def setup_database(self):
+        self.store.ensure_symbol(self.symbol, legacy_db=self.db_file)
+
+    def get_bot_status(self):
+        return self.store.get_status(self.symbol)
+
+    def update_bot_status(self, status: str, last_side: str = None):
+        self.store.set_status(self.symbol, status, last_side)
+
+    def load_latest_candle(self, timeframe, indicator_params):
+        """
+        Schreibt die Indikatoren aus dem gespeicherten Zustand mit den seit dem letzten Lauf abgeschlossenen
+        Kerzen fort und gibt die letzte abgeschlossene Kerze samt Indikatoren zurück. Ohne passenden Zustand
+        (erster Lauf, geänderte Parameter, Lücke) wird wie bisher über WARMUP_CANDLES Kerzen aufgebaut.
+        """
+        timeframe_ms = self.bitget.session.parse_timeframe(timeframe) * 1000
+        indicators = StreamingEnvelopeIndicators.load(self.indicator_file, indicator_params)
+        data = None
+        if indicators is not None:
+            missing = (self.bitget.session.milliseconds() - indicators.last_timestamp) // timeframe_ms
+            if missing + 3 < WARMUP_CANDLES:
+                data = self.bitget.fetch_recent_ohlcv(self.symbol, timeframe, int(missing) + 3)
+                # Die zuletzt verarbeitete Kerze muss anschließen, sonst fehlen Kerzen im Zustand
+                if data.empty or data.index[0].value // 1_000_000 > indicators.last_timestamp + timeframe_ms:
+                    data = None
+        if data is None:
+            indicators = StreamingEnvelopeIndicators(indicator_params)
+            data = self.bitget.fetch_recent_ohlcv(self.symbol, timeframe, WARMUP_CANDLES)
+
+        # Die letzte Kerze ist noch nicht abgeschlossen
+        with metrics.span('indicators', PHASE):
+            new_candles = indicators.update_frame(data.iloc[:-1])
+            latest_complete_candle = indicators.latest_candle(data)
+        indicators.save(self.indicator_file)
+        self.logger.info(f"Indikatoren mit {new_candles} neuen Kerze(n) fortgeschrieben.")
+        return latest_complete_candle
+
+    @contextmanager
+    def phase(self, name, timings):
+        """Misst eine Phase des Zyklus: für das Journal (`timings`) und, falls eingeschaltet, für die Metriken."""
+        phase_start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - phase_start
+            timings[f'{name}_ms'] = elapsed * 1000
+            metrics.observe(PHASE, name, elapsed, error)
+
+    def run(self, latest_complete_candle=None):
+        """Ein Zyklus. Der Event-Modus übergibt die gerade abgeschlossene Kerze samt Indikatoren direkt."""
+        with metrics.cycle(self.symbol) as cycle_metrics:
+            error = self._run(latest_complete_candle)
+            if cycle_metrics is not None:
+                cycle_metrics.error = error
+
+    def _run(self, latest_complete_candle):
+        self.setup_database()
+        self.last_reconcile = None
+        cycle_start = time.perf_counter()
+        timings = {}
+        error = None
+
+        try:
+            timeframe = self.params['market']['timeframe']
+
+            # Offene Orders werden nicht mehr pauschal storniert, sondern am Ende des Zyklus abgeglichen
+            self.logger.info("Lade offene Limit- und Trigger-Orders...")
+            with self.phase('fetch_orders', timings):
+                open_orders = self.bitget.fetch_open_orders(self.symbol)
+                open_trigger_orders = self.bitget.fetch_open_trigger_orders(self.symbol)
+
+            if latest_complete_candle is None:
+                self.logger.info("Lade Marktdaten...")
+                with self.phase('market_data', timings):
+                    latest_complete_candle = self.load_latest_candle(timeframe, self.indicator_params)
+                self.logger.info("Indikatoren berechnet.")
+
+            with self.phase('plan', timings):
+                desired_orders, desired_trigger_orders = self.plan_orders(latest_complete_candle, open_orders)
+
+            with self.phase('reconcile', timings):
+                self.last_reconcile = self.reconciler.reconcile(open_orders, open_trigger_orders, desired_orders, desired_trigger_orders)
+
+        except Exception as e:
+            error = str(e)
+            self.logger.error(f"Ein unerwarteter Fehler ist aufgetreten: {e}", exc_info=True)
+            error_message = f"🚨 KRITISCHER FEHLER im Bot für *{self.symbol}*!\n\n`{traceback.format_exc()}`"
+            self.notify(error_message[:4000])
+
+        self.record_cycle((time.perf_counter() - cycle_start) * 1000, timings, error)
+        return error
+
+    def record_cycle(self, duration_ms, timings, error=None):
+        """Schreibt den Zyklus samt Phasenzeiten und die dabei ausgeführten Order-Änderungen ins Journal."""
+        stats = dict(self.reconciler.last_stats or {})
+        orders = stats.pop('orders', [])
+        entries = [(self.symbol, KIND_ORDER, order, None) for order in orders]
+        entries.append((self.symbol, KIND_CYCLE, {'status': self.get_bot_status()['status'],
+                                                  'timings': {phase: round(ms, 2) for phase, ms in timings.items()},
+                                                  'reconcile': stats or None, 'error': error}, duration_ms))
+        try:
+            self.store.record_many(entries)
+        except Exception as e:
+            # Das Journal ist Diagnose; ein Schreibfehler darf den Bot nicht stoppen
+            self.logger.warning(f"Journal konnte nicht geschrieben werden: {e}")
+
+    def plan_orders(self, latest_complete_candle, open_orders):
+        """
+        Führt die Statuslogik aus und gibt die Orders zurück, die nach diesem Zyklus offen sein sollen:
+        (Grid-Limit-Orders, TP/SL-Trigger-Orders). Alles andere wird beim Abgleich storniert.
+        """
+        desired_orders, desired_trigger_orders = [], []
+
+        bot_state = self.get_bot_status()
         current_status = bot_state['status']
         last_side = bot_state['last_side']
-        
-        positions = bitget.fetch_open_positions(SYMBOL)
+
+        positions = self.bitget.fetch_open_positions(self.symbol)
         open_position = positions[0] if positions else None
 
         if open_position:
             side = open_position['side']
-            
+
             if current_status == 'ok_to_trade':
                 entry_price = float(open_position['entryPrice'])
                 contracts = float(open_position['contracts'])
                 leverage = float(open_position['leverage'])
-                message = f"🔥 Position für *{SYMBOL}* eröffnet!\n- Seite: {side.upper()}\n- Einstieg: ${entry_price:.4f}\n- Menge: {contracts} {SYMBOL.split('/')[0]}\n- Hebel: {int(leverage)}x"
-                send_telegram_message(bot_token, chat_id, message)
-                logger.info(message)
-                update_bot_status("in_trade", side)
+                message = f"🔥 Position für *{self.symbol}* eröffnet!\n- Seite: {side.upper()}\n- Einstieg: ${entry_price:.4f}\n- Menge: {contracts} {self.symbol.split('/')[0]}\n- Hebel: {int(leverage)}x"
+                self.notify(message)
+                self.logger.info(message)
+                self.update_bot_status("in_trade", side)
+                self.store.record(self.symbol, KIND_FILL, {'side': side, 'entry_price': entry_price,
+                                                           'contracts': contracts, 'leverage': leverage})
 
-            logger.info(f"{side} Position ist offen. Verwalte Take-Profit und Stop-Loss.")
+            self.logger.info(f"{side} Position ist offen. Verwalte Take-Profit und Stop-Loss.")
             close_side = 'sell' if side == 'long' else 'buy'
             amount = float(open_position['contracts'])
             avg_entry = float(open_position['entryPrice'])
-            
-            sl_price = avg_entry * (1 - params['risk']['stop_loss_pct']/100) if side == 'long' else avg_entry * (1 + params['risk']['stop_loss_pct']/100)
+
+            sl_price = avg_entry * (1 - self.params['risk']['stop_loss_pct']/100) if side == 'long' else avg_entry * (1 + self.params['risk']['stop_loss_pct']/100)
             tp_price = latest_complete_candle['average']
 
-            bitget.place_trigger_market_order(SYMBOL, close_side, amount, tp_price, reduce=True)
-            bitget.place_trigger_market_order(SYMBOL, close_side, amount, sl_price, reduce=True)
-            logger.info(f"TP-Order @{tp_price:.4f} und SL-Order @{sl_price:.4f} platziert/aktualisiert.")
+            desired_trigger_orders.append(self.reconciler.trigger_order(close_side, amount, tp_price))
+            desired_trigger_orders.append(self.reconciler.trigger_order(close_side, amount, sl_price))
+            self.logger.info(f"TP-Order @{tp_price:.4f} und SL-Order @{sl_price:.4f} vorgesehen.")
 
         elif current_status == 'in_trade':
             side = last_side
             last_price = latest_complete_candle['close']
             resume_price = latest_complete_candle['average']
-            
+
             reason = "Stop-Loss / Manuell"
             if (side == 'long' and last_price >= resume_price) or \
                (side == 'short' and last_price <= resume_price):
                 reason = "Take-Profit"
-            
+
             # <<< ÄNDERUNG: Cooldown-Option aus config.json lesen >>>
-            use_cooldown = params.get('behavior', {}).get('use_cooldown_after_sl', True)
-            
+            use_cooldown = self.params.get('behavior', {}).get('use_cooldown_after_sl', True)
+
             if reason == "Stop-Loss / Manuell" and use_cooldown:
                 next_step_info = (
                     f"ℹ️ **Nächster Schritt:**\n"
@@ -151,94 +244,117 @@ def main():
                     f"von ca. *${resume_price:.4f}* angenähert hat."
                 )
                 new_status = "waiting_for_reentry"
-                logger.info("Position durch SL geschlossen. Wechsle in den Cooldown-Status.")
+                self.logger.info("Position durch SL geschlossen. Wechsle in den Cooldown-Status.")
             else:
                 next_step_info = (
                     f"ℹ️ **Nächster Schritt:**\n"
                     f"Der Bot ist sofort wieder bereit für neue Trades (Cooldown ist deaktiviert)."
                 )
                 new_status = "ok_to_trade"
-                logger.info(f"Position durch {reason} geschlossen. Bot ist sofort wieder bereit.")
+                self.logger.info(f"Position durch {reason} geschlossen. Bot ist sofort wieder bereit.")
+
+            message = (f"✅ Position für *{self.symbol}* ({side}) geschlossen.\n\n- Grund: {reason}\n\n{next_step_info}")
+            self.notify(message)
+            self.update_bot_status(new_status, side)
+            self.store.record(self.symbol, KIND_CLOSE, {'side': side, 'reason': reason, 'price': float(last_price)})
 
-            message = (f"✅ Position für *{SYMBOL}* ({side}) geschlossen.\n\n- Grund: {reason}\n\n{next_step_info}")
-            send_telegram_message(bot_token, chat_id, message)
-            update_bot_status(new_status, side)
-        
         elif current_status == 'waiting_for_reentry':
             last_price = latest_complete_candle['close']
             resume_price = latest_complete_candle['average']
-            
+
             if (last_side == 'long' and last_price >= resume_price) or \
                (last_side == 'short' and last_price <= resume_price):
-                logger.info("Preis ist zum Mittelwert zurückgekehrt. Status wird auf 'ok_to_trade' zurückgesetzt.")
-                update_bot_status("ok_to_trade", last_side)
-                current_status = "ok_to_trade" 
+                self.logger.info("Preis ist zum Mittelwert zurückgekehrt. Status wird auf 'ok_to_trade' zurückgesetzt.")
+                self.update_bot_status("ok_to_trade", last_side)
+                current_status = "ok_to_trade"
             else:
-                logger.info(f"Status ist 'waiting_for_reentry'. Warte auf Rückkehr zum Mittelwert.")
-                return
+                self.logger.info(f"Status ist 'waiting_for_reentry'. Warte auf Rückkehr zum Mittelwert.")
+                return desired_orders, desired_trigger_orders
 
         if current_status == "ok_to_trade":
-            logger.info("Keine Position offen, prüfe auf neue Einstiege.")
-            
-            base_leverage = params['risk']['base_leverage']
-            target_atr_pct = params['risk']['target_atr_pct']
-            max_leverage = params['risk']['max_leverage']
+            self.logger.info("Keine Position offen, prüfe auf neue Einstiege.")
+
+            base_leverage = self.params['risk']['base_leverage']
+            target_atr_pct = self.params['risk']['target_atr_pct']
+            max_leverage = self.params['risk']['max_leverage']
             current_atr_pct = latest_complete_candle['atr_pct']
-            
+
             leverage = base_leverage * (target_atr_pct / current_atr_pct) if pd.notna(current_atr_pct) and current_atr_pct > 0 else base_leverage
             leverage = int(round(max(1.0, min(leverage, max_leverage))))
-            
-            margin_mode = params['risk']['margin_mode']
-            logger.info(f"Berechneter Hebel: {leverage}x. Margin-Modus: {margin_mode}")
-            
-            free_balance = bitget.fetch_balance()['USDT']['free']
-            capital_to_use = free_balance * (params['risk']['balance_fraction_pct'] / 100.0)
-            
-            num_grids = len(params['strategy']['envelopes_pct'])
+
+            margin_mode = self.params['risk']['margin_mode']
+            self.logger.info(f"Berechneter Hebel: {leverage}x. Margin-Modus: {margin_mode}")
+
+            # Margin der noch offenen eigenen Grid-Orders zählt mit, als wären sie storniert
+            free_balance = self.bitget.fetch_balance()['USDT']['free'] + reserved_margin(open_orders, leverage)
+            capital_to_use = free_balance * (self.params['risk']['balance_fraction_pct'] / 100.0)
+
+            num_grids = len(self.params['strategy']['envelopes_pct'])
             if num_grids == 0:
-                logger.warning("Keine 'envelopes_pct' in der Konfiguration gefunden.")
-                return
-            
-            num_sides_active = (1 if params['behavior'].get('use_longs', False) else 0) + (1 if params['behavior'].get('use_shorts', False) else 0)
+                self.logger.warning("Keine 'envelopes_pct' in der Konfiguration gefunden.")
+                return desired_orders, desired_trigger_orders
+
+            num_sides_active = (1 if self.params['behavior'].get('use_longs', False) else 0) + (1 if self.params['behavior'].get('use_shorts', False) else 0)
             if num_sides_active == 0:
-                logger.warning("Beide Richtungen (long/short) deaktiviert.")
-                return
+                self.logger.warning("Beide Richtungen (long/short) deaktiviert.")
+                return desired_orders, desired_trigger_orders
 
             capital_per_side = capital_to_use / num_sides_active
             notional_amount_per_order = (capital_per_side / num_grids) * leverage
-            
-            market_info = bitget.get_market_info(SYMBOL)
+
+            market_info = self.bitget.get_market_info(self.symbol)
             min_order_amount = market_info.get('min_amount', 1.0)
-            coin_name = SYMBOL.split('/')[0]
+            coin_name = self.symbol.split('/')[0]
 
-            if params['behavior'].get('use_longs', True):
+            if self.params['behavior'].get('use_longs', True):
                 for i in range(num_grids):
                     entry_price = latest_complete_candle[f'band_low_{i + 1}']
                     amount_calculated = notional_amount_per_order / entry_price
-                    
+
                     if amount_calculated >= min_order_amount:
-                        amount = float(bitget.amount_to_precision(SYMBOL, amount_calculated))
-                        bitget.place_limit_order(SYMBOL, 'buy', amount, entry_price, leverage=leverage, margin_mode=margin_mode)
-                        logger.info(f"Platziere Long-Grid {i+1}: {amount} {coin_name} @{entry_price:.4f}")
+                        order = self.reconciler.limit_order('buy', amount_calculated, entry_price, leverage, margin_mode)
+                        desired_orders.append(order)
+                        self.logger.info(f"Long-Grid {i+1}: {order['amount']} {coin_name} @{entry_price:.4f}")
                     else:
-                        logger.warning(f"Long-Order übersprungen: Menge ({amount_calculated:.4f}) unter Minimum ({min_order_amount}).")
+                        self.logger.warning(f"Long-Order übersprungen: Menge ({amount_calculated:.4f}) unter Minimum ({min_order_amount}).")
 
-            if params['behavior'].get('use_shorts', True):
+            if self.params['behavior'].get('use_shorts', True):
                 for i in range(num_grids):
                     entry_price = latest_complete_candle[f'band_high_{i + 1}']
                     amount_calculated = notional_amount_per_order / entry_price
 
                     if amount_calculated >= min_order_amount:
-                        amount = float(bitget.amount_to_precision(SYMBOL, amount_calculated))
-                        bitget.place_limit_order(SYMBOL, 'sell', amount, entry_price, leverage=leverage, margin_mode=margin_mode)
-                        logger.info(f"Platziere Short-Grid {i+1}: {amount} {coin_name} @{entry_price:.4f}")
+                        order = self.reconciler.limit_order('sell', amount_calculated, entry_price, leverage, margin_mode)
+                        desired_orders.append(order)
+                        self.logger.info(f"Short-Grid {i+1}: {order['amount']} {coin_name} @{entry_price:.4f}")
                     else:
-                        logger.warning(f"Short-Order übersprungen: Menge ({amount_calculated:.4f}) unter Minimum ({min_order_amount}).")
+                        self.logger.warning(f"Short-Order übersprungen: Menge ({amount_calculated:.4f}) unter Minimum ({min_order_amount}).")
+
+        return desired_orders, desired_trigger_orders
 
+def main():
+    parser = argparse.ArgumentParser(description="Ein Zyklus des Envelope-Bots.")
+    parser.add_argument('--metrics', action='store_true', help='Phasen- und Aufrufzeiten nach metrics/ schreiben (Prometheus + JSONL).')
+    args = parser.parse_args()
+
+    params = load_config()
+    symbol = params['market']['symbol']
+    if args.metrics:
+        enable_metrics(f"envelope_{symbol.split(':')[0].replace('/', '-')}")
+    logger.info(f">>> Starte Ausführung für {symbol}")
+    
+    try:
+        api_setup, bot_token, chat_id = load_secrets()
     except Exception as e:
-        logger.error(f"Ein unerwarteter Fehler ist aufgetreten: {e}", exc_info=True)
-        error_message = f"🚨 KRITISCHER FEHLER im Bot für *{SYMBOL}*!\n\n`{traceback.format_exc()}`"
-        send_telegram_message(bot_token, chat_id, error_message[:4000])
+        logger.critical(f"Fehler beim Laden der API-Schlüssel: {e}")
+        sys.exit(1)
+
+    bitget = BitgetFutures(api_setup)
+    store = StateStore()
+    try:
+        EnvelopeBot(params, bitget, bot_token, chat_id, store=store).run()
+    finally:
+        store.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+# code/strategies/envelope/run_live.py
+
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(__file__))
+from run import EnvelopeBot, BitgetFutures, StateStore, StreamingEnvelopeIndicators, load_config, load_secrets, logger
+from run_multi import SymbolLogger, find_configs, DEFAULT_WORKERS
+from utilities.market_feed import BitgetWebsocketFeed, CANDLE_CLOSED, ORDER_UPDATE
+from utilities.metrics import enable_metrics
+
+# Ohne Ereignis wird spätestens so oft ein normaler Zyklus ausgeführt (Absicherung gegen verlorene Ereignisse)
+RESYNC_SECONDS = 15 * 60
+
+
+class EventDrivenRunner:
+    """
+    Event-Modus des Envelope-Bots: statt auf Cron zu warten, reagiert er auf den Feed. Bei Kerzenschluss
+    werden die Indikatoren im Speicher um genau diese Kerze fortgeschrieben und die Grid-Orders sofort neu
+    abgeglichen; bei einer Ausführung (Grid-Einstieg oder TP/SL) wird sofort ein Zyklus gestartet, der
+    TP/SL setzt bzw. den Abschluss verarbeitet. Ereignisse, die sich während eines Zyklus anstauen,
+    werden pro Symbol zu einem Zyklus zusammengefasst; die Zyklen mehrerer Symbole laufen parallel.
+    """
+
+    def __init__(self, bots, feed, logger=logger, resync_seconds=RESYNC_SECONDS, max_workers=DEFAULT_WORKERS):
+        self.bots = {bot.symbol: bot for bot in bots}
+        self.feed = feed
+        self.logger = logger
+        self.resync_seconds = resync_seconds
+        self.indicators = {}
+        self.timeframe_ms = {}
+        self.last_candle = {}
+        self.last_cycle = {}
+        self.latencies_ms = []
+        self.max_workers = max_workers
+
+    def start(self):
+        """Erster Zyklus über REST (baut den Indikator-Zustand auf), danach Feed abonnieren."""
+        for symbol, bot in self.bots.items():
+            timeframe = bot.params['market']['timeframe']
+            self.timeframe_ms[symbol] = bot.bitget.session.parse_timeframe(timeframe) * 1000
+            self._resync(symbol)
+            self.feed.subscribe(symbol, timeframe)
+        self.feed.start()
+
+    def _resync(self, symbol):
+        bot = self.bots[symbol]
+        try:
+            self.last_candle[symbol] = bot.load_latest_candle(bot.params['market']['timeframe'], bot.indicator_params)
+        except Exception as e:
+            self.logger.error(f"[{symbol}] Marktdaten konnten nicht geladen werden: {e}")
+            self.last_candle[symbol] = None
+        try:
+            bot.run(latest_complete_candle=self.last_candle[symbol])
+            self.indicators[symbol] = StreamingEnvelopeIndicators.load(bot.indicator_file, bot.indicator_params)
+        except Exception as e:
+            # Wie in run_multi: ein Symbol darf die anderen (und die Hauptschleife) nicht aufhalten.
+            # Ohne Indikator-Zustand wird beim nächsten Ereignis erneut über REST abgeglichen.
+            self.logger.error(f"[{symbol}] Zyklus abgebrochen: {e}", exc_info=True)
+            self.indicators.pop(symbol, None)
+        self.last_cycle[symbol] = time.monotonic()
+
+    def on_candle_closed(self, symbol, candle):
+        """Schreibt die Indikatoren fort; gibt False zurück, wenn die Kerze nicht anschließt (dann Resync nötig)."""
+        indicators = self.indicators.get(symbol)
+        ts, open_, high, low, close, volume = candle
+        if indicators is None:
+            return False
+        if ts <= indicators.last_timestamp:
+            return True
+        if ts != indicators.last_timestamp + self.timeframe_ms[symbol]:
+            return False
+        indicators.update(ts, high, low, close)
+        indicators.save(self.bots[symbol].indicator_file)
+        row = {'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume, **indicators.values()}
+        self.last_candle[symbol] = pd.Series(row, dtype='float64', name=pd.Timestamp(ts, unit='ms', tz='UTC'))
+        return True
+
+    def handle(self, events):
+        """Verarbeitet einen Schwung Ereignisse: Indikatoren je Kerze, danach höchstens ein Zyklus pro Symbol."""
+        pending = {}
+        for event in events:
+            if event.symbol not in self.bots:
+                continue
+            if event.kind == CANDLE_CLOSED:
+                try:
+                    contiguous = self.on_candle_closed(event.symbol, event.data)
+                except Exception as e:
+                    self.logger.error(f"[{event.symbol}] Kerze konnte nicht verarbeitet werden: {e}", exc_info=True)
+                    contiguous = False
+                if not contiguous:
+                    pending[event.symbol] = 'resync'
+                    continue
+                # Latenz ab Kerzenschluss (Ende der Kerze), nicht ab Empfang
+                pending.setdefault(event.symbol, (event.data[0] + self.timeframe_ms[event.symbol]) / 1000)
+            elif event.kind == ORDER_UPDATE:
+                self.logger.info(f"[{event.symbol}] Ausführung: {event.data.get('side')} {event.data.get('filled')} @{event.data.get('average') or event.data.get('price')}")
+                pending.setdefault(event.symbol, event.received_at)
+
+        if len(pending) > 1 and self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                list(executor.map(self._cycle, pending.items()))
+        else:
+            for item in pending.items():
+                self._cycle(item)
+
+    def _cycle(self, item):
+        symbol, origin = item
+        if origin == 'resync' or self.last_candle.get(symbol) is None:
+            self.logger.info(f"[{symbol}] Kein anschließender Indikator-Zustand, Zyklus über REST.")
+            self._resync(symbol)
+            return
+        try:
+            self.bots[symbol].run(latest_complete_candle=self.last_candle[symbol])
+        except Exception as e:
+            self.logger.error(f"[{symbol}] Zyklus abgebrochen: {e}", exc_info=True)
+            return
+        self.last_cycle[symbol] = time.monotonic()
+        latency_ms = (time.time() - origin) * 1000
+        self.latencies_ms.append(latency_ms)
+        self.logger.info(f"[{symbol}] Signal → Orders: {latency_ms:.0f} ms")
+
+    def run_forever(self, poll_seconds=1.0, max_events=None, stop_when_idle=False):
+        """Hauptschleife. `max_events` / `stop_when_idle` begrenzen den Lauf (Replay)."""
+        processed = 0
+        while max_events is None or processed < max_events:
+            event = self.feed.next_event(timeout=poll_seconds)
+            if event is None:
+                if stop_when_idle:
+                    break
+                now = time.monotonic()
+                for symbol in self.bots:
+                    if now - self.last_cycle[symbol] > self.resync_seconds:
+                        self._resync(symbol)
+                continue
+            events = [event]
+            while (event := self.feed.next_event(timeout=0)) is not None:
+                events.append(event)
+            processed += len(events)
+            self.handle(events)
+        return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Envelope-Bot im Event-Modus (Websocket statt Cron).")
+    parser.add_argument('configs', nargs='*', help='Konfigurationsdateien (Standard: wie run_multi.py).')
+    parser.add_argument('--metrics', action='store_true', help='Phasen- und Aufrufzeiten nach metrics/ schreiben (Prometheus + JSONL).')
+    args = parser.parse_args()
+    if args.metrics:
+        enable_metrics('envelope_live')
+
+    configs = [load_config(path) for path in (args.configs or find_configs())]
+    try:
+        api_setup, bot_token, chat_id = load_secrets()
+    except Exception as e:
+        logger.critical(f"Fehler beim Laden der API-Schlüssel: {e}")
+        sys.exit(1)
+
+    bitget = BitgetFutures(api_setup)
+    store = StateStore()
+    bots = [EnvelopeBot(params, bitget, bot_token, chat_id, logger=SymbolLogger(logger, {'symbol': params['market']['symbol']}),
+                        store=store) for params in configs]
+    feed = BitgetWebsocketFeed(dict(api_setup), markets=bitget.markets)
+    runner = EventDrivenRunner(bots, feed)
+    logger.info(f">>> Starte Event-Modus für {len(bots)} Symbol(e)")
+    try:
+        runner.start()
+        runner.run_forever()
+    except KeyboardInterrupt:
+        logger.info("Beende Event-Modus...")
+    finally:
+        feed.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# code/strategies/envelope/run_multi.py
+
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(__file__))
+from run import EnvelopeBot, BitgetFutures, StateStore, load_config, load_secrets, logger, CONFIG_FILE
+from utilities.metrics import enable_metrics
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), 'configs')
+DEFAULT_WORKERS = 8
+
+
+class SymbolLogger(logging.LoggerAdapter):
+    """Stellt jeder Log-Zeile das Symbol voran, da die Zyklen gleichzeitig in dieselbe Datei schreiben."""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['symbol']}] {msg}", kwargs
+
+
+def find_configs(config_dir=CONFIG_DIR):
+    """Alle Symbol-Konfigurationen (*.json im Verzeichnis); ohne Verzeichnis die einzelne config.json."""
+    paths = sorted(glob.glob(os.path.join(config_dir, '*.json')))
+    return paths if paths else [CONFIG_FILE]
+
+
+def run_all(configs, bitget, bot_token=None, chat_id=None, max_workers=DEFAULT_WORKERS, store=None):
+    """
+    Führt die Zyklen aller Symbole gleichzeitig in einem begrenzten Thread-Pool aus. Alle teilen sich
+    die Börsen-Session samt Märkten und Rate-Limit sowie eine Verbindung zum StateStore; Status und
+    Indikatoren bleiben pro Symbol getrennt.
+    Gibt pro Symbol die Dauer des Zyklus in Sekunden zurück.
+    """
+    symbols = [params['market']['symbol'] for params in configs]
+    duplicates = sorted({s for s in symbols if symbols.count(s) > 1})
+    if duplicates:
+        raise ValueError(f"Symbole mehrfach konfiguriert: {', '.join(duplicates)}")
+    store = store if store is not None else StateStore()
+
+    def run_symbol(params):
+        symbol = params['market']['symbol']
+        bot_logger = SymbolLogger(logger, {'symbol': symbol})
+        start = time.time()
+        try:
+            EnvelopeBot(params, bitget, bot_token, chat_id, logger=bot_logger, store=store).run()
+        except Exception as e:
+            # Fehler außerhalb des Zyklus (z.B. Datenbank) dürfen die anderen Symbole nicht aufhalten
+            bot_logger.error(f"Zyklus abgebrochen: {e}", exc_info=True)
+        return symbol, time.time() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(configs)))) as executor:
+        return dict(executor.map(run_symbol, configs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Führt den Envelope-Bot für mehrere Symbole in einem Prozess aus.")
+    parser.add_argument('configs', nargs='*', help=f'Konfigurationsdateien (Standard: alle *.json in {CONFIG_DIR}).')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Maximal gleichzeitig laufende Symbole.')
+    parser.add_argument('--metrics', action='store_true', help='Phasen- und Aufrufzeiten nach metrics/ schreiben (Prometheus + JSONL).')
+    args = parser.parse_args()
+    if args.metrics:
+        enable_metrics('envelope_multi')
+
+    configs = [load_config(path) for path in (args.configs or find_configs())]
+    logger.info(f">>> Starte Ausführung für {len(configs)} Symbol(e)")
+    try:
+        api_setup, bot_token, chat_id = load_secrets()
+    except Exception as e:
+        logger.critical(f"Fehler beim Laden der API-Schlüssel: {e}")
+        sys.exit(1)
+
+    start = time.time()
+    # Eine Session und ein load_markets für alle Symbole
+    bitget = BitgetFutures(api_setup)
+    store = StateStore()
+    try:
+        durations = run_all(configs, bitget, bot_token, chat_id, args.workers, store)
+    finally:
+        store.close()
+    for symbol, duration in durations.items():
+        logger.info(f"{symbol}: {duration:.1f} s")
+    logger.info(f"Gesamtdauer: {time.time() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
+    logger.info("<<< Ausführung abgeschlossen\n")
@@ -0,0 +1,171 @@
+# code/strategies/envelope/run_paper.py
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(__file__))
+from run import EnvelopeBot, BitgetFutures, StateStore, StreamingEnvelopeIndicators, load_config, CONFIG_FILE, LOG_DIR, PROJECT_ROOT, WARMUP_CANDLES
+from utilities.exchange_simulator import SimulatedExchange, parse_timeframe
+
+PAPER_DIR = os.path.join(PROJECT_ROOT, 'paper')
+PAPER_CANDLES = 1000
+
+# Eigener Logger: Replay und Paper-Trading schreiben nicht ins Log des Live-Bots. Die Log-Datei legt erst
+# `main` an; beim bloßen Import (Tests, Optimierer) bleibt der Logger stumm.
+paper_logger = logging.getLogger('envelope_paper')
+paper_logger.propagate = False
+paper_logger.setLevel(logging.WARNING)
+paper_logger.addHandler(logging.NullHandler())
+
+
+class PaperEnvelopeBot(EnvelopeBot):
+    """Envelope-Bot gegen den Simulator; Benachrichtigungen landen nur im Log."""
+
+    def notify(self, message):
+        self.logger.info(message)
+
+
+class ReplayIndicators:
+    """
+    Indikatoren des Replays im Speicher: schreibt sie pro Zyklus um die neu abgeglichenen Kerzen des Simulators
+    fort und baut daraus die letzte abgeschlossene Kerze wie `EnvelopeBot.load_latest_candle`, ohne Snapshot-Datei
+    und ohne DataFrame. Der erste Aufbau nutzt wie der Bot WARMUP_CANDLES - 1 abgeschlossene Kerzen.
+    """
+
+    def __init__(self, exchange, symbol, params):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.indicators = StreamingEnvelopeIndicators(params)
+        self.next_index = None
+        # Feste Spalten: die Series wird direkt aus einem Array gebaut (deutlich billiger als aus einem Dict)
+        self.columns = pd.Index(['open', 'high', 'low', 'close', 'volume', *self.indicators.values()])
+
+    def latest_candle(self):
+        candles = self.exchange.closed_candles(self.symbol)
+        end = len(candles['ts'])
+        if self.next_index is None:
+            self.next_index = max(0, end - (WARMUP_CANDLES - 1))
+        for i in range(self.next_index, end):
+            self.indicators.update(int(candles['ts'][i]), float(candles['high'][i]), float(candles['low'][i]), float(candles['close'][i]))
+        self.next_index = end
+        if not end:
+            return None
+        row = [candles[c][end - 1] for c in ('open', 'high', 'low', 'close', 'volume')]
+        return pd.Series(np.array(row + list(self.indicators.values().values()), dtype=np.float64), index=self.columns,
+                         name=pd.Timestamp(int(candles['ts'][end - 1]), unit='ms', tz='UTC'))
+
+
+def replay(params, candles, start, end, balance=1000.0, state_dir=None, fee_pct=None, markets=None, fast=False):
+    """
+    Lässt den unveränderten Live-Zyklus über historische Kerzen laufen: pro Kerze wird die Uhr des Simulators
+    vorgestellt (Matching der abgeschlossenen Kerze) und danach ein Zyklus ausgeführt. Gibt Durchsatz,
+    Latenz-Perzentile des Zyklus und das Ergebnis zurück.
+    Mit `fast` liegen Status und Journal in einer In-Memory-Datenbank und die Indikatoren werden im Speicher
+    fortgeschrieben (kein Snapshot pro Kerze, siehe `ReplayIndicators`); Orders und Ergebnis sind dieselben.
+    """
+    symbol = params['market']['symbol']
+    timeframe = params['market']['timeframe']
+    state_dir = state_dir or tempfile.mkdtemp(prefix='envelope_replay_')
+    exchange = SimulatedExchange({symbol: candles}, timeframe, balance=balance, markets=markets,
+                                 **({'fee_pct': fee_pct} if fee_pct is not None else {}))
+    store = StateStore(':memory:' if fast else os.path.join(state_dir, 'replay.db'))
+    bot = PaperEnvelopeBot(params, exchange, logger=paper_logger, state_dir=state_dir, store=store)
+    indicators = ReplayIndicators(exchange, symbol, bot.indicator_params) if fast else None
+    tf_ms = parse_timeframe(timeframe) * 1000
+    start_ms = int(pd.Timestamp(start, tz='UTC').value // 1_000_000)
+    end_ms = int(pd.Timestamp(end, tz='UTC').value // 1_000_000)
+
+    latencies = []
+    replay_start = time.perf_counter()
+    try:
+        for now in range(start_ms - start_ms % tf_ms, end_ms, tf_ms):
+            exchange.advance_to(now)
+            cycle_start = time.perf_counter()
+            bot.run(indicators.latest_candle() if fast else None)
+            latencies.append(time.perf_counter() - cycle_start)
+    finally:
+        store.close()
+    elapsed = time.perf_counter() - replay_start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'cycles': len(latencies), 'ticks': exchange.ticks, 'seconds': elapsed,
+        'cycles_per_second': len(latencies) / elapsed if elapsed else float('inf'),
+        'latency_p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+        'latency_p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+        'equity': exchange.equity(), 'fills': len(exchange.trades),
+        'closed_pnl': sum(t['pnl'] for t in exchange.trades if t['reduceOnly']),
+    }
+
+
+def paper_cycle(params, balance=1000.0, paper_dir=PAPER_DIR):
+    """
+    Paper-Trading für einen Cron-Lauf: echte Kerzen (öffentliche Bitget-Daten) und echte Uhrzeit,
+    Orders und Positionen nur im Simulator. Dessen Zustand wird zwischen den Läufen gespeichert.
+    """
+    symbol = params['market']['symbol']
+    timeframe = params['market']['timeframe']
+    os.makedirs(paper_dir, exist_ok=True)
+    bitget = BitgetFutures()
+    candles = bitget.fetch_recent_ohlcv(symbol, timeframe, PAPER_CANDLES)
+    # Die letzte (laufende) Kerze bleibt außen vor; sie wird im nächsten Lauf abgeglichen
+    exchange = SimulatedExchange({symbol: candles.iloc[:-1]}, timeframe, balance=balance,
+                                 markets={symbol: {k: v for k, v in bitget.precision[symbol].items() if v is not None}})
+    state_file = os.path.join(paper_dir, f"exchange_{symbol.replace('/', '-')}.json")
+    # Ohne gespeicherten Zustand (erster Lauf) gibt es noch keine Orders; die Historie dient nur den Indikatoren
+    exchange.load_state(state_file)
+    exchange.advance_to(bitget.session.milliseconds())
+    store = StateStore(os.path.join(paper_dir, 'paper.db'))
+    try:
+        PaperEnvelopeBot(params, exchange, logger=paper_logger, state_dir=paper_dir, store=store).run()
+    finally:
+        store.close()
+    exchange.save(state_file)
+    return exchange
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay (Benchmark) oder Paper-Trading des Envelope-Bots gegen den Exchange-Simulator.")
+    parser.add_argument('--config', default=CONFIG_FILE, help='Konfigurationsdatei des Bots.')
+    parser.add_argument('--paper', action='store_true', help='Ein Paper-Trading-Zyklus mit Live-Kerzen (für Cron).')
+    parser.add_argument('--start', help='Beginn des Replays (YYYY-MM-DD).')
+    parser.add_argument('--end', help='Ende des Replays (YYYY-MM-DD).')
+    parser.add_argument('--balance', type=float, default=1000.0, help='Startguthaben in USDT.')
+    parser.add_argument('--fast', action='store_true',
+                        help='Replay ohne Indikator-Snapshot-Datei und mit In-Memory-Journal (gleiche Orders, rund 2000 statt einiger hundert Zyklen/s).')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Zyklus-Logs nach logs/paper.log schreiben.')
+    args = parser.parse_args()
+    paper_logger.addHandler(logging.FileHandler(os.path.join(LOG_DIR, 'paper.log')))
+    if args.verbose:
+        paper_logger.setLevel(logging.INFO)
+
+    params = load_config(args.config)
+    if args.paper:
+        exchange = paper_cycle(params, args.balance)
+        print(f"Paper-Konto: {exchange.equity():.2f} USDT, offene Orders: {len(exchange.open_orders)}")
+        return
+
+    if not args.start or not args.end:
+        parser.error("Für das Replay werden --start und --end benötigt.")
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+    from analysis.backtest import load_data
+    # Vorlauf für den Indikator-Aufbau, wie im Backtest
+    warmup_start = (pd.Timestamp(args.start) - pd.Timedelta(days=50)).strftime('%Y-%m-%d')
+    candles = load_data(params['market']['symbol'], params['market']['timeframe'], warmup_start, args.end)
+    if candles.empty:
+        print("Keine Kerzen geladen.")
+        return
+    result = replay(params, candles, args.start, args.end, balance=args.balance, fast=args.fast)
+    print(f"{result['cycles']} Zyklen / {result['ticks']} Kerzen in {result['seconds']:.2f} s "
+          f"({result['cycles_per_second']:.0f} Zyklen/s)")
+    print(f"Zyklus-Latenz: p50 {result['latency_p50_ms']:.2f} ms, p99 {result['latency_p99_ms']:.2f} ms")
+    print(f"Endkapital: {result['equity']:.2f} USDT, Ausführungen: {result['fills']}, realisiert: {result['closed_pnl']:.2f} USDT")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# code/tests/conftest.py
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utilities.bitget_futures as bitget_futures
+
+SYMBOL = 'BTC/USDT:USDT'
+MARKETS = {SYMBOL: {'symbol': SYMBOL, 'precision': {'amount': 0.001, 'price': 0.1},
+                    'limits': {'amount': {'min': 0.001}, 'cost': {'min': 5}}}}
+
+
+class FakeSession:
+    """
+    Lokaler Ersatz für die ccxt-Session von Bitget: liefert Kerzen aus einer festen Zeitreihe, zählt Anfragen
+    und ruft wie ccxt vor jeder Anfrage `throttle` auf. Fehler und Eigenheiten der Börse lassen sich einstellen.
+    """
+
+    def __init__(self, timeframe_ms=60_000, page_size=1000, overlap=0, failures=None, delay=0.0,
+                 rejected_prices=(), batch_error=None, batch_accepted=False, unreported_cancels=(), failing_ids=()):
+        self.timeframe_ms = timeframe_ms
+        self.page_size = page_size
+        # Die Börse liefert `overlap` Kerzen vor `since` mit (überlappende Seiten)
+        self.overlap = overlap
+        # since -> Anzahl der Anfragen, die noch mit einem Netzwerkfehler scheitern
+        self.failures = dict(failures or {})
+        self.delay = delay
+        # Orders zu diesen Preisen lehnt der Batch-Endpunkt ab (Einzelorders gehen durch)
+        self.rejected_prices = set(rejected_prices)
+        # Ausnahme, mit der jede Batch-Anfrage scheitert
+        self.batch_error = batch_error
+        # Die Börse nimmt den Batch an, bevor `batch_error` die Antwort verliert (z.B. Timeout)
+        self.batch_accepted = batch_accepted
+        # IDs, die die Batch-Stornierung nicht als storniert meldet, bzw. die auch einzeln scheitern
+        self.unreported_cancels = set(unreported_cancels)
+        self.failing_ids = set(failing_ids)
+        self.order_count = 0
+        self.open_orders = []
+        self.markets = {}
+        self.currencies = {}
+        self.throttle = lambda cost=None: None
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def load_markets(self, reload=False):
+        self.calls.append(('load_markets',))
+        self.markets = MARKETS
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+
+    def parse_timeframe(self, timeframe):
+        return self.timeframe_ms // 1000
+
+    def _request(self, *call):
+        self.throttle()
+        with self._lock:
+            self.calls.append(call)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self._request('fetch_ohlcv', since)
+        with self._lock:
+            if self.failures.get(since, 0) > 0:
+                self.failures[since] -= 1
+                raise bitget_futures.ccxt.NetworkError(f"timeout since={since}")
+        first = since - self.overlap * self.timeframe_ms
+        count = min(limit, self.page_size) + self.overlap
+        return [[ts, 1.0 + ts / 1e12, 2.0, 0.5, 1.5, 10.0] for ts in range(first, first + count * self.timeframe_ms, self.timeframe_ms)]
+
+    def _order(self, side, amount, price, params):
+        client_id = params.get('clientOrderId')
+        if client_id and any(o['clientOrderId'] == client_id for o in self.open_orders):
+            raise bitget_futures.ccxt.InvalidOrder(f"Duplicate clientOid {client_id}")
+        self.order_count += 1
+        order = {'id': f"o{self.order_count}", 'clientOrderId': client_id, 'status': 'open',
+                 'side': side, 'amount': amount, 'price': price}
+        self.open_orders.append(order)
+        return order
+
+    def create_orders(self, orders, params=None):
+        self._request('create_orders', len(orders))
+        if self.batch_error is not None and not self.batch_accepted:
+            raise self.batch_error
+        responses = []
+        for order in orders:
+            if order['price'] in self.rejected_prices:
+                responses.append({'id': None, 'clientOrderId': order['params']['clientOrderId'], 'status': 'rejected'})
+            else:
+                responses.append(self._order(order['side'], order['amount'], order['price'], order['params']))
+        if self.batch_error is not None:
+            raise self.batch_error
+        # Die Börse sichert keine Reihenfolge zu; Zuordnung nur über die clientOrderId
+        return responses[::-1]
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        self._request('create_order', price)
+        return self._order(side, amount, price, params or {})
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        self._request('fetch_open_orders', symbol)
+        return [dict(order) for order in self.open_orders]
+
+    def cancel_orders(self, ids, symbol=None, params=None):
+        self._request('cancel_orders', list(ids))
+        if self.batch_error is not None:
+            raise self.batch_error
+        return [{'id': id} for id in ids if id not in self.unreported_cancels]
+
+    def cancel_order(self, id, symbol=None, params=None):
+        self._request('cancel_order', id)
+        if id in self.failing_ids:
+            raise bitget_futures.ccxt.OrderNotFound(f"order {id} does not exist")
+        return {'id': id}
+
+
+@pytest.fixture
+def make_bitget(monkeypatch):
+    """Erzeugt eine `BitgetFutures`-Instanz über einer `FakeSession` (ohne Markt-Cache auf der Platte)."""
+    def make(session, **kwargs):
+        monkeypatch.setattr(bitget_futures.ccxt, 'bitget', lambda *args: session)
+        return bitget_futures.BitgetFutures(markets_cache_dir=None, **kwargs)
+    return make
+
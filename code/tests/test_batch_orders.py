@@ -0,0 +1,147 @@
+# code/tests/test_batch_orders.py
+
+import ccxt
+
+from conftest import FakeSession, SYMBOL
+from utilities.bitget_futures import BATCH_ORDER_LIMIT
+
+
+def _orders(n, start_price=100.0):
+    return [{'side': 'buy', 'amount': 0.01, 'price': start_price + i} for i in range(n)]
+
+
+def _calls(session, name):
+    return [call for call in session.calls if call[0] == name]
+
+
+def test_place_batch_success(make_bitget):
+    session = FakeSession()
+    bitget = make_bitget(session, requests_per_second=1000)
+    orders = _orders(3)
+
+    results = bitget.place_limit_orders(SYMBOL, orders, leverage=5, margin_mode='isolated')
+
+    assert [r['ok'] for r in results] == [True] * 3
+    assert not any(r['fallback'] for r in results)
+    assert len(_calls(session, 'create_orders')) == 1 and not _calls(session, 'create_order')
+    # Antworten kommen umgekehrt zurück, das Ergebnis folgt der Eingabe
+    assert [r['order']['price'] for r in results] == [o['price'] for o in orders]
+
+
+def test_place_partial_rejection_falls_back_per_order(make_bitget):
+    session = FakeSession(rejected_prices={101.0, 103.0})
+    bitget = make_bitget(session, requests_per_second=1000)
+    orders = _orders(4)
+
+    results = bitget.place_limit_orders(SYMBOL, orders, leverage=5, margin_mode='isolated')
+
+    assert [r['ok'] for r in results] == [True] * 4
+    assert [r['fallback'] for r in results] == [False, True, False, True]
+    assert [call[1] for call in _calls(session, 'create_order')] == [101.0, 103.0]
+    assert [r['order']['price'] for r in results] == [o['price'] for o in orders]
+
+
+def test_place_rejected_batch_places_individually_with_same_client_ids(make_bitget):
+    session = FakeSession(batch_error=ccxt.ExchangeError('batch endpoint rejected'))
+    bitget = make_bitget(session, requests_per_second=1000)
+    orders = _orders(3)
+
+    results = bitget.place_limit_orders(SYMBOL, orders, leverage=5, margin_mode='isolated')
+
+    assert [r['ok'] for r in results] == [True] * 3
+    assert all(r['fallback'] for r in results)
+    # Eindeutige Ablehnung: keine Abfrage der offenen Orders nötig
+    assert not _calls(session, 'fetch_open_orders')
+    assert [call[1] for call in _calls(session, 'create_order')] == [o['price'] for o in orders]
+    client_ids = [r['order']['clientOrderId'] for r in results]
+    assert all(client_ids) and len(set(client_ids)) == 3
+
+
+def test_place_network_error_after_acceptance_places_no_duplicates(make_bitget):
+    # Die Börse hat den Batch angenommen, nur die Antwort ging verloren
+    session = FakeSession(batch_error=ccxt.NetworkError('read timeout'), batch_accepted=True)
+    bitget = make_bitget(session, requests_per_second=1000)
+    orders = _orders(3)
+
+    results = bitget.place_limit_orders(SYMBOL, orders, leverage=5, margin_mode='isolated')
+
+    assert [r['ok'] for r in results] == [True] * 3
+    assert not any(r['fallback'] for r in results)
+    assert len(_calls(session, 'fetch_open_orders')) == 1
+    assert not _calls(session, 'create_order')
+    assert len(session.open_orders) == 3
+    assert [r['order']['price'] for r in results] == [o['price'] for o in orders]
+
+
+def test_place_network_error_before_acceptance_places_individually(make_bitget):
+    session = FakeSession(batch_error=ccxt.NetworkError('batch endpoint down'))
+    bitget = make_bitget(session, requests_per_second=1000)
+    orders = _orders(3)
+
+    results = bitget.place_limit_orders(SYMBOL, orders, leverage=5, margin_mode='isolated')
+
+    assert [r['ok'] for r in results] == [True] * 3
+    assert all(r['fallback'] for r in results)
+    assert len(_calls(session, 'fetch_open_orders')) == 1
+    assert [call[1] for call in _calls(session, 'create_order')] == [o['price'] for o in orders]
+    assert len(session.open_orders) == 3
+
+
+def test_place_splits_batches_above_limit(make_bitget):
+    session = FakeSession()
+    bitget = make_bitget(session, requests_per_second=1000)
+    orders = _orders(2 * BATCH_ORDER_LIMIT + 7)
+
+    results = bitget.place_limit_orders(SYMBOL, orders, leverage=5, margin_mode='isolated')
+
+    assert [call[1] for call in _calls(session, 'create_orders')] == [BATCH_ORDER_LIMIT, BATCH_ORDER_LIMIT, 7]
+    assert [r['order']['price'] for r in results] == [o['price'] for o in orders]
+    assert all(r['ok'] and not r['fallback'] for r in results)
+
+
+def test_cancel_batch_success(make_bitget):
+    session = FakeSession()
+    bitget = make_bitget(session, requests_per_second=1000)
+    ids = ['a', 'b', 'c']
+
+    results = bitget.cancel_orders(ids, SYMBOL)
+
+    assert [r['id'] for r in results] == ids
+    assert all(r['ok'] and not r['fallback'] for r in results)
+    assert len(_calls(session, 'cancel_orders')) == 1 and not _calls(session, 'cancel_order')
+
+
+def test_cancel_partial_falls_back_per_id(make_bitget):
+    session = FakeSession(unreported_cancels={'b', 'd'}, failing_ids={'d'})
+    bitget = make_bitget(session, requests_per_second=1000)
+    ids = ['a', 'b', 'c', 'd']
+
+    results = bitget.cancel_orders(ids, SYMBOL)
+
+    assert [r['id'] for r in results] == ids
+    assert [r['ok'] for r in results] == [True, True, True, False]
+    assert [r['fallback'] for r in results] == [False, True, False, True]
+    assert 'does not exist' in results[3]['error']
+    assert [call[1] for call in _calls(session, 'cancel_order')] == ['b', 'd']
+
+
+def test_cancel_whole_batch_failure_cancels_individually(make_bitget):
+    session = FakeSession(batch_error=ccxt.ExchangeError('batch cancel failed'))
+    bitget = make_bitget(session, requests_per_second=1000)
+    ids = ['a', 'b']
+
+    results = bitget.cancel_trigger_orders(ids, SYMBOL)
+
+    assert all(r['ok'] and r['fallback'] for r in results)
+    assert [call[1] for call in _calls(session, 'cancel_order')] == ids
+
+
+def test_cancel_splits_batches_above_limit(make_bitget):
+    session = FakeSession()
+    bitget = make_bitget(session, requests_per_second=1000)
+    ids = [f"id{i}" for i in range(BATCH_ORDER_LIMIT + 1)]
+
+    results = bitget.cancel_orders(ids, SYMBOL)
+
+    assert [len(call[1]) for call in _calls(session, 'cancel_orders')] == [BATCH_ORDER_LIMIT, 1]
+    assert [r['id'] for r in results] == ids
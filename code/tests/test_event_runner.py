@@ -0,0 +1,139 @@
+# code/tests/test_event_runner.py
+
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'strategies', 'envelope'))
+from run_live import EventDrivenRunner
+from run_paper import PaperEnvelopeBot
+from utilities.exchange_simulator import SimulatedExchange
+from utilities.market_feed import ReplayFeed, FeedEvent, CANDLE_CLOSED, ORDER_UPDATE
+from utilities.state_store import StateStore
+
+SYMBOL = 'BTC/USDT:USDT'
+HOUR = 3_600_000
+START_INDEX = 250
+test_logger = logging.getLogger('test_event_runner')
+
+
+def _params(symbol=SYMBOL):
+    return {'market': {'symbol': symbol, 'timeframe': '1h'},
+            'strategy': {'average_type': 'SMA', 'average_period': 5, 'envelopes_pct': [5.0]},
+            'risk': {'margin_mode': 'isolated', 'balance_fraction_pct': 80, 'stop_loss_pct': 0.55,
+                     'base_leverage': 2, 'max_leverage': 5, 'target_atr_pct': 2.0},
+            'behavior': {'use_longs': True, 'use_shorts': True, 'use_cooldown_after_sl': True}}
+
+
+def _candles(n=300, seed=5):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.003, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * 1.001
+    low = np.minimum(open_, close) * 0.999
+    index = pd.date_range('2024-01-01', periods=n, freq='1h', tz='UTC', name='timestamp')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': 1.0}, index=index)
+
+
+def _row(data, i):
+    return [int(data.index[i].value // 1_000_000), *map(float, data.iloc[i][['open', 'high', 'low', 'close', 'volume']])]
+
+
+@pytest.fixture
+def setup(tmp_path):
+    """Runner mit einem Bot gegen den Simulator; die Uhr steht am Beginn der Kerze START_INDEX."""
+    def make(data=None, symbols=(SYMBOL,)):
+        data = _candles() if data is None else data
+        exchange = SimulatedExchange({symbol: data for symbol in symbols}, '1h',
+                                     start_ms=int(data.index[START_INDEX].value // 1_000_000))
+        store = StateStore(':memory:')
+        bots = [PaperEnvelopeBot(_params(symbol), exchange, logger=test_logger, state_dir=str(tmp_path), store=store)
+                for symbol in symbols]
+        feed = ReplayFeed()
+        runner = EventDrivenRunner(bots, feed, logger=test_logger, max_workers=1)
+        runner.start()
+        return data, exchange, feed, runner
+    return make
+
+
+def _prices(orders):
+    return sorted(o['price'] for o in orders)
+
+
+def test_candle_close_requotes_grid_from_streamed_indicators(setup, monkeypatch):
+    data, exchange, feed, runner = setup()
+    before = _prices(exchange.fetch_open_orders(SYMBOL))
+    assert len(before) == 2
+    rest_calls = []
+    original = exchange.fetch_recent_ohlcv
+    monkeypatch.setattr(exchange, 'fetch_recent_ohlcv', lambda *args, **kwargs: rest_calls.append(args) or original(*args, **kwargs))
+
+    exchange.advance_to(int(data.index[START_INDEX + 1].value // 1_000_000))
+    feed.emit(CANDLE_CLOSED, SYMBOL, _row(data, START_INDEX))
+    assert runner.run_forever(poll_seconds=0, stop_when_idle=True) == 1
+
+    latest = runner.last_candle[SYMBOL]
+    assert runner.indicators[SYMBOL].last_timestamp == _row(data, START_INDEX)[0]
+    # Neue Preise aus den fortgeschriebenen Indikatoren, ohne Kerzen über REST nachzuladen
+    after = _prices(exchange.fetch_open_orders(SYMBOL))
+    assert after != before
+    assert after == [float(exchange.price_to_precision(SYMBOL, latest['band_low_1'])),
+                     float(exchange.price_to_precision(SYMBOL, latest['band_high_1']))]
+    assert not rest_calls
+
+
+def test_fill_places_take_profit_and_stop_loss_in_same_handle(setup):
+    data = _candles()
+    # Die nächste Kerze fällt tief genug, um die Long-Order auszuführen
+    data.iloc[START_INDEX, data.columns.get_loc('low')] = data['open'].iloc[START_INDEX] * 0.8
+    data, exchange, feed, runner = setup(data)
+    long_order = next(o for o in exchange.fetch_open_orders(SYMBOL) if o['side'] == 'buy')
+
+    exchange.advance_to(int(data.index[START_INDEX + 1].value // 1_000_000))
+    position = exchange.fetch_open_positions(SYMBOL)[0]
+    assert position['side'] == 'long' and position['entryPrice'] == long_order['price']
+
+    runner.handle([FeedEvent(ORDER_UPDATE, SYMBOL, exchange.orders[long_order['id']], time.time())])
+
+    triggers = exchange.fetch_open_trigger_orders(SYMBOL)
+    assert len(triggers) == 2
+    assert all(t['side'] == 'sell' and t['reduceOnly'] and t['amount'] == position['contracts'] for t in triggers)
+    stop_loss = float(exchange.price_to_precision(SYMBOL, position['entryPrice'] * (1 - 0.55 / 100)))
+    assert stop_loss in [t['triggerPrice'] for t in triggers]
+    assert runner.bots[SYMBOL].get_bot_status()['status'] == 'in_trade'
+
+
+def test_non_contiguous_candle_triggers_resync(setup):
+    data, exchange, feed, runner = setup()
+    resyncs = []
+    original = runner._resync
+    runner._resync = lambda symbol: resyncs.append(symbol) or original(symbol)
+
+    # Zwei Kerzen verpasst: die dritte schließt nicht an den Indikator-Zustand an
+    exchange.advance_to(int(data.index[START_INDEX + 3].value // 1_000_000))
+    runner.handle([FeedEvent(CANDLE_CLOSED, SYMBOL, _row(data, START_INDEX + 2), time.time())])
+
+    assert resyncs == [SYMBOL]
+    # Der Resync holt die fehlenden Kerzen über REST nach
+    assert runner.indicators[SYMBOL].last_timestamp == _row(data, START_INDEX + 2)[0]
+
+
+def test_failing_symbol_does_not_stop_the_loop(setup, monkeypatch):
+    other = 'ETH/USDT:USDT'
+    data, exchange, feed, runner = setup(symbols=(SYMBOL, other))
+
+    def fail(latest_complete_candle=None):
+        raise Exception("Datenbank gesperrt")
+    monkeypatch.setattr(runner.bots[other], 'run', fail)
+
+    exchange.advance_to(int(data.index[START_INDEX + 1].value // 1_000_000))
+    feed.emit(CANDLE_CLOSED, other, _row(data, START_INDEX))
+    feed.emit(CANDLE_CLOSED, SYMBOL, _row(data, START_INDEX))
+
+    assert runner.run_forever(poll_seconds=0, stop_when_idle=True) == 2
+    assert runner.indicators[SYMBOL].last_timestamp == _row(data, START_INDEX)[0]
@@ -0,0 +1,150 @@
+# code/tests/test_exchange_simulator.py
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities.exchange_simulator import SimulatedExchange
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'strategies', 'envelope'))
+from run_paper import replay
+
+SYMBOL = 'BTC/USDT:USDT'
+HOUR = 3_600_000
+T0 = 1_704_067_200_000
+FEE = 0.05 / 100
+
+
+def _frame(bars, start=T0):
+    """Kerzen aus (open, high, low, close) ab `start`, stündlich."""
+    index = pd.to_datetime([start + i * HOUR for i in range(len(bars))], unit='ms', utc=True)
+    return pd.DataFrame([[*bar, 1.0] for bar in bars], columns=['open', 'high', 'low', 'close', 'volume'], index=index)
+
+
+def _exchange(bars, balance=1000.0):
+    return SimulatedExchange({SYMBOL: _frame(bars)}, '1h', balance=balance)
+
+
+def _after(exchange, candles):
+    """Uhr ans Ende der `candles`-ten Kerze stellen (alle bis dahin abgeschlossenen werden abgeglichen)."""
+    exchange.advance_to(T0 + candles * HOUR)
+
+
+@pytest.mark.parametrize('bar, first', [((100, 106, 94, 104), 'buy'), ((100, 106, 94, 96), 'sell')])
+def test_intra_candle_path_order(bar, first):
+    # Steigende Kerze: Open → Low → High → Close, fallende: Open → High → Low → Close
+    exchange = _exchange([bar])
+    exchange.place_limit_order(SYMBOL, 'buy', 1, 95, leverage=2, margin_mode='isolated')
+    exchange.place_limit_order(SYMBOL, 'sell', 1, 105, leverage=2, margin_mode='isolated')
+
+    _after(exchange, 1)
+
+    assert [t['side'] for t in exchange.trades] == [first, 'sell' if first == 'buy' else 'buy']
+    assert [t['price'] for t in exchange.trades] == ([95, 105] if first == 'buy' else [105, 95])
+
+
+def test_gap_through_fills_limit_at_open_and_trigger_at_trigger_price():
+    exchange = _exchange([(100, 101, 99, 100), (90, 91, 85, 88)])
+    _after(exchange, 1)
+    exchange.place_limit_order(SYMBOL, 'buy', 1, 97, leverage=2, margin_mode='isolated')
+    stop = exchange.place_trigger_market_order(SYMBOL, 'sell', 1, 95, reduce=True)
+    assert stop['info']['direction'] == 'down'
+
+    _after(exchange, 2)
+
+    # Die Kerze öffnet unter beiden Preisen: Limit zum (besseren) Open, Trigger zum Triggerpreis
+    assert [(t['side'], t['price']) for t in exchange.trades] == [('buy', 90), ('sell', 95)]
+    assert not exchange.positions
+
+
+def test_trigger_direction_follows_placement_price():
+    exchange = _exchange([(100, 101, 99, 100), (100, 106, 100, 105)])
+    _after(exchange, 1)
+    # Die Long-Order füllt zu Beginn der nächsten Kerze, vor den Triggern
+    exchange.place_limit_order(SYMBOL, 'buy', 1, 100, leverage=2, margin_mode='isolated')
+    up = exchange.place_trigger_market_order(SYMBOL, 'sell', 0.5, 104, reduce=True)
+    down = exchange.place_trigger_market_order(SYMBOL, 'sell', 0.5, 98, reduce=True)
+    assert (up['info']['direction'], down['info']['direction']) == ('up', 'down')
+
+    _after(exchange, 2)
+
+    # Nur der Trigger oberhalb des Platzierungskurses löst bei steigendem Kurs aus
+    assert exchange.orders[up['id']]['status'] == 'closed'
+    assert exchange.orders[down['id']]['status'] == 'open'
+
+
+def test_reduce_only_fill_books_pnl_fee_and_releases_margin():
+    exchange = _exchange([(100, 101, 99, 100), (100, 111, 100, 110)])
+    exchange.place_limit_order(SYMBOL, 'buy', 1, 100, leverage=2, margin_mode='isolated')
+    _after(exchange, 1)
+    position = exchange.positions[(SYMBOL, 'long')]
+    assert position['margin'] == pytest.approx(50)
+    assert exchange.cash == pytest.approx(1000 - 100 * FEE)
+
+    exchange.place_limit_order(SYMBOL, 'sell', 0.5, 110, leverage=2, margin_mode='isolated', reduce=True)
+    _after(exchange, 2)
+
+    assert exchange.trades[-1]['pnl'] == pytest.approx(10 * 0.5)
+    assert exchange.cash == pytest.approx(1000 - 100 * FEE + 5 - 110 * 0.5 * FEE)
+    assert position['contracts'] == pytest.approx(0.5)
+    assert position['margin'] == pytest.approx(25)
+
+
+def test_reduce_only_without_position_is_canceled():
+    exchange = _exchange([(100, 101, 95, 100)])
+    order = exchange.place_limit_order(SYMBOL, 'buy', 1, 96, leverage=2, margin_mode='isolated', reduce=True)
+
+    _after(exchange, 1)
+
+    assert exchange.orders[order['id']]['status'] == 'canceled'
+    assert not exchange.trades and not exchange.positions and exchange.cash == 1000
+
+
+def test_state_round_trip(tmp_path):
+    bars = [(100, 101, 99, 100), (100, 101, 94, 95), (95, 99, 94, 98), (98, 104, 97, 103)]
+    exchange = _exchange(bars)
+    exchange.place_limit_order(SYMBOL, 'buy', 1, 96, leverage=2, margin_mode='isolated')
+    _after(exchange, 2)
+    exchange.place_trigger_market_order(SYMBOL, 'sell', 1, 102, reduce=True)
+    exchange.place_limit_order(SYMBOL, 'buy', 0.5, 90, leverage=2, margin_mode='isolated')
+    path = str(tmp_path / 'exchange.json')
+    exchange.save(path)
+
+    restored = _exchange(bars)
+    assert restored.load_state(path)
+    assert restored.state() == exchange.state()
+
+    # Weiterlaufen ab dem gespeicherten Stand ergibt dasselbe wie ohne Unterbrechung
+    _after(exchange, 4)
+    _after(restored, 4)
+    assert restored.state() == exchange.state()
+    assert restored.equity() == pytest.approx(exchange.equity())
+
+
+def test_load_state_without_file(tmp_path):
+    assert not _exchange([(100, 101, 99, 100)]).load_state(str(tmp_path / 'missing.json'))
+
+
+def test_fast_replay_matches_normal_replay(tmp_path):
+    rng = np.random.default_rng(11)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 400)))
+    open_ = np.r_[close[0], close[:-1]]
+    bars = zip(open_, np.maximum(open_, close) * 1.004, np.minimum(open_, close) * 0.996, close)
+    candles = _frame(list(bars))
+    params = {'market': {'symbol': SYMBOL, 'timeframe': '1h'},
+              'strategy': {'average_type': 'SMA', 'average_period': 5, 'envelopes_pct': [1.0, 2.0]},
+              'risk': {'margin_mode': 'isolated', 'balance_fraction_pct': 80, 'stop_loss_pct': 1.0,
+                       'base_leverage': 2, 'max_leverage': 5, 'target_atr_pct': 1.0},
+              'behavior': {'use_longs': True, 'use_shorts': True, 'use_cooldown_after_sl': True}}
+    # Wie auf der Kommandozeile: Zeitangaben ohne Zeitzone (UTC)
+    start, end = (candles.index[i].strftime('%Y-%m-%d %H:%M') for i in (250, -1))
+
+    normal = replay(params, candles, start, end, state_dir=str(tmp_path / 'normal'))
+    fast = replay(params, candles, start, end, state_dir=str(tmp_path / 'fast'), fast=True)
+
+    assert normal['fills'] > 0
+    for key in ('cycles', 'ticks', 'fills', 'equity', 'closed_pnl'):
+        assert fast[key] == normal[key]
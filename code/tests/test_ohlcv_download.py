@@ -0,0 +1,129 @@
+# code/tests/test_ohlcv_download.py
+
+import threading
+import time
+
+import pytest
+
+from conftest import FakeSession, SYMBOL
+from utilities.bitget_futures import OHLCV_PAGE_LIMIT
+from utilities.rate_limiter import TokenBucket
+
+MINUTE = 60_000
+START = 1_700_000_040_000
+
+
+def _timestamps(df):
+    return [int(ts.value // 1_000_000) for ts in df.index]
+
+
+def _requested(session):
+    return sorted(call[1] for call in session.calls if call[0] == 'fetch_ohlcv')
+
+
+def test_windows_cover_range_without_gaps(make_bitget):
+    session = FakeSession()
+    bitget = make_bitget(session, requests_per_second=1000)
+    end = START + (2 * OHLCV_PAGE_LIMIT + 250) * MINUTE
+
+    df = bitget.fetch_ohlcv_range(SYMBOL, '1m', START, end, retry_delay=0)
+
+    assert _requested(session) == [START, START + OHLCV_PAGE_LIMIT * MINUTE, START + 2 * OHLCV_PAGE_LIMIT * MINUTE]
+    assert _timestamps(df) == list(range(START, end, MINUTE))
+    assert list(df.columns) == ['open', 'high', 'low', 'close', 'volume']
+
+
+def test_empty_range(make_bitget):
+    session = FakeSession()
+    bitget = make_bitget(session)
+
+    assert bitget.fetch_ohlcv_range(SYMBOL, '1m', START, START).empty
+    assert _requested(session) == []
+
+
+def test_windows_are_fetched_concurrently(make_bitget):
+    session = FakeSession(delay=0.05)
+    bitget = make_bitget(session, requests_per_second=1000)
+    end = START + 6 * OHLCV_PAGE_LIMIT * MINUTE
+
+    df = bitget.fetch_ohlcv_range(SYMBOL, '1m', START, end, max_workers=4, retry_delay=0)
+
+    assert len(df) == 6 * OHLCV_PAGE_LIMIT
+    assert 1 < session.max_active <= 4
+
+
+def test_failing_window_is_retried(make_bitget):
+    second = START + OHLCV_PAGE_LIMIT * MINUTE
+    session = FakeSession(failures={second: 2})
+    bitget = make_bitget(session, requests_per_second=1000)
+    end = START + 3 * OHLCV_PAGE_LIMIT * MINUTE
+
+    df = bitget.fetch_ohlcv_range(SYMBOL, '1m', START, end, retries=3, retry_delay=0)
+
+    assert _requested(session).count(second) == 3
+    assert _timestamps(df) == list(range(START, end, MINUTE))
+
+
+def test_window_failing_beyond_retries_raises(make_bitget):
+    session = FakeSession(failures={START: 5})
+    bitget = make_bitget(session, requests_per_second=1000)
+
+    with pytest.raises(Exception, match='Failed to fetch historical OHLCV'):
+        bitget.fetch_ohlcv_range(SYMBOL, '1m', START, START + 10 * MINUTE, retries=2, retry_delay=0)
+    assert _requested(session) == [START] * 3
+
+
+def test_short_overlapping_pages_are_stitched_and_deduplicated(make_bitget):
+    # Seiten mit nur 300 Kerzen, die jeweils 5 Kerzen vor `since` mitliefern
+    session = FakeSession(page_size=300, overlap=5)
+    bitget = make_bitget(session, requests_per_second=1000)
+    end = START + (OHLCV_PAGE_LIMIT + 400) * MINUTE
+
+    df = bitget.fetch_ohlcv_range(SYMBOL, '1m', START, end, retry_delay=0)
+
+    assert _timestamps(df) == list(range(START, end, MINUTE))
+    assert df.index.is_unique and df.index.is_monotonic_increasing
+    # Innerhalb eines Fensters wird weitergeblättert
+    assert len(_requested(session)) > 2
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=50, capacity=1)
+    started = time.monotonic()
+    waited = sum(bucket.acquire() for _ in range(11))
+
+    assert time.monotonic() - started >= 10 / 50 * 0.9
+    assert waited > 0
+
+
+def test_token_bucket_is_shared_across_threads():
+    bucket = TokenBucket(rate=100, capacity=2)
+    started = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(10)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 40 Anfragen, 2 davon aus dem Burst
+    assert time.monotonic() - started >= 38 / 100 * 0.9
+
+
+def test_token_bucket_rejects_invalid_settings():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=10, capacity=2).acquire(3)
+
+
+def test_download_respects_request_rate(make_bitget):
+    # `BitgetFutures` hängt seinen Token-Bucket als `throttle` in die Session; die Fenster teilen ihn sich
+    session = FakeSession()
+    bitget = make_bitget(session, requests_per_second=40, request_burst=1)
+    end = START + 9 * OHLCV_PAGE_LIMIT * MINUTE
+
+    started = time.monotonic()
+    df = bitget.fetch_ohlcv_range(SYMBOL, '1m', START, end, max_workers=8, retry_delay=0)
+
+    assert len(df) == 9 * OHLCV_PAGE_LIMIT
+    assert time.monotonic() - started >= 8 / 40 * 0.9
@@ -0,0 +1,135 @@
+# code/tests/test_order_reconciler.py
+
+import pandas as pd
+import pytest
+
+from utilities.exchange_simulator import SimulatedExchange
+from utilities.order_reconciler import OrderReconciler, match_orders, reserved_margin
+
+SYMBOL = 'BTC/USDT:USDT'
+MARKETS = {SYMBOL: {'amount_step': '0.001', 'price_step': '0.1', 'min_amount': 0.001}}
+
+
+class RecordingExchange(SimulatedExchange):
+    """Simulator, der die Reihenfolge der Trigger-Aufrufe mitschreibt; Trigger zu `failing_prices` scheitern."""
+
+    def __init__(self, failing_prices=()):
+        candles = pd.DataFrame({'open': [100.0], 'high': [100.0], 'low': [100.0], 'close': [100.0], 'volume': [1.0]},
+                               index=pd.to_datetime([1_704_067_200_000], unit='ms', utc=True))
+        super().__init__({SYMBOL: candles}, '1h', markets=MARKETS)
+        self.failing_prices = set(failing_prices)
+        self.calls = []
+
+    def place_trigger_market_order(self, symbol, side, amount, trigger_price, reduce=False):
+        self.calls.append(('place_trigger', trigger_price))
+        if trigger_price in self.failing_prices:
+            raise Exception("trigger rejected")
+        return super().place_trigger_market_order(symbol, side, amount, trigger_price, reduce)
+
+    def cancel_trigger_orders(self, ids, symbol):
+        self.calls.append(('cancel_triggers', [self.orders[id]['triggerPrice'] for id in ids]))
+        return super().cancel_trigger_orders(ids, symbol)
+
+
+def _open(side, price, amount=1.0, leverage=None):
+    return {'id': f"{side}-{price}", 'side': side, 'price': price, 'amount': amount,
+            'info': {'leverage': leverage} if leverage is not None else {}}
+
+
+def _desired(side, price, amount=1.0, leverage=2):
+    return {'side': side, 'price': price, 'amount': amount, 'leverage': leverage, 'margin_mode': 'isolated'}
+
+
+def _match(desired, open_orders):
+    # Halber Tick bei einer Schrittweite von 0.1
+    return match_orders(desired, open_orders, 'price', lambda price: 0.05, 1.0)
+
+
+@pytest.mark.parametrize('open_price, kept', [(100.04, True), (99.96, True), (100.06, False)])
+def test_match_price_within_half_tick(open_price, kept):
+    keep, cancel, place = _match([_desired('buy', 100.0)], [_open('buy', open_price)])
+
+    assert (len(keep), len(cancel), len(place)) == ((1, 0, 0) if kept else (0, 1, 1))
+
+
+@pytest.mark.parametrize('open_amount, kept', [(1.009, True), (0.991, True), (1.02, False)])
+def test_match_amount_within_one_percent(open_amount, kept):
+    keep, _, place = _match([_desired('buy', 100.0)], [_open('buy', 100.0, amount=open_amount)])
+
+    assert bool(keep) == kept and bool(place) != kept
+
+
+def test_match_requires_same_leverage_when_known():
+    keep, cancel, place = _match([_desired('buy', 100.0, leverage=2)], [_open('buy', 100.0, leverage='5')])
+    assert not keep and cancel and place
+
+    # Ohne Hebel in der Börsenantwort zählen nur Preis, Menge und Seite
+    keep, cancel, place = _match([_desired('buy', 100.0, leverage=2)], [_open('buy', 100.0)])
+    assert keep and not cancel and not place
+
+
+def test_match_uses_each_open_order_once_and_prefers_nearest():
+    open_orders = [_open('buy', 100.04), _open('buy', 100.01), _open('sell', 100.0)]
+
+    keep, cancel, place = _match([_desired('buy', 100.0), _desired('buy', 100.0)], open_orders)
+
+    assert [o['price'] for o in keep] == [100.01, 100.04]
+    assert [o['side'] for o in cancel] == ['sell'] and not place
+
+
+def test_reconcile_keeps_replaces_and_cancels():
+    exchange = RecordingExchange()
+    for side, price in (('buy', 95.0), ('sell', 105.0), ('buy', 90.0)):
+        exchange.place_limit_order(SYMBOL, side, 1.0, price, leverage=2, margin_mode='isolated')
+    reconciler = OrderReconciler(exchange, SYMBOL)
+    desired = [reconciler.limit_order('buy', 1.0, 95.02, 2, 'isolated'), reconciler.limit_order('sell', 1.0, 106.0, 2, 'isolated')]
+
+    stats = reconciler.reconcile(exchange.fetch_open_orders(SYMBOL), [], desired, [])
+
+    assert (stats['kept'], stats['cancelled'], stats['placed']) == (1, 2, 1)
+    assert sorted(o['price'] for o in exchange.fetch_open_orders(SYMBOL)) == [95.0, 106.0]
+    # Gegenüber „alles stornieren und neu platzieren“: 5 Einzelaufrufe statt 2 Batch-Anfragen
+    assert (stats['api_calls'], stats['api_calls_saved']) == (2, 3)
+
+
+def test_reconcile_places_triggers_before_cancelling_old_ones():
+    exchange = RecordingExchange()
+    for price in (110.0, 90.0):
+        exchange.place_trigger_market_order(SYMBOL, 'sell', 1.0, price, reduce=True)
+    exchange.calls.clear()
+    reconciler = OrderReconciler(exchange, SYMBOL)
+    desired = [reconciler.trigger_order('sell', 1.0, 112.0), reconciler.trigger_order('sell', 1.0, 90.0)]
+
+    reconciler.reconcile([], exchange.fetch_open_trigger_orders(SYMBOL), [], desired)
+
+    assert exchange.calls == [('place_trigger', 112.0), ('cancel_triggers', [110.0])]
+    assert sorted(o['triggerPrice'] for o in exchange.fetch_open_trigger_orders(SYMBOL)) == [90.0, 112.0]
+
+
+def test_reconcile_keeps_old_triggers_when_replacement_fails():
+    exchange = RecordingExchange(failing_prices={112.0})
+    for price in (110.0, 90.0):
+        exchange.place_trigger_market_order(SYMBOL, 'sell', 1.0, price, reduce=True)
+    reconciler = OrderReconciler(exchange, SYMBOL)
+    desired = [reconciler.trigger_order('sell', 1.0, 112.0), reconciler.trigger_order('sell', 1.0, 90.0)]
+
+    with pytest.raises(Exception, match='unvollständig'):
+        reconciler.reconcile([], exchange.fetch_open_trigger_orders(SYMBOL), [], desired)
+
+    # Die Position bleibt durch die alten Trigger geschützt; die Statistik ist trotzdem gesetzt
+    assert not any(call[0] == 'cancel_triggers' for call in exchange.calls)
+    assert sorted(o['triggerPrice'] for o in exchange.fetch_open_trigger_orders(SYMBOL)) == [90.0, 110.0]
+    assert reconciler.last_stats['cancelled'] == 0 and reconciler.last_stats['kept'] == 2
+
+
+def test_reserved_margin():
+    open_orders = [
+        {'price': 100.0, 'amount': 1.0, 'info': {'leverage': '5'}},
+        # Teilweise ausgeführt: nur der Rest bindet Margin; ohne Hebel gilt der Standard
+        {'price': 100.0, 'amount': 1.0, 'remaining': 0.5, 'info': {}},
+        {'price': 100.0, 'amount': 1.0, 'reduceOnly': True, 'info': {'leverage': '5'}},
+        {'price': None, 'amount': 1.0, 'triggerPrice': 90.0},
+    ]
+
+    assert reserved_margin(open_orders, default_leverage=2) == pytest.approx(20 + 25)
+    assert reserved_margin([], default_leverage=2) == 0.0
@@ -0,0 +1,88 @@
+# code/tests/test_streaming_indicators.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities.strategy_logic import calculate_envelope_indicators
+from utilities.streaming_indicators import StreamingEnvelopeIndicators, StreamingATR, make_average
+
+COLUMNS = ['average', 'atr', 'atr_pct', 'band_high_1', 'band_low_1', 'band_high_2', 'band_low_2', 'trend_sma']
+
+
+def _candles(n=1500, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.004, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.004, n)))
+    index = pd.date_range('2024-01-01', periods=n, freq='1h', tz='UTC', name='timestamp')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': 1.0}, index=index)
+
+
+def _params(average_type, average_period=20):
+    return {'average_type': average_type, 'average_period': average_period, 'envelopes_pct': [2.0, 4.5],
+            'atr_period': 14, 'trend_filter': {'enabled': True, 'period': 50}}
+
+
+def _stream(indicators, data):
+    rows = []
+    timestamps = data.index.as_unit('ms').asi8
+    for ts, high, low, close in zip(timestamps, data['high'], data['low'], data['close']):
+        rows.append(indicators.update(ts, float(high), float(low), float(close)))
+    return pd.DataFrame(rows, index=data.index)[COLUMNS]
+
+
+@pytest.mark.parametrize('average_type', ['DCM', 'SMA', 'WMA'])
+def test_matches_calculate_envelope_indicators(average_type):
+    data = _candles()
+    params = _params(average_type)
+
+    expected = calculate_envelope_indicators(data, params)[COLUMNS]
+    streamed = _stream(StreamingEnvelopeIndicators(params), data)
+
+    pd.testing.assert_frame_equal(streamed, expected, check_exact=False, rtol=1e-9, atol=1e-9, check_freq=False)
+
+
+def test_atr_matches_calculate_envelope_indicators():
+    data = _candles(seed=11)
+    expected = calculate_envelope_indicators(data, _params('SMA'))['atr'].to_numpy()
+    atr = StreamingATR(14)
+    streamed = np.array([atr.update(h, l, c) for h, l, c in zip(data['high'], data['low'], data['close'])])
+
+    np.testing.assert_allclose(streamed, expected, rtol=1e-12, atol=1e-12)
+    # Vor dem ersten vollen Fenster liefern beide 0
+    assert not streamed[:13].any()
+
+
+def test_unsupported_average_type():
+    with pytest.raises(ValueError):
+        make_average('EMA', 20)
+
+
+@pytest.mark.parametrize('average_type', ['DCM', 'SMA', 'WMA'])
+def test_snapshot_round_trip_continues_bit_identically(tmp_path, average_type):
+    data = _candles(n=800, seed=5)
+    params = _params(average_type)
+    reference = _stream(StreamingEnvelopeIndicators(params), data)
+
+    first = StreamingEnvelopeIndicators(params)
+    first.update_frame(data.iloc[:333])
+    path = tmp_path / 'indicators.json'
+    first.save(str(path))
+
+    restored = StreamingEnvelopeIndicators.load(str(path), params)
+    assert restored.last_timestamp == first.last_timestamp
+    continued = _stream(restored, data.iloc[333:])
+
+    pd.testing.assert_frame_equal(continued, reference.iloc[333:], check_exact=True, check_freq=False)
+
+
+def test_snapshot_of_other_parameters_is_ignored(tmp_path):
+    path = tmp_path / 'indicators.json'
+    indicators = StreamingEnvelopeIndicators(_params('SMA'))
+    indicators.update_frame(_candles(n=100))
+    indicators.save(str(path))
+
+    assert StreamingEnvelopeIndicators.load(str(path), _params('SMA', average_period=21)) is None
+    assert StreamingEnvelopeIndicators.load(str(tmp_path / 'missing.json'), _params('SMA')) is None
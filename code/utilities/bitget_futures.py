@@ -1,15 +1,37 @@
 # code/utilities/bitget_futures.py
 
+import os
 import ccxt
 import time
+import uuid
 import pandas as pd
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional, Dict, List
 
+from utilities.rate_limiter import TokenBucket
+from utilities.metrics import metrics, timed
+from utilities.markets_cache import MarketsCache, MARKETS_TTL_SECONDS, DEFAULT_CACHE_DIR, precision_table, amount_to_precision, price_to_precision
+
 logger = logging.getLogger(__name__)
 
+# Bitget erlaubt für Marktdaten ca. 20 Anfragen/s pro IP; wir bleiben standardmäßig deutlich darunter.
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+OHLCV_PAGE_LIMIT = 1000
+# Höchstzahl Orders pro Batch-Anfrage (batch-place-order / batch-cancel-orders / cancel-plan-order)
+BATCH_ORDER_LIMIT = 50
+# Ablehnungen der Börse, die auf veraltete Präzision/Limits im Markt-Cache hindeuten (Bitget-Fehlercodes
+# für Nachkommastellen und Mindestmengen bzw. Stichworte der Meldung); andere InvalidOrder-Fehler wie
+# fehlende Margin oder reduce-only ohne Position werden nicht durch Neuladen der Märkte behoben
+MARKET_ERROR_CODES = ('40808', '45110', '45111')
+MARKET_ERROR_HINTS = ('precision', 'checkbdscale', 'checkscale', 'decimal', 'minimum', 'tick size')
+
 class BitgetFutures():
-    def __init__(self, api_setup: Optional[Dict[str, Any]] = None, demo_mode: bool = False) -> None:
+    def __init__(self, api_setup: Optional[Dict[str, Any]] = None, demo_mode: bool = False,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND, request_burst: Optional[float] = None,
+                 markets_cache_dir: Optional[str] = DEFAULT_CACHE_DIR, markets_ttl: float = MARKETS_TTL_SECONDS) -> None:
+        # Ohne eigene Angabe höchstens eine halbe Sekunde Burst, damit auch Spitzen unter dem Limit bleiben
+        self.rate_limiter = TokenBucket(requests_per_second, request_burst or max(1.0, requests_per_second / 2))
         if api_setup is None:
             self.session = ccxt.bitget()
         else:
@@ -19,8 +41,79 @@ class BitgetFutures():
             self.session = ccxt.bitget(api_setup)
             if demo_mode:
                 self.session.set_sandbox_mode(True)
-        self.markets = self.session.load_markets()
+        # ccxt drosselt ohne Sperre und nur pro Aufruf; mit dem Token-Bucket bleiben auch mehrere Threads,
+        # die sich eine Session teilen (Daten-Download, Multi-Symbol-Runner), gemeinsam unter dem Limit
+        self.session.throttle = self._throttle
+        # Märkte kommen aus dem Datei-Cache, solange er frisch ist; getrennt für Demo- und Live-Konto
+        cache_file = f"markets_bitget{'_demo' if demo_mode else ''}.json"
+        self.markets_cache = MarketsCache(os.path.join(markets_cache_dir, cache_file), markets_ttl) if markets_cache_dir else None
+        # Höchstens ein Neuladen pro Symbol und TTL-Fenster, damit eine dauerhaft abgelehnte Order nicht
+        # in jedem Zyklus die komplette Kontraktliste lädt
+        self.markets_ttl = markets_ttl
+        self._markets_refreshed_at = {}
+        self._load_markets()
+
+    def _throttle(self, cost: Optional[float] = None) -> None:
+        waited = self.rate_limiter.acquire(min(cost if cost is not None else 1, self.rate_limiter.capacity))
+        if waited:
+            metrics.add('throttle_seconds', waited)
+
+    def _load_markets(self, reload: bool = False) -> None:
+        cached = self.markets_cache.load() if self.markets_cache and not reload else None
+        if cached:
+            markets, currencies = cached
+            self.session.set_markets(markets, currencies)
+        else:
+            self.session.load_markets(reload=True)
+            if self.markets_cache:
+                self.markets_cache.save(self.session.markets, self.session.currencies)
+        self.markets = self.session.markets
+        self.precision = precision_table(self.markets)
+
+    @timed('refresh_markets')
+    def refresh_markets(self) -> None:
+        """Lädt die Märkte neu von der Börse und aktualisiert Cache und Präzisionstabelle."""
+        logger.info("Lade Märkte neu...")
+        self._load_markets(reload=True)
+
+    def _refresh_markets_for(self, symbol: str) -> bool:
+        """Lädt die Märkte wegen `symbol` neu, sofern das im aktuellen TTL-Fenster noch nicht geschehen ist."""
+        now = time.monotonic()
+        last = self._markets_refreshed_at.get(symbol)
+        if last is not None and now - last < self.markets_ttl:
+            return False
+        self._markets_refreshed_at[symbol] = now
+        self.refresh_markets()
+        return True
+
+    def _market_precision(self, symbol: str) -> Dict[str, Any]:
+        # Unbekanntes Symbol: evtl. neu gelistet, daher einmal frisch laden
+        if symbol not in self.precision:
+            self._refresh_markets_for(symbol)
+        if symbol not in self.precision:
+            raise Exception(f"Markt-Informationen für {symbol} konnten nicht geladen werden.")
+        return self.precision[symbol]
+
+    @staticmethod
+    def _is_market_error(error: Exception) -> bool:
+        if isinstance(error, ccxt.BadSymbol):
+            return True
+        message = str(error).lower()
+        return any(code in message for code in MARKET_ERROR_CODES) or any(hint in message for hint in MARKET_ERROR_HINTS)
+
+    def _with_market_refresh(self, symbol: str, action):
+        # Lehnt die Börse eine Order wegen Symbol oder Präzision ab, kann der Cache veraltet sein:
+        # Märkte neu laden und genau einmal mit neu gerundeten Werten wiederholen
+        try:
+            return action()
+        except (ccxt.BadSymbol, ccxt.InvalidOrder) as e:
+            if not self._is_market_error(e) or not self._refresh_markets_for(symbol):
+                raise
+            logger.warning(f"Order abgelehnt ({e}), wiederhole mit neu geladenen Märkten.")
+            metrics.add('retries')
+            return action()
     
+    @timed('fetch_ticker')
     def fetch_ticker(self, symbol: str) -> Dict[str, Any]:
         try:
             return self.session.fetch_ticker(symbol)
@@ -29,22 +122,30 @@ class BitgetFutures():
 
     def fetch_min_amount_tradable(self, symbol: str) -> float:
         try:
-            return self.markets[symbol]['limits']['amount']['min']
+            return self._market_precision(symbol)['min_amount']
         except Exception as e:
             raise Exception(f"Failed to fetch minimum amount tradable: {e}")    
         
     def amount_to_precision(self, symbol: str, amount: float) -> str:
+        # Rundung über die vorberechnete Tabelle, ohne ccxt-Marktsuche pro Order
         try:
-            return self.session.amount_to_precision(symbol, amount)
+            result = amount_to_precision(self._market_precision(symbol), amount)
         except Exception as e:
             raise Exception(f"Failed to convert amount {amount} {symbol} to precision", e)
+        if result == '0':
+            raise Exception(f"amount of {symbol} must be greater than minimum amount precision")
+        return result
 
     def price_to_precision(self, symbol: str, price: float) -> str:
         try:
-            return self.session.price_to_precision(symbol, price)
+            result = price_to_precision(self._market_precision(symbol), price)
         except Exception as e:
             raise Exception(f"Failed to convert price {price} to precision for {symbol}", e)
+        if result == '0':
+            raise Exception(f"price of {symbol} must be greater than minimum price precision")
+        return result
 
+    @timed('fetch_balance')
     def fetch_balance(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         if params is None:
             params = {}
@@ -53,6 +154,7 @@ class BitgetFutures():
         except Exception as e:
             raise Exception(f"Failed to fetch balance: {e}")
 
+    @timed('fetch_open_orders')
     def fetch_open_orders(self, symbol: str) -> List[Dict[str, Any]]:
         try:
             return self.session.fetch_open_orders(symbol)
@@ -60,6 +162,7 @@ class BitgetFutures():
             raise Exception(f"Failed to fetch open orders: {e}")
             
     # <<< NEUE FUNKTION START >>>
+    @timed('fetch_my_trades')
     def fetch_my_trades(self, symbol: str, limit: int = 20) -> List[Dict[str, Any]]:
         """Holt die letzten geschlossenen Trades für ein Symbol."""
         try:
@@ -68,24 +171,63 @@ class BitgetFutures():
             raise Exception(f"Failed to fetch my trades for {symbol}: {e}")
     # <<< NEUE FUNKTION ENDE >>>
 
+    @timed('fetch_open_trigger_orders')
     def fetch_open_trigger_orders(self, symbol: str) -> List[Dict[str, Any]]:
         try:
             return self.session.fetch_open_orders(symbol, params={'stop': True})
         except Exception as e:
             raise Exception(f"Failed to fetch open trigger orders: {e}")
 
+    @timed('cancel_order')
     def cancel_order(self, id: str, symbol: str) -> Dict[str, Any]:
         try:
             return self.session.cancel_order(id, symbol)
         except Exception as e:
             raise Exception(f"Failed to cancel the {symbol} order {id}", e)
 
+    @timed('cancel_trigger_order')
     def cancel_trigger_order(self, id: str, symbol: str) -> Dict[str, Any]:
         try:
             return self.session.cancel_order(id, symbol, params={'stop': True})
         except Exception as e:
             raise Exception(f"Failed to cancel the {symbol} trigger order {id}", e)
 
+    @timed('cancel_orders')
+    def cancel_orders(self, ids: List[str], symbol: str) -> List[Dict[str, Any]]:
+        """Storniert mehrere Limit-Orders gebündelt. Ergebnis pro ID siehe `_cancel_batch`."""
+        return self._cancel_batch(ids, symbol, {}, self.cancel_order)
+
+    @timed('cancel_trigger_orders')
+    def cancel_trigger_orders(self, ids: List[str], symbol: str) -> List[Dict[str, Any]]:
+        """Storniert mehrere Trigger-Orders (TP/SL) gebündelt. Ergebnis pro ID siehe `_cancel_batch`."""
+        return self._cancel_batch(ids, symbol, {'stop': True}, self.cancel_trigger_order)
+
+    def _cancel_batch(self, ids: List[str], symbol: str, params: Dict[str, Any], cancel_single) -> List[Dict[str, Any]]:
+        # Je BATCH_ORDER_LIMIT IDs eine Anfrage; was die Börse nicht als storniert meldet (oder wenn die ganze
+        # Anfrage scheitert), wird einzeln nachgeholt. Ergebnis in Eingabereihenfolge:
+        # {'id', 'ok', 'fallback' (einzeln storniert), 'error'}
+        results = {}
+        for start in range(0, len(ids), BATCH_ORDER_LIMIT):
+            chunk = ids[start:start + BATCH_ORDER_LIMIT]
+            try:
+                cancelled = {str(o.get('id')) for o in self.session.cancel_orders(chunk, symbol, params=dict(params))}
+            except Exception as e:
+                logger.warning(f"Batch-Stornierung für {symbol} fehlgeschlagen ({e}), storniere einzeln.")
+                metrics.add('batch_errors')
+                cancelled = set()
+            for id in chunk:
+                if str(id) in cancelled:
+                    results[id] = {'id': id, 'ok': True, 'fallback': False, 'error': None}
+                    continue
+                metrics.add('fallbacks')
+                try:
+                    cancel_single(id, symbol)
+                    results[id] = {'id': id, 'ok': True, 'fallback': True, 'error': None}
+                except Exception as e:
+                    results[id] = {'id': id, 'ok': False, 'fallback': True, 'error': str(e)}
+        return [results[id] for id in ids]
+
+    @timed('fetch_open_positions')
     def fetch_open_positions(self, symbol: str) -> List[Dict[str, Any]]:
         try:
             positions = self.session.fetch_positions([symbol], params={'productType': 'USDT-FUTURES', 'marginCoin': 'USDT'})
@@ -94,6 +236,7 @@ class BitgetFutures():
         except Exception as e:
             raise Exception(f"Failed to fetch open positions: {e}")
 
+    @timed('set_margin_mode')
     def set_margin_mode(self, symbol: str, margin_mode: str = 'isolated') -> None:
         try:
             self.session.set_margin_mode(margin_mode, symbol, params={'productType': 'USDT-FUTURES', 'marginCoin': 'USDT'})
@@ -104,6 +247,7 @@ class BitgetFutures():
             else:
                 raise Exception(f"Fehler beim Setzen des Margin-Modus: {e}")
 
+    @timed('set_leverage')
     def set_leverage(self, symbol: str, leverage: int, margin_mode: str) -> None:
         try:
             if margin_mode == 'isolated':
@@ -119,18 +263,13 @@ class BitgetFutures():
                 raise Exception(f"Fehler beim Setzen des Hebels: {e}")
 
     def get_market_info(self, symbol: str) -> Dict[str, Any]:
-        if symbol not in self.markets:
-            self.markets = self.session.load_markets(True)
-        
-        market = self.markets.get(symbol)
-        if not market:
-            raise Exception(f"Markt-Informationen für {symbol} konnten nicht geladen werden.")
-        
+        entry = self._market_precision(symbol)
         return {
-            'min_amount': market['limits']['amount']['min'],
-            'amount_precision': market['precision']['amount']
+            'min_amount': entry['min_amount'],
+            'amount_precision': entry['amount_precision']
         }
 
+    @timed('fetch_recent_ohlcv')
     def fetch_recent_ohlcv(self, symbol: str, timeframe: str, limit: int = 1000) -> pd.DataFrame:
         try:
             timeframe_in_ms = self.session.parse_timeframe(timeframe) * 1000
@@ -149,17 +288,33 @@ class BitgetFutures():
         from datetime import datetime, timezone
         start_ts = int(datetime.strptime(start_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
         end_ts = int(datetime.strptime(end_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
-        all_ohlcv = []
-        while start_ts < end_ts:
-            try:
-                ohlcv = self.session.fetch_ohlcv(symbol, timeframe, since=start_ts, limit=1000)
-                if not ohlcv: break
-                all_ohlcv.extend(ohlcv)
-                last_timestamp = ohlcv[-1][0]
-                start_ts = last_timestamp + self.session.parse_timeframe(timeframe) * 1000
-            except Exception as e:
-                raise Exception(f"Failed to fetch historical OHLCV data for {symbol}: {e}")
-        
+        return self.fetch_ohlcv_range(symbol, timeframe, start_ts, end_ts)
+
+    def fetch_ohlcv_range(self, symbol: str, timeframe: str, start_ts: int, end_ts: int,
+                          max_workers: int = 8, retries: int = 3, retry_delay: float = 1.0) -> pd.DataFrame:
+        """
+        Lädt alle Kerzen in [start_ts, end_ts) (ms). Da der Zeitraum vorab bekannt ist, wird er in Fenster
+        zu je OHLCV_PAGE_LIMIT Kerzen zerlegt, die parallel unter dem Token-Bucket geladen werden.
+        Fehlgeschlagene Anfragen werden einzeln wiederholt; die Ergebnisse werden zusammengefügt und dedupliziert.
+        """
+        timeframe_in_ms = self.session.parse_timeframe(timeframe) * 1000
+        window_ms = OHLCV_PAGE_LIMIT * timeframe_in_ms
+        windows = [(ts, min(ts + window_ms, end_ts)) for ts in range(start_ts, end_ts, window_ms)]
+        if not windows: return pd.DataFrame()
+
+        def fetch_window(window):
+            return self._fetch_ohlcv_window(symbol, timeframe, window[0], window[1], timeframe_in_ms, retries, retry_delay)
+
+        try:
+            if len(windows) == 1:
+                pages = [fetch_window(windows[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(windows))) as executor:
+                    pages = list(executor.map(fetch_window, windows))
+        except Exception as e:
+            raise Exception(f"Failed to fetch historical OHLCV data for {symbol}: {e}")
+
+        all_ohlcv = [candle for page in pages for candle in page]
         if not all_ohlcv: return pd.DataFrame()
         df = pd.DataFrame(all_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
         df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
@@ -167,30 +322,121 @@ class BitgetFutures():
         df = df[~df.index.duplicated(keep='first')]
         df.sort_index(inplace=True)
         return df
+
+    def _fetch_ohlcv_window(self, symbol: str, timeframe: str, window_start: int, window_end: int,
+                            timeframe_in_ms: int, retries: int, retry_delay: float) -> List[list]:
+        # Liefert die Börse weniger Kerzen als angefragt, wird innerhalb des Fensters weitergeblättert.
+        candles = []
+        since = window_start
+        while since < window_end:
+            for attempt in range(retries + 1):
+                try:
+                    ohlcv = self.session.fetch_ohlcv(symbol, timeframe, since=since, limit=OHLCV_PAGE_LIMIT)
+                    break
+                except Exception as e:
+                    if attempt == retries:
+                        raise
+                    logger.warning(f"OHLCV-Anfrage ab {since} für {symbol} fehlgeschlagen ({e}), Versuch {attempt + 2}/{retries + 1}...")
+                    metrics.add('retries', call='fetch_ohlcv_range')
+                    time.sleep(retry_delay * 2 ** attempt)
+            if not ohlcv: break
+            candles.extend(c for c in ohlcv if window_start <= c[0] < window_end)
+            next_since = ohlcv[-1][0] + timeframe_in_ms
+            if next_since <= since: break
+            since = next_since
+        return candles
     
-    def place_limit_order(self, symbol: str, side: str, amount: float, price: float, leverage: int, margin_mode: str, reduce: bool = False) -> Dict[str, Any]:
+    @timed('place_limit_order')
+    def place_limit_order(self, symbol: str, side: str, amount: float, price: float, leverage: int, margin_mode: str, reduce: bool = False,
+                          client_order_id: Optional[str] = None) -> Dict[str, Any]:
         try:
             params = {
                 'reduceOnly': reduce,
                 'marginMode': margin_mode,
                 'leverage': leverage,
             }
-            amount_str = self.session.amount_to_precision(symbol, amount)
-            price_str = self.session.price_to_precision(symbol, price)
-            
-            response = self.session.create_order(symbol, 'limit', side, float(amount_str), float(price_str), params=params)
+            if client_order_id:
+                # Gleiche ID wie im Batch: eine dort bereits angenommene Order lehnt die Börse als Duplikat ab
+                params['clientOrderId'] = client_order_id
+            def create():
+                amount_str = self.amount_to_precision(symbol, amount)
+                price_str = self.price_to_precision(symbol, price)
+                return self.session.create_order(symbol, 'limit', side, float(amount_str), float(price_str), params=params)
+
+            response = self._with_market_refresh(symbol, create)
             return response
         except Exception as e:
             raise Exception(f"Failed to place limit order of {amount} {symbol} at price {price}: {e}")
 
+    @timed('place_trigger_market_order')
     def place_trigger_market_order(self, symbol: str, side: str, amount: float, trigger_price: float, reduce: bool = False) -> Optional[Dict[str, Any]]:
         try:
-            amount_str = self.session.amount_to_precision(symbol, amount)
-            trigger_price_str = self.session.price_to_precision(symbol, trigger_price)
-            params = {
-                'reduceOnly': reduce,
-                'stopPrice': trigger_price_str,
-            }
-            return self.session.create_order(symbol, 'market', side, float(amount_str), price=None, params=params)
+            def create():
+                amount_str = self.amount_to_precision(symbol, amount)
+                trigger_price_str = self.price_to_precision(symbol, trigger_price)
+                params = {
+                    'reduceOnly': reduce,
+                    'stopPrice': trigger_price_str,
+                }
+                return self.session.create_order(symbol, 'market', side, float(amount_str), price=None, params=params)
+
+            return self._with_market_refresh(symbol, create)
         except Exception as err:
             raise err
+
+    @timed('place_limit_orders')
+    def place_limit_orders(self, symbol: str, orders: List[Dict[str, Any]], leverage: int, margin_mode: str) -> List[Dict[str, Any]]:
+        """
+        Platziert mehrere Limit-Orders eines Symbols gebündelt (je BATCH_ORDER_LIMIT pro Anfrage). `orders` enthält
+        Dicts mit side, amount, price und optional reduce. Von der Börse abgelehnte Orders (oder alle, wenn die
+        Anfrage scheitert) werden einzeln über `place_limit_order` mit derselben clientOrderId wiederholt. Ist
+        unklar, ob die Börse den Batch angenommen hat (Netzwerkfehler, Timeout), werden vorher die offenen Orders
+        geladen und bereits vorhandene nicht erneut platziert. Ergebnis in Eingabereihenfolge:
+        {'ok', 'fallback' (einzeln platziert), 'order' (Antwort), 'error'}.
+        """
+        results = [None] * len(orders)
+        for start in range(0, len(orders), BATCH_ORDER_LIMIT):
+            chunk = list(enumerate(orders[start:start + BATCH_ORDER_LIMIT], start))
+            requests, client_ids, client_id_of = [], {}, {}
+            for i, order in chunk:
+                client_id = uuid.uuid4().hex
+                client_ids[client_id] = i
+                client_id_of[i] = client_id
+                try:
+                    amount_str = self.amount_to_precision(symbol, order['amount'])
+                    price_str = self.price_to_precision(symbol, order['price'])
+                except Exception:
+                    # z.B. Menge unter der Präzision: der Einzelversuch meldet den Fehler
+                    continue
+                params = {'reduceOnly': order.get('reduce', False), 'marginMode': margin_mode,
+                          'leverage': leverage, 'clientOrderId': client_id}
+                requests.append({'symbol': symbol, 'type': 'limit', 'side': order['side'],
+                                 'amount': float(amount_str), 'price': float(price_str), 'params': params})
+            try:
+                responses = self.session.create_orders(requests) if requests else []
+            except Exception as e:
+                logger.warning(f"Batch-Order für {symbol} fehlgeschlagen ({e}), platziere einzeln.")
+                metrics.add('batch_errors')
+                responses = []
+                if not isinstance(e, ccxt.ExchangeError) or isinstance(e, ccxt.NetworkError):
+                    # Die Anfrage kann trotzdem angekommen sein: bereits offene Orders über ihre clientOrderId finden
+                    try:
+                        responses = [o for o in self.session.fetch_open_orders(symbol) if o.get('clientOrderId') in client_ids]
+                    except Exception as fetch_error:
+                        logger.warning(f"Offene Orders für {symbol} nicht abrufbar ({fetch_error}); Duplikate verhindert die clientOrderId.")
+            for response in responses:
+                i = client_ids.get(response.get('clientOrderId'))
+                if i is not None and response.get('status') != 'rejected' and response.get('id'):
+                    results[i] = {'ok': True, 'fallback': False, 'order': response, 'error': None}
+            for i, order in chunk:
+                if results[i] is not None:
+                    continue
+                metrics.add('fallbacks')
+                try:
+                    response = self.place_limit_order(symbol, order['side'], order['amount'], order['price'], leverage=leverage,
+                                                      margin_mode=margin_mode, reduce=order.get('reduce', False),
+                                                      client_order_id=client_id_of[i])
+                    results[i] = {'ok': True, 'fallback': True, 'order': response, 'error': None}
+                except Exception as e:
+                    results[i] = {'ok': False, 'fallback': True, 'order': None, 'error': str(e)}
+        return results
@@ -0,0 +1,393 @@
+# code/utilities/exchange_simulator.py
+
+import json
+import os
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utilities.markets_cache import amount_to_precision, price_to_precision
+
+# Wie im Backtest: 0,05 % Gebühr pro Seite
+DEFAULT_FEE_PCT = 0.05
+DEFAULT_MARKET = {'amount_step': '0.0001', 'price_step': '0.0001', 'min_amount': 0.0001}
+STATE_VERSION = 1
+
+_TIMEFRAME_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_timeframe(timeframe: str) -> int:
+    """Länge eines ccxt-Zeitrahmens ('15m', '4h', '1d') in Sekunden."""
+    return int(timeframe[:-1]) * _TIMEFRAME_UNITS[timeframe[-1]]
+
+
+class SimulatedClock:
+    """Steuerbare Uhr des Simulators (Epoch-Millisekunden)."""
+
+    def __init__(self, now_ms: int = 0) -> None:
+        self.now_ms = int(now_ms)
+
+    def milliseconds(self) -> int:
+        return self.now_ms
+
+
+class SimulatedSession:
+    """Die Teile der ccxt-Session, die der Bot direkt nutzt (Zeitrahmen und Uhrzeit)."""
+
+    def __init__(self, clock: SimulatedClock) -> None:
+        self.clock = clock
+
+    @staticmethod
+    def parse_timeframe(timeframe: str) -> int:
+        return parse_timeframe(timeframe)
+
+    def milliseconds(self) -> int:
+        return self.clock.milliseconds()
+
+
+class SimulatedExchange:
+    """
+    In-Process-Börse mit der Schnittstelle von `BitgetFutures` für Replay und Paper-Trading. Hinterlegte
+    historische Kerzen werden beim Vorstellen der Uhr (`advance_to`) Kerze für Kerze gegen die offenen
+    Limit- und Trigger-Orders abgeglichen. Der Kursverlauf innerhalb einer Kerze wird wie üblich angenommen:
+    Open → Low → High → Close bei steigenden, Open → High → Low → Close bei fallenden Kerzen.
+    Positionen werden getrennt nach Seite (Hedge-Modus) mit isolierter Margin geführt; Liquidationen,
+    Funding und Slippage werden nicht simuliert. Trigger-Orders lösen in der Richtung aus, in der der
+    Triggerpreis beim Platzieren vom letzten Kurs aus lag.
+    """
+
+    def __init__(self, candles: Dict[str, pd.DataFrame], timeframe: str, balance: float = 1000.0,
+                 fee_pct: float = DEFAULT_FEE_PCT, markets: Optional[Dict[str, Dict[str, Any]]] = None,
+                 start_ms: Optional[int] = None) -> None:
+        self.timeframe = timeframe
+        self.timeframe_ms = parse_timeframe(timeframe) * 1000
+        self.fee = fee_pct / 100
+        self.cash = float(balance)
+        self._data = {}
+        self._cursor = {}
+        self.last_price = {}
+        for symbol, data in candles.items():
+            self.extend_candles(symbol, data)
+        self.precision = {}
+        for symbol in self._data:
+            market = {**DEFAULT_MARKET, **((markets or {}).get(symbol, {}))}
+            self.precision[symbol] = {'amount_step': Decimal(str(market['amount_step'])),
+                                      'price_step': Decimal(str(market['price_step'])),
+                                      'min_amount': market['min_amount'], 'min_cost': market.get('min_cost'),
+                                      'amount_precision': market.get('amount_precision', market['amount_step'])}
+        first = min((d['ts'][0] for d in self._data.values() if len(d['ts'])), default=0)
+        self.clock = SimulatedClock(start_ms if start_ms is not None else first)
+        self.session = SimulatedSession(self.clock)
+        self.orders = {}
+        # Nur die offenen Orders (Reihenfolge wie in `orders`); Matching und Abfragen laufen nicht über die Historie
+        self.open_orders = {}
+        self.positions = {}
+        self.trades = []
+        self._next_id = 1
+        self.ticks = 0
+
+    # --- Kerzen und Uhr ---
+
+    def extend_candles(self, symbol: str, data: pd.DataFrame) -> None:
+        """Fügt Kerzen hinzu (z.B. im Paper-Modus neu geladene); bereits bekannte Zeitstempel werden ignoriert."""
+        ts = data.index.as_unit('ms').asi8 if data.index.tz is None else data.index.tz_convert('UTC').as_unit('ms').asi8
+        new = {'ts': ts.astype(np.int64), **{c: data[c].to_numpy(dtype=np.float64) for c in ('open', 'high', 'low', 'close', 'volume')}}
+        if symbol in self._data:
+            old = self._data[symbol]
+            keep = new['ts'] > (old['ts'][-1] if len(old['ts']) else -1)
+            new = {k: np.concatenate([old[k], v[keep]]) for k, v in new.items()}
+        self._data[symbol] = new
+        self._cursor.setdefault(symbol, 0)
+
+    def advance_to(self, now_ms: int) -> int:
+        """Stellt die Uhr vor und gleicht alle bis dahin abgeschlossenen Kerzen ab. Gibt deren Anzahl zurück."""
+        self.clock.now_ms = max(self.clock.now_ms, int(now_ms))
+        matched = 0
+        for symbol, data in self._data.items():
+            i = self._cursor[symbol]
+            end = np.searchsorted(data['ts'], self.clock.now_ms - self.timeframe_ms, side='right')
+            while i < end:
+                self._match_candle(symbol, data['open'][i], data['high'][i], data['low'][i], data['close'][i], int(data['ts'][i]))
+                i += 1
+                matched += 1
+            self._cursor[symbol] = i
+        self.ticks += matched
+        return matched
+
+    def closed_candles(self, symbol: str, start: int = 0) -> Dict[str, np.ndarray]:
+        """Bereits abgeglichene Kerzen ab Index `start` als Arrays (ts, open, high, low, close, volume), ohne DataFrame."""
+        data = self._data[symbol]
+        end = self._cursor[symbol]
+        return {k: v[start:end] for k, v in data.items()}
+
+    def fetch_recent_ohlcv(self, symbol: str, timeframe: str, limit: int = 1000) -> pd.DataFrame:
+        """
+        Die letzten `limit` Kerzen bis zur aktuellen Uhrzeit. Wie bei der Börse ist die letzte Zeile die noch
+        laufende Kerze; sie enthält nur bereits vergangene Kurse (kein Blick in die Zukunft).
+        """
+        data = self._data[symbol]
+        tf_ms = parse_timeframe(timeframe) * 1000
+        end = np.searchsorted(data['ts'], self.clock.now_ms - self.timeframe_ms, side='right')
+        current_start = self.clock.now_ms - self.clock.now_ms % tf_ms
+        # Laufende Kerze ohne abgeschlossene Teilkerzen: nur der letzte Kurs ist bekannt
+        price = self.last_price.get(symbol, data['open'][min(end, len(data['ts']) - 1)])
+        if tf_ms == self.timeframe_ms:
+            # Direkt aus den Arrays zusammensetzen (ein DataFrame pro Aufruf, kein concat)
+            start = max(0, end - limit + 1)
+            columns = {c: np.append(data[c][start:end], price) for c in ('open', 'high', 'low', 'close')}
+            columns['volume'] = np.append(data['volume'][start:end], 0.0)
+            ts = np.append(data['ts'][start:end], current_start)
+            frame = pd.DataFrame(columns, index=pd.DatetimeIndex(ts.astype('datetime64[ms]'), tz='UTC'))
+        else:
+            # Gröberer Zeitrahmen: aus den abgeschlossenen Kerzen des Simulators zusammensetzen
+            start = max(0, end - (limit + 1) * (tf_ms // self.timeframe_ms))
+            fine = pd.DataFrame({c: data[c][start:end] for c in ('open', 'high', 'low', 'close', 'volume')},
+                                index=pd.to_datetime(data['ts'][start:end], unit='ms', utc=True))
+            frame = fine.resample(f"{tf_ms // 1000}s", origin='epoch').agg(
+                {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}).dropna()
+            if frame.empty or frame.index[-1].value // 1_000_000 < current_start:
+                row = pd.DataFrame({'open': price, 'high': price, 'low': price, 'close': price, 'volume': 0.0},
+                                   index=pd.to_datetime([current_start], unit='ms', utc=True))
+                frame = pd.concat([frame, row])
+        frame.index.name = 'timestamp'
+        return frame.iloc[-limit:]
+
+    # --- Matching ---
+
+    def _match_candle(self, symbol: str, o: float, h: float, l: float, c: float, ts: int) -> None:
+        path = (o, l, h, c) if c >= o else (o, h, l, c)
+        for a, b in zip(path, path[1:]):
+            self._match_segment(symbol, a, b, ts)
+        self.last_price[symbol] = c
+
+    def _match_segment(self, symbol: str, a: float, b: float, ts: int) -> None:
+        hits = []
+        for order in self.open_orders.values():
+            if order['symbol'] != symbol:
+                continue
+            if order['trigger']:
+                price, rising = order['triggerPrice'], order['info']['direction'] == 'up'
+            else:
+                price, rising = order['price'], order['side'] == 'sell'
+            if (rising and a >= price) or (not rising and a <= price):
+                # Schon beim Start des Abschnitts erreicht (z.B. direkt ausführbar platziert)
+                hits.append((0.0, a if not order['trigger'] else price, order))
+            elif min(a, b) <= price <= max(a, b):
+                hits.append((abs(price - a), price, order))
+        for _, price, order in sorted(hits, key=lambda hit: hit[0]):
+            if order['status'] == 'open':
+                self._fill(order, price, ts)
+
+    def _fill(self, order: Dict[str, Any], price: float, ts: int) -> None:
+        symbol, amount = order['symbol'], order['remaining']
+        leverage = float(order['info'].get('leverage') or 1)
+        if order['reduceOnly']:
+            position_side = 'long' if order['side'] == 'sell' else 'short'
+            position = self.positions.get((symbol, position_side))
+            if position is None:
+                order['status'] = 'canceled'
+                del self.open_orders[order['id']]
+                return
+            amount = min(amount, position['contracts'])
+            direction = 1 if position_side == 'long' else -1
+            pnl = (price - position['entryPrice']) * amount * direction
+            released = position['margin'] * amount / position['contracts']
+            self.cash += pnl - price * amount * self.fee
+            position['contracts'] -= amount
+            position['margin'] -= released
+            if position['contracts'] <= 1e-12:
+                del self.positions[(symbol, position_side)]
+            self.trades.append({'timestamp': ts, 'symbol': symbol, 'side': order['side'], 'price': price, 'amount': amount,
+                                'pnl': pnl, 'order': order['id'], 'reduceOnly': True})
+        else:
+            position_side = 'long' if order['side'] == 'buy' else 'short'
+            position = self.positions.setdefault((symbol, position_side),
+                                                 {'contracts': 0.0, 'entryPrice': 0.0, 'margin': 0.0, 'leverage': leverage})
+            total = position['contracts'] + amount
+            position['entryPrice'] = (position['entryPrice'] * position['contracts'] + price * amount) / total
+            position['contracts'] = total
+            position['margin'] += price * amount / leverage
+            position['leverage'] = leverage
+            self.cash -= price * amount * self.fee
+            self.trades.append({'timestamp': ts, 'symbol': symbol, 'side': order['side'], 'price': price, 'amount': amount,
+                                'pnl': 0.0, 'order': order['id'], 'reduceOnly': False})
+        order.update({'status': 'closed', 'filled': order['filled'] + amount, 'remaining': 0.0, 'average': price,
+                      'lastTradeTimestamp': ts})
+        del self.open_orders[order['id']]
+
+    # --- Schnittstelle von BitgetFutures ---
+
+    def _market(self, symbol: str) -> Dict[str, Any]:
+        if symbol not in self.precision:
+            raise Exception(f"Markt-Informationen für {symbol} konnten nicht geladen werden.")
+        return self.precision[symbol]
+
+    def amount_to_precision(self, symbol: str, amount: float) -> str:
+        return amount_to_precision(self._market(symbol), amount)
+
+    def price_to_precision(self, symbol: str, price: float) -> str:
+        return price_to_precision(self._market(symbol), price)
+
+    def fetch_min_amount_tradable(self, symbol: str) -> float:
+        return self._market(symbol)['min_amount']
+
+    def get_market_info(self, symbol: str) -> Dict[str, Any]:
+        market = self._market(symbol)
+        return {'min_amount': market['min_amount'], 'amount_precision': market['amount_precision']}
+
+    def fetch_ticker(self, symbol: str) -> Dict[str, Any]:
+        price = self.last_price.get(symbol)
+        return {'symbol': symbol, 'last': price, 'close': price, 'timestamp': self.clock.now_ms}
+
+    def _reserved_order_margin(self) -> float:
+        return sum(o['price'] * o['remaining'] / float(o['info'].get('leverage') or 1) for o in self.open_orders.values()
+                   if not o['trigger'] and not o['reduceOnly'])
+
+    def equity(self) -> float:
+        """Guthaben inklusive unrealisierter Gewinne/Verluste zum letzten Kurs."""
+        unrealized = sum((self.last_price.get(symbol, p['entryPrice']) - p['entryPrice']) * p['contracts'] * (1 if side == 'long' else -1)
+                         for (symbol, side), p in self.positions.items())
+        return self.cash + unrealized
+
+    def fetch_balance(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        used = sum(p['margin'] for p in self.positions.values()) + self._reserved_order_margin()
+        return {'USDT': {'free': self.cash - used, 'used': used, 'total': self.equity()}}
+
+    def _open(self, symbol: str, trigger: bool) -> List[Dict[str, Any]]:
+        return [dict(o) for o in self.open_orders.values() if o['symbol'] == symbol and o['trigger'] == trigger]
+
+    def fetch_open_orders(self, symbol: str) -> List[Dict[str, Any]]:
+        return self._open(symbol, trigger=False)
+
+    def fetch_open_trigger_orders(self, symbol: str) -> List[Dict[str, Any]]:
+        return self._open(symbol, trigger=True)
+
+    def fetch_my_trades(self, symbol: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return [t for t in self.trades if t['symbol'] == symbol][-limit:]
+
+    def fetch_open_positions(self, symbol: str) -> List[Dict[str, Any]]:
+        return [{'symbol': symbol, 'side': side, 'contracts': p['contracts'], 'entryPrice': p['entryPrice'],
+                 'leverage': p['leverage'], 'initialMargin': p['margin']}
+                for (s, side), p in self.positions.items() if s == symbol and p['contracts'] > 0]
+
+    def set_margin_mode(self, symbol: str, margin_mode: str = 'isolated') -> None:
+        pass
+
+    def set_leverage(self, symbol: str, leverage: int, margin_mode: str) -> None:
+        pass
+
+    def _new_order(self, symbol: str, type: str, side: str, amount: float, price: Optional[float], reduce: bool,
+                   trigger_price: Optional[float] = None, info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        amount = float(self.amount_to_precision(symbol, amount))
+        if amount <= 0:
+            raise Exception(f"amount of {symbol} must be greater than minimum amount precision")
+        order_id = str(self._next_id)
+        self._next_id += 1
+        order = {'id': order_id, 'clientOrderId': None, 'symbol': symbol, 'type': type, 'side': side,
+                 'price': price, 'amount': amount, 'filled': 0.0, 'remaining': amount, 'average': None,
+                 'status': 'open', 'reduceOnly': reduce, 'trigger': trigger_price is not None,
+                 'triggerPrice': trigger_price, 'stopPrice': trigger_price, 'timestamp': self.clock.now_ms,
+                 'info': info or {}}
+        self.orders[order_id] = order
+        self.open_orders[order_id] = order
+        return dict(order)
+
+    def place_limit_order(self, symbol: str, side: str, amount: float, price: float, leverage: int, margin_mode: str,
+                          reduce: bool = False) -> Dict[str, Any]:
+        try:
+            price = float(self.price_to_precision(symbol, price))
+            needed = price * float(self.amount_to_precision(symbol, amount)) / leverage
+            if not reduce and needed > self.fetch_balance()['USDT']['free'] + 1e-9:
+                raise Exception("insufficient balance")
+            return self._new_order(symbol, 'limit', side, amount, price, reduce,
+                                   info={'leverage': str(leverage), 'marginMode': margin_mode})
+        except Exception as e:
+            raise Exception(f"Failed to place limit order of {amount} {symbol} at price {price}: {e}")
+
+    def place_trigger_market_order(self, symbol: str, side: str, amount: float, trigger_price: float,
+                                   reduce: bool = False) -> Optional[Dict[str, Any]]:
+        trigger_price = float(self.price_to_precision(symbol, trigger_price))
+        last = self.last_price.get(symbol, trigger_price)
+        return self._new_order(symbol, 'market', side, amount, None, reduce, trigger_price,
+                               info={'direction': 'up' if trigger_price > last else 'down'})
+
+    def place_limit_orders(self, symbol: str, orders: List[Dict[str, Any]], leverage: int, margin_mode: str) -> List[Dict[str, Any]]:
+        results = []
+        for order in orders:
+            try:
+                response = self.place_limit_order(symbol, order['side'], order['amount'], order['price'], leverage=leverage,
+                                                  margin_mode=margin_mode, reduce=order.get('reduce', False))
+                results.append({'ok': True, 'fallback': False, 'order': response, 'error': None})
+            except Exception as e:
+                results.append({'ok': False, 'fallback': False, 'order': None, 'error': str(e)})
+        return results
+
+    def _cancel(self, id: str, symbol: str, trigger: bool) -> Dict[str, Any]:
+        order = self.orders.get(id)
+        if order is None or order['symbol'] != symbol or order['trigger'] != trigger or order['status'] != 'open':
+            raise Exception(f"Failed to cancel the {symbol} {'trigger ' if trigger else ''}order {id}")
+        order['status'] = 'canceled'
+        del self.open_orders[id]
+        return dict(order)
+
+    def cancel_order(self, id: str, symbol: str) -> Dict[str, Any]:
+        return self._cancel(id, symbol, trigger=False)
+
+    def cancel_trigger_order(self, id: str, symbol: str) -> Dict[str, Any]:
+        return self._cancel(id, symbol, trigger=True)
+
+    def _cancel_many(self, ids: List[str], symbol: str, trigger: bool) -> List[Dict[str, Any]]:
+        results = []
+        for id in ids:
+            try:
+                self._cancel(id, symbol, trigger)
+                results.append({'id': id, 'ok': True, 'fallback': False, 'error': None})
+            except Exception as e:
+                results.append({'id': id, 'ok': False, 'fallback': False, 'error': str(e)})
+        return results
+
+    def cancel_orders(self, ids: List[str], symbol: str) -> List[Dict[str, Any]]:
+        return self._cancel_many(ids, symbol, trigger=False)
+
+    def cancel_trigger_orders(self, ids: List[str], symbol: str) -> List[Dict[str, Any]]:
+        return self._cancel_many(ids, symbol, trigger=True)
+
+    # --- Paper-Trading: Zustand zwischen zwei Läufen ---
+
+    def state(self) -> Dict[str, Any]:
+        # Abgeschlossene und stornierte Orders werden nicht mitgeschrieben
+        return {'version': STATE_VERSION, 'now_ms': self.clock.now_ms, 'cash': self.cash, 'next_id': self._next_id,
+                'orders': list(self.open_orders.values()),
+                'positions': [{'symbol': s, 'side': side, **p} for (s, side), p in self.positions.items()],
+                'last_price': self.last_price, 'trades': self.trades[-1000:],
+                'processed_until': {s: int(d['ts'][self._cursor[s] - 1]) for s, d in self._data.items() if self._cursor[s] > 0}}
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.state(), f)
+        os.replace(tmp, path)
+
+    def load_state(self, path: str) -> bool:
+        """Übernimmt Konto, Orders und Positionen eines früheren Laufs; False, wenn es keinen gibt."""
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        if state.get('version') != STATE_VERSION:
+            return False
+        self.clock.now_ms = max(self.clock.now_ms, state['now_ms'])
+        self.cash = state['cash']
+        self._next_id = state['next_id']
+        self.orders = {o['id']: o for o in state['orders']}
+        self.open_orders = dict(self.orders)
+        self.positions = {(p.pop('symbol'), p.pop('side')): p for p in state['positions']}
+        self.last_price.update(state['last_price'])
+        self.trades = state['trades']
+        for symbol, ts in state['processed_until'].items():
+            if symbol in self._data:
+                self._cursor[symbol] = int(np.searchsorted(self._data[symbol]['ts'], ts, side='right'))
+        return True
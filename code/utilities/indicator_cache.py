@@ -0,0 +1,102 @@
+# code/utilities/indicator_cache.py
+
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from utilities.strategy_logic import calculate_average, calculate_atr
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def dataset_fingerprint(data):
+    """
+    Stabiler Hash über Zeitindex und die Preisspalten, aus denen die Indikatoren berechnet werden.
+    Zwei inhaltlich gleiche DataFrames (z.B. aus verschiedenen Prozessen) erhalten denselben Wert.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(data.index.asi8 if hasattr(data.index, 'asi8') else data.index.to_numpy()).tobytes())
+    for column in ('high', 'low', 'close'):
+        h.update(np.ascontiguousarray(data[column].to_numpy(dtype=np.float64)).tobytes())
+    return h.hexdigest()
+
+
+class IndicatorCache:
+    """
+    LRU-Cache für die teuren `ta`-Berechnungen (Durchschnitt, ATR, Trend-SMA) mit Speicherbudget.
+    Die Einträge sind schreibgeschützte float64-Arrays; die Envelope-Bänder werden daraus
+    per Multiplikation abgeleitet und nicht gespeichert.
+    Die DataFrames werden als unveränderlich behandelt: ihr Fingerprint wird pro Objekt gemerkt.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self._lock = threading.RLock()
+
+    def fingerprint(self, data):
+        with self._lock:
+            known = self._fingerprints.get(id(data))
+            if known is not None and known[0]() is data and known[1] == data.shape:
+                return known[2]
+            fingerprint = dataset_fingerprint(data)
+            # Eintrag verschwindet automatisch, sobald der DataFrame freigegeben wird
+            ref = weakref.ref(data, lambda _, key=id(data): self._fingerprints.pop(key, None))
+            self._fingerprints[id(data)] = (ref, data.shape, fingerprint)
+            return fingerprint
+
+    def _get_or_compute(self, key, compute):
+        with self._lock:
+            values = self._entries.get(key)
+            if values is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return values
+            self.misses += 1
+
+        values = np.ascontiguousarray(compute(), dtype=np.float64)
+        values.flags.writeable = False
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = values
+                self.current_bytes += values.nbytes
+                while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted.nbytes
+            return self._entries[key]
+
+    def average(self, data, avg_type, avg_period):
+        key = ('average', self.fingerprint(data), avg_type, int(avg_period))
+        return self._get_or_compute(key, lambda: calculate_average(data, avg_type, avg_period).to_numpy(dtype=np.float64))
+
+    def atr(self, data, atr_period):
+        key = ('atr', self.fingerprint(data), atr_period)
+        return self._get_or_compute(key, lambda: calculate_atr(data, atr_period).to_numpy(dtype=np.float64))
+
+    def trend_sma(self, data, period):
+        return self.average(data, 'SMA', period)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+# Prozessweiter Standard-Cache für Backtests und Optimierer
+INDICATOR_CACHE = IndicatorCache()
@@ -0,0 +1,145 @@
+# code/utilities/market_feed.py
+
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+CANDLE_CLOSED = 'candle_closed'
+ORDER_UPDATE = 'order_update'
+
+# data: bei CANDLE_CLOSED die abgeschlossene Kerze [ts, open, high, low, close, volume] (ts in ms),
+# bei ORDER_UPDATE die ccxt-Order mit (Teil-)Ausführung
+FeedEvent = namedtuple('FeedEvent', ['kind', 'symbol', 'data', 'received_at'])
+
+
+class MarketFeed:
+    """
+    Quelle für Markt- und Order-Ereignisse des Live-Bots. Ereignisse landen in einer Warteschlange und werden
+    mit `next_event` abgeholt; Unterklassen füllen sie (Websocket im Betrieb, Replay in Tests).
+    """
+
+    def __init__(self):
+        self._events = queue.Queue()
+        self.subscriptions = []
+
+    def subscribe(self, symbol, timeframe):
+        self.subscriptions.append((symbol, timeframe))
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def emit(self, kind, symbol, data):
+        self._events.put(FeedEvent(kind, symbol, data, time.time()))
+
+    def next_event(self, timeout=None):
+        """Nächstes Ereignis; None, wenn innerhalb von `timeout` Sekunden keines eintrifft (0 = nicht warten)."""
+        try:
+            if timeout == 0:
+                return self._events.get_nowait()
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ReplayFeed(MarketFeed):
+    """Lokaler Ersatz für den Websocket: spielt vorgegebene Ereignisse ab, weitere lassen sich mit `emit` einspeisen."""
+
+    def __init__(self, events=()):
+        super().__init__()
+        for kind, symbol, data in events:
+            self.emit(kind, symbol, data)
+
+    @classmethod
+    def from_candles(cls, symbol, data):
+        """Ein CANDLE_CLOSED-Ereignis pro Zeile eines OHLCV-DataFrames (UTC-Index)."""
+        timestamps = data.index.as_unit('ms').asi8
+        rows = data[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=float)
+        return cls((CANDLE_CLOSED, symbol, [int(ts), *map(float, row)]) for ts, row in zip(timestamps, rows))
+
+
+class BitgetWebsocketFeed(MarketFeed):
+    """
+    Websocket-Feed über ccxt.pro in einem eigenen Thread mit asyncio-Loop. Eine Kerze gilt als abgeschlossen,
+    sobald die erste Aktualisierung der Folgekerze eintrifft. Orders werden gemeldet, sobald sich ihre
+    ausgeführte Menge ändert (Einstieg über ein Grid oder Auslösung von TP/SL).
+    """
+
+    RECONNECT_DELAY = 5.0
+
+    def __init__(self, api_setup=None, demo_mode=False, markets=None):
+        super().__init__()
+        import ccxt.pro  # nur im Event-Modus benötigt
+        config = dict(api_setup or {})
+        config.setdefault('options', {'defaultType': 'future'})
+        self.exchange = ccxt.pro.bitget(config)
+        if demo_mode:
+            self.exchange.set_sandbox_mode(True)
+        if markets:
+            self.exchange.set_markets(markets)
+        self._private = api_setup is not None
+        self._loop = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='market-feed', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.exchange.close(), self._loop)
+            self._thread.join(timeout=5)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        tasks = [self._watch_candles(symbol, timeframe) for symbol, timeframe in self.subscriptions]
+        if self._private:
+            tasks += [self._watch_orders(symbol) for symbol in {symbol for symbol, _ in self.subscriptions}]
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+    async def _watch_candles(self, symbol, timeframe):
+        last = None
+        while self._running:
+            try:
+                ohlcv = await self.exchange.watch_ohlcv(symbol, timeframe)
+            except Exception as e:
+                if not self._running:
+                    break
+                logger.warning(f"Kerzen-Stream für {symbol} unterbrochen ({e}), verbinde neu...")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+            for candle in sorted(ohlcv, key=lambda c: c[0]):
+                if last is not None and candle[0] > last[0]:
+                    self.emit(CANDLE_CLOSED, symbol, list(last))
+                if last is None or candle[0] >= last[0]:
+                    last = candle
+
+    async def _watch_orders(self, symbol):
+        filled = {}
+        while self._running:
+            try:
+                orders = await self.exchange.watch_orders(symbol)
+            except Exception as e:
+                if not self._running:
+                    break
+                logger.warning(f"Order-Stream für {symbol} unterbrochen ({e}), verbinde neu...")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+            for order in orders:
+                amount_filled = order.get('filled') or 0
+                if amount_filled > filled.get(order['id'], 0):
+                    filled[order['id']] = amount_filled
+                    self.emit(ORDER_UPDATE, symbol, order)
+                if order.get('status') in ('closed', 'canceled'):
+                    filled.pop(order['id'], None)
@@ -0,0 +1,88 @@
+# code/utilities/markets_cache.py
+
+import os
+import json
+import time
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+
+# Die Kontraktliste ändert sich selten; nach Ablauf (oder bei unbekanntem Symbol) wird neu geladen
+MARKETS_TTL_SECONDS = 6 * 60 * 60
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'cache')
+
+
+class MarketsCache:
+    """
+    Persistente Kopie von `load_markets` (Märkte und Währungen) als JSON mit Ablaufzeit.
+    Ein Bot-Start liest nur noch die Datei statt die komplette Kontraktliste herunterzuladen.
+    """
+
+    def __init__(self, path, ttl=MARKETS_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+
+    def load(self):
+        """Gibt (markets, currencies) zurück, oder None, wenn kein gültiger, frischer Cache existiert."""
+        try:
+            with open(self.path, 'r') as f:
+                cached = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if cached.get('version') != CACHE_VERSION or time.time() - cached.get('saved_at', 0) > self.ttl:
+            return None
+        return cached['markets'], cached.get('currencies')
+
+    def save(self, markets, currencies=None):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'saved_at': time.time(), 'markets': markets,
+                       'currencies': currencies}, f, default=str)
+        os.replace(tmp, self.path)
+
+    def invalidate(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def precision_table(markets):
+    """
+    Vorberechnete Rundungs- und Limit-Tabelle pro Symbol. Bitget nutzt Tick-Größen, d.h.
+    `precision` gibt die Schrittweite an (z.B. 0.01), nicht die Anzahl Nachkommastellen.
+    """
+    table = {}
+    for symbol, market in markets.items():
+        precision = market.get('precision') or {}
+        limits = market.get('limits') or {}
+        table[symbol] = {
+            'amount_step': _step(precision.get('amount')),
+            'price_step': _step(precision.get('price')),
+            'min_amount': (limits.get('amount') or {}).get('min'),
+            'min_cost': (limits.get('cost') or {}).get('min'),
+            'amount_precision': precision.get('amount'),
+        }
+    return table
+
+
+def _step(value):
+    return Decimal(str(value)) if value is not None else None
+
+
+def _to_precision(value, step, rounding):
+    # Wie ccxt (decimal_to_precision mit TICK_SIZE, ohne Padding): Vielfaches der Schrittweite als String
+    steps = (Decimal(repr(float(value))) / step).to_integral_value(rounding=rounding)
+    result = steps * step
+    return format(result.normalize(), 'f') if result != 0 else '0'
+
+
+def amount_to_precision(entry, amount):
+    """Menge auf die Schrittweite abschneiden (wie ccxt TRUNCATE)."""
+    return _to_precision(amount, entry['amount_step'], ROUND_DOWN)
+
+
+def price_to_precision(entry, price):
+    """Preis auf den nächsten Tick runden (wie ccxt ROUND)."""
+    return _to_precision(price, entry['price_step'], ROUND_HALF_UP)
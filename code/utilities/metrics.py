@@ -0,0 +1,252 @@
+# code/utilities/metrics.py
+
+import os
+import json
+import time
+import threading
+from contextlib import nullcontext
+from functools import wraps
+from typing import Any, Dict, Optional
+
+DEFAULT_METRICS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'metrics')
+METRIC_PREFIX = 'livetradingbot'
+
+PHASE = 'phase'
+CALL = 'call'
+
+_NULL_SPAN = nullcontext()
+
+
+def _new_stats() -> Dict[str, float]:
+    return {'count': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+
+
+def _label(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class _Span:
+    __slots__ = ('metrics', 'kind', 'name', 'start')
+
+    def __init__(self, metrics: 'Metrics', kind: str, name: str) -> None:
+        self.metrics = metrics
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self) -> '_Span':
+        self.metrics._stack().append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self.start
+        self.metrics._stack().pop()
+        self.metrics.observe(self.kind, self.name, elapsed, error=exc_type is not None)
+        return False
+
+
+class Metrics:
+    """
+    Zeitmessung für den Live-Zyklus: Phasen des Bots (Orders laden, Marktdaten, Planung, Abgleich) und einzelne
+    Börsenaufrufe von BitgetFutures mit Anzahl, Fehlern, Dauer sowie Zählern wie Wiederholungen, Einzel-Fallbacks
+    und Wartezeit im Rate-Limiter. Am Ende jedes Zyklus wird eine JSON-Zeile mit den Werten dieses Zyklus
+    angehängt und die Prometheus-Textdatei (node_exporter textfile collector) mit den Summen seit Prozessstart
+    neu geschrieben. Ausgeschaltet (Standard) kostet ein Messpunkt nur die Abfrage von `enabled`.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.prometheus_file = None
+        self.jsonl_file = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._totals = {}
+        self._cycles = {}
+
+    def enable(self, prometheus_file: Optional[str] = None, jsonl_file: Optional[str] = None) -> None:
+        for path in (prometheus_file, jsonl_file):
+            if path:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.prometheus_file = prometheus_file
+        self.jsonl_file = jsonl_file
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name: str, kind: str = CALL):
+        """Kontextmanager, der die Dauer eines Aufrufs (bzw. einer Phase) misst; Ausnahmen zählen als Fehler."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, kind, name)
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False) -> None:
+        if not self.enabled:
+            return
+        symbol = getattr(self._local, 'symbol', None) or ''
+        current = getattr(self._local, 'cycle', None)
+        with self._lock:
+            targets = [self._totals.setdefault((symbol, kind, name), _new_stats())]
+            if current is not None:
+                targets.append(current.setdefault((kind, name), _new_stats()))
+            for stats in targets:
+                stats['count'] += 1
+                stats['errors'] += int(error)
+                stats['seconds'] += seconds
+                stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    def add(self, counter: str, value: float = 1, call: Optional[str] = None) -> None:
+        """Erhöht einen Zähler (z.B. 'retries') des innersten laufenden Aufrufs dieses Threads oder von `call`."""
+        if not self.enabled:
+            return
+        stack = self._stack()
+        name = call or (stack[-1] if stack else 'other')
+        symbol = getattr(self._local, 'symbol', None) or ''
+        current = getattr(self._local, 'cycle', None)
+        with self._lock:
+            targets = [self._totals.setdefault((symbol, CALL, name), _new_stats())]
+            if current is not None:
+                targets.append(current.setdefault((CALL, name), _new_stats()))
+            for stats in targets:
+                stats[counter] = stats.get(counter, 0) + value
+
+    def cycle(self, symbol: str):
+        """
+        Rahmen eines Zyklus: Messpunkte im selben Thread werden dem Symbol zugeordnet; am Ende wird exportiert.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Cycle(self, symbol)
+
+    def _finish_cycle(self, symbol: str, seconds: float, error: Optional[str], stats: Dict[tuple, Dict[str, float]]) -> None:
+        with self._lock:
+            cycle = self._cycles.setdefault(symbol, {'count': 0, 'errors': 0, 'seconds': 0.0})
+            cycle['count'] += 1
+            cycle['errors'] += int(error is not None)
+            cycle['seconds'] += seconds
+            cycle['last_seconds'] = seconds
+            cycle['last_timestamp'] = time.time()
+        record = {
+            'ts': round(time.time(), 3), 'symbol': symbol, 'duration_ms': round(seconds * 1000, 2), 'error': error,
+            'phases': {name: round(s['seconds'] * 1000, 2) for (kind, name), s in stats.items() if kind == PHASE},
+            'calls': {name: {'count': s['count'], 'errors': s['errors'], 'ms': round(s['seconds'] * 1000, 2),
+                             'max_ms': round(s['max_seconds'] * 1000, 2),
+                             **{k: v for k, v in s.items() if k not in ('count', 'errors', 'seconds', 'max_seconds')}}
+                      for (kind, name), s in stats.items() if kind == CALL},
+        }
+        try:
+            if self.jsonl_file:
+                with open(self.jsonl_file, 'a') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+            if self.prometheus_file:
+                self.write_prometheus(self.prometheus_file)
+        except OSError:
+            # Metriken sind Diagnose; ein Schreibfehler darf den Zyklus nicht stören
+            pass
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            totals = {key: dict(stats) for key, stats in self._totals.items()}
+            cycles = {symbol: dict(stats) for symbol, stats in self._cycles.items()}
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        family('cycles_total', 'counter', 'Ausgefuehrte Zyklen.')
+        lines += [f'{METRIC_PREFIX}_cycles_total{{symbol="{_label(s)}"}} {c["count"]}' for s, c in sorted(cycles.items())]
+        family('cycle_errors_total', 'counter', 'Zyklen mit Fehler.')
+        lines += [f'{METRIC_PREFIX}_cycle_errors_total{{symbol="{_label(s)}"}} {c["errors"]}' for s, c in sorted(cycles.items())]
+        family('cycle_seconds_total', 'counter', 'Summe der Zyklusdauer.')
+        lines += [f'{METRIC_PREFIX}_cycle_seconds_total{{symbol="{_label(s)}"}} {c["seconds"]:.6f}' for s, c in sorted(cycles.items())]
+        family('last_cycle_seconds', 'gauge', 'Dauer des letzten Zyklus.')
+        lines += [f'{METRIC_PREFIX}_last_cycle_seconds{{symbol="{_label(s)}"}} {c["last_seconds"]:.6f}' for s, c in sorted(cycles.items())]
+        family('last_cycle_timestamp_seconds', 'gauge', 'Ende des letzten Zyklus (Unix-Zeit).')
+        lines += [f'{METRIC_PREFIX}_last_cycle_timestamp_seconds{{symbol="{_label(s)}"}} {c["last_timestamp"]:.3f}' for s, c in sorted(cycles.items())]
+
+        for kind in (PHASE, CALL):
+            entries = sorted((symbol, name, stats) for (symbol, k, name), stats in totals.items() if k == kind)
+            if not entries:
+                continue
+            family(f'{kind}_seconds', 'summary', f'Dauer je {"Phase des Zyklus" if kind == PHASE else "Boersenaufruf"}.')
+            for symbol, name, stats in entries:
+                labels = f'symbol="{_label(symbol)}",{kind}="{_label(name)}"'
+                lines.append(f'{METRIC_PREFIX}_{kind}_seconds_sum{{{labels}}} {stats["seconds"]:.6f}')
+                lines.append(f'{METRIC_PREFIX}_{kind}_seconds_count{{{labels}}} {stats["count"]}')
+            family(f'{kind}_max_seconds', 'gauge', 'Laengste Dauer seit Prozessstart.')
+            for symbol, name, stats in entries:
+                lines.append(f'{METRIC_PREFIX}_{kind}_max_seconds{{symbol="{_label(symbol)}",{kind}="{_label(name)}"}} {stats["max_seconds"]:.6f}')
+            family(f'{kind}_errors_total', 'counter', 'Mit Ausnahme beendet.')
+            for symbol, name, stats in entries:
+                lines.append(f'{METRIC_PREFIX}_{kind}_errors_total{{symbol="{_label(symbol)}",{kind}="{_label(name)}"}} {stats["errors"]}')
+
+        counters = sorted({k for (_, kind, _), stats in totals.items() if kind == CALL for k in stats} - set(_new_stats()))
+        for counter in counters:
+            family(f'call_{counter}_total', 'counter', f'Zaehler {counter} je Boersenaufruf.')
+            for (symbol, kind, name), stats in sorted(totals.items()):
+                if kind == CALL and counter in stats:
+                    lines.append(f'{METRIC_PREFIX}_call_{counter}_total{{symbol="{_label(symbol)}",call="{_label(name)}"}} {stats[counter]:g}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        # Atomar ersetzen, damit der Collector nie eine halb geschriebene Datei liest
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+class _Cycle:
+    __slots__ = ('metrics', 'symbol', 'start', 'error', 'previous')
+
+    def __init__(self, metrics: Metrics, symbol: str) -> None:
+        self.metrics = metrics
+        self.symbol = symbol
+        self.error = None
+
+    def __enter__(self) -> '_Cycle':
+        local = self.metrics._local
+        self.previous = (getattr(local, 'symbol', None), getattr(local, 'cycle', None))
+        local.symbol, local.cycle = self.symbol, {}
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self.start
+        local = self.metrics._local
+        stats = local.cycle
+        local.symbol, local.cycle = self.previous
+        if exc is not None and self.error is None:
+            self.error = str(exc)
+        self.metrics._finish_cycle(self.symbol, elapsed, self.error, stats)
+        return False
+
+
+# Prozessweite Instanz; die Einstiegspunkte schalten sie mit --metrics ein
+metrics = Metrics()
+
+
+def timed(name: str):
+    """Dekorator: misst jeden Aufruf als Börsenaufruf `name`, sofern die Metriken eingeschaltet sind."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            with _Span(metrics, CALL, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable_metrics(name: str, metrics_dir: str = DEFAULT_METRICS_DIR) -> Metrics:
+    """Schaltet die Metriken ein: <dir>/<name>.prom (pro Prozess) und <dir>/cycles.jsonl (gemeinsam)."""
+    metrics.enable(os.path.join(metrics_dir, f"{name}.prom"), os.path.join(metrics_dir, 'cycles.jsonl'))
+    return metrics
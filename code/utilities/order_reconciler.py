@@ -0,0 +1,172 @@
+# code/utilities/order_reconciler.py
+
+import math
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from utilities.bitget_futures import BATCH_ORDER_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Standard-Toleranzen: Preise gelten innerhalb eines halben Ticks als gleich; Mengen dürfen leicht
+# abweichen, da sich das freie Guthaben zwischen zwei Zyklen durch Gebühren/Funding minimal ändert
+DEFAULT_PRICE_TOLERANCE_PCT = 0.0
+DEFAULT_AMOUNT_TOLERANCE_PCT = 1.0
+
+
+def _order_trigger_price(order: Dict[str, Any]) -> Optional[float]:
+    price = order.get('triggerPrice') or order.get('stopPrice')
+    return float(price) if price is not None else None
+
+
+def _order_leverage(order: Dict[str, Any]) -> Optional[float]:
+    leverage = (order.get('info') or {}).get('leverage')
+    try:
+        return float(leverage) if leverage not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _within(actual: float, target: float, tolerance: float) -> bool:
+    return actual is not None and abs(actual - target) <= tolerance
+
+
+def match_orders(desired: List[Dict[str, Any]], open_orders: List[Dict[str, Any]], price_key: str,
+                 price_tolerance, amount_tolerance_pct: float) -> Tuple[List, List, List]:
+    """
+    Ordnet gewünschte Orders den offenen Orders der Börse zu. Eine offene Order bleibt bestehen, wenn Seite,
+    Preis (innerhalb `price_tolerance(preis)`), Menge (innerhalb `amount_tolerance_pct`) und – falls bekannt – der
+    Hebel passen; jede offene Order wird höchstens einmal zugeordnet (bei mehreren Kandidaten die preislich nächste).
+    Gibt (behalten, stornieren, platzieren) zurück.
+    """
+    remaining = list(open_orders)
+    keep, place = [], []
+    for order in desired:
+        candidates = []
+        for open_order in remaining:
+            open_price = _order_trigger_price(open_order) if price_key == 'trigger_price' else open_order.get('price')
+            open_amount = open_order.get('amount')
+            if open_order.get('side') != order['side'] or open_price is None or open_amount is None:
+                continue
+            if not _within(float(open_price), order[price_key], price_tolerance(order[price_key])):
+                continue
+            if not _within(float(open_amount), order['amount'], order['amount'] * amount_tolerance_pct / 100):
+                continue
+            open_leverage = _order_leverage(open_order)
+            if order.get('leverage') is not None and open_leverage is not None and open_leverage != float(order['leverage']):
+                continue
+            candidates.append((abs(float(open_price) - order[price_key]), open_order))
+        if candidates:
+            best = min(candidates, key=lambda c: c[0])[1]
+            remaining.remove(best)
+            keep.append(best)
+        else:
+            place.append(order)
+    return keep, remaining, place
+
+
+class OrderReconciler:
+    """
+    Gleicht pro Zyklus die gewünschten Grid- und TP/SL-Orders mit den offenen Orders eines Symbols ab,
+    statt alles zu stornieren und neu zu platzieren. Unveränderte Orders bleiben liegen, nur abweichende
+    werden ersetzt. Preise und Mengen werden vorher wie beim Platzieren auf die Börsenpräzision gerundet.
+    """
+
+    def __init__(self, bitget, symbol: str, price_tolerance_pct: float = DEFAULT_PRICE_TOLERANCE_PCT,
+                 amount_tolerance_pct: float = DEFAULT_AMOUNT_TOLERANCE_PCT, logger=logger) -> None:
+        self.bitget = bitget
+        self.symbol = symbol
+        self.price_tolerance_pct = price_tolerance_pct
+        self.amount_tolerance_pct = amount_tolerance_pct
+        self.logger = logger
+        self.last_stats = None
+
+    def limit_order(self, side: str, amount: float, price: float, leverage: int, margin_mode: str) -> Dict[str, Any]:
+        return {'side': side, 'amount': float(self.bitget.amount_to_precision(self.symbol, amount)),
+                'price': float(self.bitget.price_to_precision(self.symbol, price)),
+                'leverage': leverage, 'margin_mode': margin_mode}
+
+    def trigger_order(self, side: str, amount: float, trigger_price: float) -> Dict[str, Any]:
+        return {'side': side, 'amount': float(self.bitget.amount_to_precision(self.symbol, amount)),
+                'trigger_price': float(self.bitget.price_to_precision(self.symbol, trigger_price))}
+
+    def _price_tolerance(self, price: float) -> float:
+        step = self.bitget.precision.get(self.symbol, {}).get('price_step')
+        half_tick = float(step) / 2 if step else 0.0
+        return max(price * self.price_tolerance_pct / 100, half_tick)
+
+    def reconcile(self, open_orders: List[Dict[str, Any]], open_trigger_orders: List[Dict[str, Any]],
+                  desired_orders: List[Dict[str, Any]], desired_trigger_orders: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Bringt die offenen Orders auf den gewünschten Stand. Grid-Orders werden erst storniert und dann neu
+        platziert (keine doppelt gebundene Margin), TP/SL-Trigger erst neu platziert und dann storniert,
+        damit die Position zu keinem Zeitpunkt ungeschützt ist. Gibt die Zahl der Anfragen und der
+        gegenüber „alles einzeln stornieren und neu platzieren“ gesparten Anfragen sowie die ausgeführten
+        Änderungen (`orders`) zurück. Einzelne
+        fehlgeschlagene Orders brechen den Abgleich nicht ab, werden am Ende aber als Fehler gemeldet
+        (`last_stats` ist dann trotzdem gesetzt).
+        """
+        self.last_stats = None
+        keep, cancel, place = match_orders(desired_orders, open_orders, 'price', self._price_tolerance, self.amount_tolerance_pct)
+        keep_t, cancel_t, place_t = match_orders(desired_trigger_orders, open_trigger_orders, 'trigger_price',
+                                                 self._price_tolerance, self.amount_tolerance_pct)
+
+        # Grid-Orders gebündelt (Batch-Endpunkte); Trigger-Orders kann Bitget nur einzeln anlegen
+        results = []
+        if cancel:
+            results += self.bitget.cancel_orders([order['id'] for order in cancel], self.symbol)
+        if place:
+            results += self.bitget.place_limit_orders(self.symbol, place, leverage=place[0]['leverage'], margin_mode=place[0]['margin_mode'])
+        placed_t = []
+        for order in place_t:
+            try:
+                self.bitget.place_trigger_market_order(self.symbol, order['side'], order['amount'], order['trigger_price'], reduce=True)
+            except Exception as e:
+                results.append({'ok': False, 'fallback': False, 'error': f"Trigger {order['side']} @ {order['trigger_price']}: {e}"})
+                continue
+            placed_t.append(order)
+        # Fehlt ein Ersatz, bleiben die alten Trigger liegen (reduce-only, sichern die Position weiter ab);
+        # sie werden im nächsten Zyklus abgeglichen
+        if len(placed_t) < len(place_t):
+            keep_t, cancel_t = keep_t + cancel_t, []
+        if cancel_t:
+            results += self.bitget.cancel_trigger_orders([order['id'] for order in cancel_t], self.symbol)
+        # Pro Batch eine Anfrage, dazu jede einzeln nachgeholte Order
+        calls = (_batch_requests(len(cancel)) + _batch_requests(len(place)) + len(place_t) + _batch_requests(len(cancel_t))
+                 + sum(1 for result in results if result['fallback']))
+
+        full_replace_calls = len(open_orders) + len(open_trigger_orders) + len(desired_orders) + len(desired_trigger_orders)
+        stats = {
+            'kept': len(keep) + len(keep_t), 'cancelled': len(cancel) + len(cancel_t), 'placed': len(place) + len(placed_t),
+            'api_calls': calls, 'api_calls_saved': full_replace_calls - calls,
+            'orders': ([{'action': 'cancel', 'type': 'limit', 'id': o['id'], 'side': o.get('side'), 'price': o.get('price')} for o in cancel]
+                       + [{'action': 'place', 'type': 'limit', **o} for o in place]
+                       + [{'action': 'place', 'type': 'trigger', **o} for o in placed_t]
+                       + [{'action': 'cancel', 'type': 'trigger', 'id': o['id'], 'side': o.get('side'),
+                           'price': _order_trigger_price(o)} for o in cancel_t]),
+        }
+        self.logger.info(f"Orders abgeglichen: {stats['kept']} unverändert, {stats['cancelled']} storniert, "
+                         f"{stats['placed']} platziert ({stats['api_calls_saved']} API-Aufrufe gespart).")
+        self.last_stats = stats
+        failed = [result['error'] for result in results if not result['ok']]
+        if failed:
+            raise Exception(f"Orderabgleich für {self.symbol} unvollständig ({len(failed)} fehlgeschlagen): {'; '.join(failed)}")
+        return stats
+
+
+def _batch_requests(n_orders: int) -> int:
+    return math.ceil(n_orders / BATCH_ORDER_LIMIT)
+
+
+def reserved_margin(open_orders: List[Dict[str, Any]], default_leverage: float) -> float:
+    """
+    Von offenen (Nicht-Reduce-)Limit-Orders gebundene Margin. Bleiben Grid-Orders liegen, fehlt sie im
+    freien Guthaben; für die Ordergröße wird sie wieder hinzugerechnet, wie nach dem früheren Stornieren.
+    """
+    margin = 0.0
+    for order in open_orders:
+        if order.get('reduceOnly') or order.get('price') is None:
+            continue
+        amount = order.get('remaining') if order.get('remaining') is not None else order.get('amount')
+        margin += float(order['price']) * float(amount or 0) / (_order_leverage(order) or default_leverage)
+    return margin
@@ -0,0 +1,47 @@
+# code/utilities/rate_limiter.py
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-sicherer Token-Bucket. `rate` Tokens pro Sekunde werden nachgefüllt, höchstens `capacity`
+    können sich ansammeln (Burst). Jede Anfrage verbraucht ihr Gewicht in Tokens und wartet notfalls.
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        if rate <= 0:
+            raise ValueError("Die Rate des Token-Buckets muss größer als 0 sein.")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, weight: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= weight:
+                self._tokens -= weight
+                return True
+            return False
+
+    def acquire(self, weight: float = 1.0) -> float:
+        """Blockiert, bis `weight` Tokens verfügbar sind. Gibt die gewartete Zeit in Sekunden zurück."""
+        if weight > self.capacity:
+            raise ValueError(f"Gewicht {weight} übersteigt die Kapazität des Token-Buckets ({self.capacity}).")
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= weight:
+                    self._tokens -= weight
+                    return waited
+                wait = (weight - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
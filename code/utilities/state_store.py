@@ -0,0 +1,139 @@
+# code/utilities/state_store.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+DEFAULT_STATE_DB = os.path.join(os.path.dirname(__file__), '..', '..', 'state', 'livetradingbot.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bot_state (
+    symbol TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    last_side TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    symbol TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    duration_ms REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS journal_symbol_ts ON journal (symbol, ts);
+CREATE INDEX IF NOT EXISTS journal_kind_ts ON journal (kind, ts);
+"""
+
+# Feste SQL-Texte: sqlite3 hält die vorbereiteten Statements pro Verbindung im Cache
+SELECT_STATE = "SELECT status, last_side FROM bot_state WHERE symbol = ?"
+INSERT_STATE = "INSERT OR IGNORE INTO bot_state (symbol, status, last_side, updated_at) VALUES (?, ?, ?, ?)"
+UPDATE_STATE = "UPDATE bot_state SET status = ?, last_side = ?, updated_at = ? WHERE symbol = ?"
+INSERT_JOURNAL = "INSERT INTO journal (ts, symbol, kind, duration_ms, data) VALUES (?, ?, ?, ?, ?)"
+
+# Einträge im Journal
+KIND_CYCLE = 'cycle'
+KIND_ORDER = 'order'
+KIND_FILL = 'fill'
+KIND_CLOSE = 'close'
+
+
+class StateStore:
+    """
+    Gemeinsamer Zustand aller Symbole in einer SQLite-Datenbank mit einer dauerhaft offenen Verbindung (WAL-Modus).
+    Neben dem Bot-Status pro Symbol gibt es ein Journal, in das nur angehängt wird: Zyklen samt Dauer,
+    platzierte/stornierte Orders, eröffnete und geschlossene Positionen. Die Verbindung wird von mehreren
+    Threads (Multi-Symbol-Runner) gemeinsam genutzt und ist daher durch eine Sperre geschützt.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_DB) -> None:
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, cached_statements=64)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Im WAL-Modus genügt NORMAL: ein Absturz kann höchstens die letzte Transaktion kosten, nie die Datei
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def ensure_symbol(self, symbol: str, legacy_db: Optional[str] = None) -> None:
+        """
+        Legt den Status eines Symbols an ('ok_to_trade'). Gibt es noch die frühere Datenbank pro Symbol
+        (bot_state_<symbol>.db), wird deren Status einmalig übernommen.
+        """
+        with self._lock:
+            if self._conn.execute(SELECT_STATE, (symbol,)).fetchone() is not None:
+                return
+            status, last_side = 'ok_to_trade', None
+            if legacy_db and os.path.exists(legacy_db):
+                legacy = sqlite3.connect(legacy_db)
+                try:
+                    row = legacy.execute("SELECT status, last_side FROM bot_state WHERE symbol = ?", (symbol,)).fetchone()
+                except sqlite3.Error:
+                    row = None
+                finally:
+                    legacy.close()
+                if row:
+                    status, last_side = row
+            with self._conn:
+                self._conn.execute(INSERT_STATE, (symbol, status, last_side, time.time()))
+
+    def get_status(self, symbol: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(SELECT_STATE, (symbol,)).fetchone()
+        if row:
+            return {"status": row[0], "last_side": row[1]}
+        return {"status": "ok_to_trade", "last_side": None}
+
+    def set_status(self, symbol: str, status: str, last_side: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(UPDATE_STATE, (status, last_side, time.time(), symbol))
+
+    def record(self, symbol: str, kind: str, data: Optional[Dict[str, Any]] = None, duration_ms: Optional[float] = None) -> None:
+        self.record_many([(symbol, kind, data, duration_ms)])
+
+    def record_many(self, entries: List[tuple]) -> None:
+        """Hängt mehrere Journal-Einträge (symbol, kind, data, duration_ms) in einer Transaktion an."""
+        now = time.time()
+        rows = [(now, symbol, kind, duration_ms, json.dumps(data, default=str) if data is not None else None)
+                for symbol, kind, data, duration_ms in entries]
+        with self._lock, self._conn:
+            self._conn.executemany(INSERT_JOURNAL, rows)
+
+    def journal(self, symbol: Optional[str] = None, kind: Optional[str] = None, since: Optional[float] = None,
+                limit: int = 1000) -> List[Dict[str, Any]]:
+        """Die neuesten Journal-Einträge (optional gefiltert nach Symbol, Art und Zeitpunkt in Unix-Sekunden)."""
+        query = "SELECT ts, symbol, kind, duration_ms, data FROM journal WHERE 1 = 1"
+        args = []
+        if symbol is not None:
+            query += " AND symbol = ?"
+            args.append(symbol)
+        if kind is not None:
+            query += " AND kind = ?"
+            args.append(kind)
+        if since is not None:
+            query += " AND ts >= ?"
+            args.append(since)
+        query += " ORDER BY ts DESC, id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [{'ts': ts, 'symbol': sym, 'kind': k, 'duration_ms': duration_ms, 'data': json.loads(data) if data else None}
+                for ts, sym, k, duration_ms, data in rows]
+
+    def cycle_latency(self, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Anzahl, Mittelwert und Maximum der Zyklusdauer (ms) pro Symbol."""
+        query = ("SELECT symbol, COUNT(*), AVG(duration_ms), MAX(duration_ms) FROM journal "
+                 "WHERE kind = ? AND ts >= ? GROUP BY symbol ORDER BY symbol")
+        with self._lock:
+            rows = self._conn.execute(query, (KIND_CYCLE, since or 0)).fetchall()
+        return [{'symbol': symbol, 'cycles': n, 'avg_ms': avg, 'max_ms': max_ms} for symbol, n, avg, max_ms in rows]
@@ -1,7 +1,24 @@
 # code/utilities/strategy_logic.py
 
 import pandas as pd
-import ta
+
+def calculate_average(data, avg_type, avg_period):
+    """Berechnet den gleitenden Durchschnitt (DCM, SMA oder WMA) als Series."""
+    import ta  # erst bei Bedarf laden; der Live-Bot rechnet inkrementell ohne `ta`
+    avg_period = int(avg_period)
+    if avg_type == 'DCM':
+        return ta.volatility.DonchianChannel(data['high'], data['low'], data['close'], window=avg_period).donchian_channel_mband()
+    elif avg_type == 'SMA':
+        return ta.trend.sma_indicator(data['close'], window=avg_period)
+    elif avg_type == 'WMA':
+        return ta.trend.wma_indicator(data['close'], window=avg_period)
+    else:
+        raise ValueError(f"Der Durchschnittstyp {avg_type} wird nicht unterstützt")
+
+def calculate_atr(data, atr_period):
+    """Berechnet den ATR-Indikator als Series."""
+    import ta
+    return ta.volatility.AverageTrueRange(data['high'], data['low'], data['close'], window=atr_period).average_true_range()
 
 def calculate_envelope_indicators(data, params):
     """
@@ -14,16 +31,8 @@ def calculate_envelope_indicators(data, params):
     atr_period = params.get('atr_period', 14)
 
     # 1. Alle Indikator-Berechnungen durchführen
-    if avg_type == 'DCM':
-        average = ta.volatility.DonchianChannel(data['high'], data['low'], data['close'], window=avg_period).donchian_channel_mband()
-    elif avg_type == 'SMA':
-        average = ta.trend.sma_indicator(data['close'], window=avg_period)
-    elif avg_type == 'WMA':
-        average = ta.trend.wma_indicator(data['close'], window=avg_period)
-    else:
-        raise ValueError(f"Der Durchschnittstyp {avg_type} wird nicht unterstützt")
-
-    atr = ta.volatility.AverageTrueRange(data['high'], data['low'], data['close'], window=atr_period).average_true_range()
+    average = calculate_average(data, avg_type, avg_period)
+    atr = calculate_atr(data, atr_period)
     atr_pct = (atr / data['close']) * 100
 
     # 2. Einen neuen, leeren DataFrame für die Indikatoren erstellen
@@ -43,7 +52,7 @@ def calculate_envelope_indicators(data, params):
     trend_filter_params = params.get('trend_filter', {})
     if trend_filter_params.get('enabled', False):
         tf_period = trend_filter_params.get('period', 200)
-        indicators['trend_sma'] = ta.trend.sma_indicator(data['close'], window=tf_period)
+        indicators['trend_sma'] = calculate_average(data, 'SMA', tf_period)
     
     # 4. Den Original-DataFrame mit dem Indikatoren-DataFrame verbinden
     return data.join(indicators)
@@ -0,0 +1,305 @@
+# code/utilities/streaming_indicators.py
+
+import os
+import json
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_VERSION = 1
+
+
+class StreamingSMA:
+    """
+    Einfacher gleitender Durchschnitt über `window` Schlusskurse mit laufender Summe.
+    Liefert NaN, bis das Fenster gefüllt ist (wie `ta.trend.sma_indicator`).
+    Die Summe wird alle `window` Kerzen exakt neu gebildet, damit sich keine Rundungsfehler aufschaukeln.
+    """
+    kind = 'SMA'
+
+    def __init__(self, window):
+        self.window = int(window)
+        self._values = deque(maxlen=self.window)
+        self._sum = 0.0
+        self._since_resum = 0
+        self.value = math.nan
+
+    def update(self, high, low, close):
+        if len(self._values) == self.window:
+            self._sum -= self._values[0]
+        self._values.append(close)
+        self._sum += close
+        self._since_resum += 1
+        if self._since_resum >= self.window:
+            self._sum = math.fsum(self._values)
+            self._since_resum = 0
+        self.value = self._sum / self.window if len(self._values) == self.window else math.nan
+        return self.value
+
+    def state(self):
+        return {'kind': self.kind, 'window': self.window, 'values': list(self._values),
+                'sum': self._sum, 'since_resum': self._since_resum, 'value': self.value}
+
+    def load_state(self, state):
+        self._values = deque(state['values'], maxlen=self.window)
+        self._sum = state['sum']
+        self._since_resum = state['since_resum']
+        self.value = state['value']
+
+
+class StreamingWMA:
+    """
+    Linear gewichteter Durchschnitt (neueste Kerze mit Gewicht `window`) wie `ta.trend.wma_indicator`.
+    Gewichtete Summe und Summe werden pro Kerze in O(1) fortgeschrieben und periodisch exakt neu berechnet.
+    """
+    kind = 'WMA'
+
+    def __init__(self, window):
+        self.window = int(window)
+        self._values = deque(maxlen=self.window)
+        self._sum = 0.0
+        self._weighted_sum = 0.0
+        self._since_resum = 0
+        self.value = math.nan
+
+    def _resum(self):
+        self._sum = math.fsum(self._values)
+        self._weighted_sum = math.fsum(w * v for w, v in enumerate(self._values, start=1))
+        self._since_resum = 0
+
+    def update(self, high, low, close):
+        if len(self._values) == self.window:
+            # Alle Gewichte rücken um eins nach unten, die älteste Kerze (Gewicht 1) fällt heraus
+            self._weighted_sum += self.window * close - self._sum
+            self._sum += close - self._values[0]
+            self._values.append(close)
+            self._since_resum += 1
+            if self._since_resum >= self.window:
+                self._resum()
+        else:
+            self._values.append(close)
+            if len(self._values) == self.window:
+                self._resum()
+        if len(self._values) == self.window:
+            self.value = self._weighted_sum * 2 / (self.window * (self.window + 1))
+        else:
+            self.value = math.nan
+        return self.value
+
+    def state(self):
+        return {'kind': self.kind, 'window': self.window, 'values': list(self._values), 'sum': self._sum,
+                'weighted_sum': self._weighted_sum, 'since_resum': self._since_resum, 'value': self.value}
+
+    def load_state(self, state):
+        self._values = deque(state['values'], maxlen=self.window)
+        self._sum = state['sum']
+        self._weighted_sum = state['weighted_sum']
+        self._since_resum = state['since_resum']
+        self.value = state['value']
+
+
+class StreamingDonchian:
+    """
+    Mittelband des Donchian-Kanals ((Hoch - Tief) / 2 + Tief über `window` Kerzen).
+    Rollierendes Maximum und Minimum über monotone Deques, amortisiert O(1) pro Kerze.
+    """
+    kind = 'DCM'
+
+    def __init__(self, window):
+        self.window = int(window)
+        self._count = 0
+        self._max = deque()  # (Index, Hoch), Werte absteigend
+        self._min = deque()  # (Index, Tief), Werte aufsteigend
+        self.value = math.nan
+
+    def update(self, high, low, close):
+        i = self._count
+        while self._max and self._max[-1][1] <= high:
+            self._max.pop()
+        self._max.append((i, high))
+        while self._min and self._min[-1][1] >= low:
+            self._min.pop()
+        self._min.append((i, low))
+        if self._max[0][0] <= i - self.window:
+            self._max.popleft()
+        if self._min[0][0] <= i - self.window:
+            self._min.popleft()
+        self._count += 1
+
+        if self._count >= self.window:
+            hband = self._max[0][1]
+            lband = self._min[0][1]
+            self.value = ((hband - lband) / 2.0) + lband
+        else:
+            self.value = math.nan
+        return self.value
+
+    def state(self):
+        return {'kind': self.kind, 'window': self.window, 'count': self._count,
+                'max': [list(e) for e in self._max], 'min': [list(e) for e in self._min], 'value': self.value}
+
+    def load_state(self, state):
+        self._count = state['count']
+        self._max = deque(tuple(e) for e in state['max'])
+        self._min = deque(tuple(e) for e in state['min'])
+        self.value = state['value']
+
+
+class StreamingATR:
+    """
+    Average True Range nach Wilder wie `ta.volatility.AverageTrueRange`: Startwert ist der Mittelwert
+    der ersten `window` True Ranges, danach (ATR * (window - 1) + TR) / window. Vorher 0.
+    """
+    kind = 'ATR'
+
+    def __init__(self, window):
+        self.window = int(window)
+        self._count = 0
+        self._prev_close = math.nan
+        self._warmup = []
+        self.value = 0.0
+
+    def update(self, high, low, close):
+        true_range = high - low
+        if not math.isnan(self._prev_close):
+            true_range = max(true_range, abs(high - self._prev_close), abs(low - self._prev_close))
+        self._prev_close = close
+
+        if self._count < self.window:
+            self._warmup.append(true_range)
+            if self._count == self.window - 1:
+                self.value = float(np.mean(self._warmup))
+                self._warmup = []
+        else:
+            self.value = (self.value * (self.window - 1) + true_range) / float(self.window)
+        self._count += 1
+        return self.value
+
+    def state(self):
+        return {'kind': self.kind, 'window': self.window, 'count': self._count,
+                'prev_close': self._prev_close, 'warmup': self._warmup, 'value': self.value}
+
+    def load_state(self, state):
+        self._count = state['count']
+        self._prev_close = state['prev_close']
+        self._warmup = list(state['warmup'])
+        self.value = state['value']
+
+
+AVERAGES = {'DCM': StreamingDonchian, 'SMA': StreamingSMA, 'WMA': StreamingWMA}
+
+
+def make_average(avg_type, avg_period):
+    if avg_type not in AVERAGES:
+        raise ValueError(f"Der Durchschnittstyp {avg_type} wird nicht unterstützt")
+    return AVERAGES[avg_type](avg_period)
+
+
+class StreamingEnvelopeIndicators:
+    """
+    Inkrementelles Gegenstück zu `calculate_envelope_indicators`: Durchschnitt, ATR, ATR in % und
+    optional der Trend-SMA werden pro neuer Kerze in konstanter Zeit fortgeschrieben.
+    Die Bänder werden aus dem aktuellen Durchschnitt und `envelopes_pct` abgeleitet.
+    Der Zustand lässt sich zwischen zwei Läufen als JSON speichern (`save` / `load`).
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.average = make_average(params.get('average_type', 'DCM'), int(params.get('average_period', 5)))
+        self.atr = StreamingATR(params.get('atr_period', 14))
+        trend_filter_params = params.get('trend_filter', {})
+        self.trend_sma = StreamingSMA(trend_filter_params.get('period', 200)) if trend_filter_params.get('enabled', False) else None
+        self.last_timestamp = None
+        self.last_close = math.nan
+
+    @staticmethod
+    def state_key(params):
+        """Die Parameter, von denen der Zustand abhängt; ändern sie sich, ist ein Snapshot ungültig."""
+        trend_filter_params = params.get('trend_filter', {})
+        return {
+            'average_type': params.get('average_type', 'DCM'), 'average_period': int(params.get('average_period', 5)),
+            'atr_period': params.get('atr_period', 14),
+            'trend_period': trend_filter_params.get('period', 200) if trend_filter_params.get('enabled', False) else None,
+        }
+
+    def update(self, timestamp, high, low, close):
+        """Verarbeitet eine abgeschlossene Kerze (Zeitstempel in Epoch-Millisekunden)."""
+        self.average.update(high, low, close)
+        self.atr.update(high, low, close)
+        if self.trend_sma is not None:
+            self.trend_sma.update(high, low, close)
+        self.last_timestamp = int(timestamp)
+        self.last_close = close
+        return self.values()
+
+    def update_frame(self, data):
+        """Verarbeitet alle Kerzen des DataFrames, die neuer als die zuletzt verarbeitete sind."""
+        timestamps = data.index.tz_convert('UTC').as_unit('ms').asi8 if data.index.tz is not None else data.index.as_unit('ms').asi8
+        high = data['high'].to_numpy(dtype=np.float64)
+        low = data['low'].to_numpy(dtype=np.float64)
+        close = data['close'].to_numpy(dtype=np.float64)
+        processed = 0
+        for i in range(len(data)):
+            if self.last_timestamp is not None and timestamps[i] <= self.last_timestamp:
+                continue
+            self.update(timestamps[i], float(high[i]), float(low[i]), float(close[i]))
+            processed += 1
+        return processed
+
+    def values(self):
+        """Aktuelle Indikatorwerte mit denselben Namen wie die Spalten von `calculate_envelope_indicators`."""
+        average = self.average.value
+        values = {
+            'average': average, 'atr': self.atr.value,
+            'atr_pct': (self.atr.value / self.last_close) * 100 if self.last_close else math.nan,
+        }
+        for i, e_pct in enumerate(self.params.get('envelopes_pct', [])):
+            e = e_pct / 100
+            values[f'band_high_{i + 1}'] = average * (1 + e)
+            values[f'band_low_{i + 1}'] = average * (1 - e)
+        if self.trend_sma is not None:
+            values['trend_sma'] = self.trend_sma.value
+        return values
+
+    def state(self):
+        return {
+            'version': SNAPSHOT_VERSION, 'key': self.state_key(self.params),
+            'last_timestamp': self.last_timestamp, 'last_close': self.last_close,
+            'average': self.average.state(), 'atr': self.atr.state(),
+            'trend_sma': self.trend_sma.state() if self.trend_sma is not None else None,
+        }
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.state(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, params):
+        """Lädt einen Snapshot; gibt None zurück, wenn keiner existiert oder er zu anderen Parametern gehört."""
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if state.get('version') != SNAPSHOT_VERSION or state.get('key') != cls.state_key(params):
+            return None
+        indicators = cls(params)
+        indicators.average.load_state(state['average'])
+        indicators.atr.load_state(state['atr'])
+        if indicators.trend_sma is not None:
+            indicators.trend_sma.load_state(state['trend_sma'])
+        indicators.last_timestamp = state['last_timestamp']
+        indicators.last_close = state['last_close']
+        return indicators
+
+    def latest_candle(self, data):
+        """
+        Baut die Zeile der zuletzt verarbeiteten Kerze wie `calculate_envelope_indicators(data).loc[ts]`
+        (Kerzendaten plus Indikatoren) als Series.
+        """
+        row = data.loc[pd.Timestamp(self.last_timestamp, unit='ms', tz='UTC')]
+        return pd.concat([row, pd.Series(self.values(), dtype='float64')]).rename(row.name)
@@ -3,9 +3,6 @@ import time
 from typing import Dict, Any, List, Optional, Union
 import ccxt
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 from pydantic import BaseModel
 
 
@@ -22,6 +19,13 @@ EXCHANGES: Dict[str, Dict[str, Any]] = {
     },
 }
 
+def _plotting():
+    # Plot-Bibliotheken erst beim ersten Diagramm laden; Import des Moduls bleibt leichtgewichtig
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    return sns, plt, mdates
+
 def convert_date_to_timestamp(date_str: str) -> int:
     return int(datetime.datetime.strptime(date_str, "%Y-%m-%d").timestamp() * 1000)
 
@@ -377,6 +381,7 @@ class RecordsManager:
         records.to_csv(self._filename + ".csv", index=True)
 
     def plot_over_time(self, metric: str, show_transfers: bool = False) -> None:
+        _, plt, mdates = _plotting()
         plt.figure(figsize=(8, 4))
         if metric == "PnL":
             plt.plot(self.records_to_analyse.index, self.records_to_analyse["windowPnl"], color="blue", label="P&L ($)")
@@ -407,6 +412,7 @@ class RecordsManager:
         plt.show()
 
     def plot_per_pair(self, metric: str, include_funding_fees: bool = True) -> None:
+            sns, plt, _ = _plotting()
             if metric not in ["PnL", "PnL Pct", "Funding Fees", "Win Rate", "Trades"]:
                 raise ValueError("Unsupported metric for plot_per_pair")
 
@@ -447,6 +453,7 @@ class RecordsManager:
             plt.show()
 
     def plot_per_trade_type(self, metric: str, results: str = "global") -> None:
+        sns, plt, _ = _plotting()
         data = self.results[results]
         
         if metric == "PnL":
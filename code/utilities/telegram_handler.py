@@ -1,32 +1,233 @@
-import requests
+import time
+import queue
+import atexit
 import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utilities.rate_limiter import TokenBucket
 
 logger = logging.getLogger(__name__)
 
-def send_telegram_message(bot_token, chat_id, message):
-    """
-    Sendet eine Nachricht an einen Telegram-Chat.
-    """
-    if not bot_token or not chat_id:
-        logger.warning("Telegram Bot-Token oder Chat-ID nicht in secret.json konfiguriert. Überspringe Benachrichtigung.")
-        return
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+# Telegram erlaubt pro Chat etwa eine Nachricht pro Sekunde (Gruppen: 20 pro Minute)
+MESSAGES_PER_SECOND_PER_CHAT = 1.0
+REQUEST_TIMEOUT_SECONDS = 10
+MAX_SEND_RETRIES = 3
+MAX_QUEUE_SIZE = 200
+# Nachrichten, die innerhalb dieses Fensters für denselben Chat anfallen, werden zu einer zusammengefasst
+COALESCE_SECONDS = 1.0
+# So lange wartet der Prozess beim Beenden höchstens auf noch nicht gesendete Nachrichten
+FLUSH_TIMEOUT_SECONDS = 8.0
+
+_STOP = object()
+_session = None
+_session_lock = threading.Lock()
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
 
+
+def _http_session():
+    # Eine Keep-Alive-Session für alle Telegram-Aufrufe des Prozesses statt einer Verbindung pro Nachricht
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        return _session
+
+
+def escape_markdown(message):
     # Telegram mag einige Zeichen nicht. Wir müssen sie für den MarkdownV2-Modus escapen.
     # Dies ist eine vereinfachte Liste, die die häufigsten Problemzeichen abdeckt.
     escape_chars = '_*[]()~`>#+-=|{}.!'
     for char in escape_chars:
         message = message.replace(char, f'\\{char}')
+    return message
+
+
+def split_message(text, limit=TELEGRAM_MAX_MESSAGE_LENGTH):
+    """Teilt einen (bereits escapten) Text in Stücke ≤ `limit`, bevorzugt an Zeilenumbrüchen, nie mitten in einem Escape."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+            # Ein abgetrenntes "\" würde sonst das erste Zeichen des nächsten Stücks escapen
+            if (cut - len(text[:cut].rstrip('\\'))) % 2 == 1:
+                cut -= 1
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        chunks.append(text)
+    return chunks
 
+
+def _post_message(bot_token, chat_id, text, limiter=None, retries=MAX_SEND_RETRIES):
+    """Sendet einen fertig escapten Text. Wartet bei 429 die von Telegram genannte Zeit ab. Gibt True bei Erfolg zurück."""
     api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
     payload = {
         'chat_id': chat_id,
-        'text': message,
+        'text': text,
         'parse_mode': 'MarkdownV2'
     }
-    
-    try:
-        response = requests.post(api_url, data=payload, timeout=10)
-        if response.status_code != 200:
-            logger.error(f"Fehler beim Senden der Telegram-Nachricht: {response.text}")
-    except Exception as e:
-        logger.error(f"Ausnahme beim Senden der Telegram-Nachricht: {e}")
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = _http_session().post(api_url, data=payload, timeout=REQUEST_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f"Ausnahme beim Senden der Telegram-Nachricht: {e}")
+            time.sleep(2 ** attempt)
+            continue
+        if response.status_code == 200:
+            return True
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+            except ValueError:
+                retry_after = 1
+            logger.warning(f"Telegram-Rate-Limit erreicht, warte {retry_after} s.")
+            time.sleep(retry_after)
+            continue
+        if response.status_code >= 500:
+            time.sleep(2 ** attempt)
+            continue
+        logger.error(f"Fehler beim Senden der Telegram-Nachricht: {response.text}")
+        return False
+    logger.error("Telegram-Nachricht nach mehreren Versuchen nicht gesendet.")
+    return False
+
+
+def send_telegram_message(bot_token, chat_id, message):
+    """
+    Sendet eine Nachricht an einen Telegram-Chat (blockierend).
+    """
+    if not bot_token or not chat_id:
+        logger.warning("Telegram Bot-Token oder Chat-ID nicht in secret.json konfiguriert. Überspringe Benachrichtigung.")
+        return
+
+    for chunk in split_message(escape_markdown(message)):
+        _post_message(bot_token, chat_id, chunk)
+
+
+class TelegramDispatcher:
+    """
+    Versendet Telegram-Nachrichten in einem Hintergrund-Thread, damit der Handelszyklus nie auf die
+    Telegram-API wartet. Die Warteschlange ist begrenzt (bei Überlauf wird verworfen statt zu blockieren).
+    Nachrichten an denselben Chat, die kurz nacheinander eintreffen, werden zu einer Nachricht zusammengefasst,
+    und pro Chat gilt ein Rate-Limit. Beim Beenden des Prozesses wird höchstens `flush_timeout` Sekunden nachgesendet.
+    """
+
+    def __init__(self, max_queue=MAX_QUEUE_SIZE, coalesce_seconds=COALESCE_SECONDS,
+                 messages_per_second=MESSAGES_PER_SECOND_PER_CHAT, flush_timeout=FLUSH_TIMEOUT_SECONDS):
+        self.coalesce_seconds = coalesce_seconds
+        self.messages_per_second = messages_per_second
+        self.flush_timeout = flush_timeout
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._limiters = {}
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._flushing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='telegram-dispatcher', daemon=True)
+        self._thread.start()
+
+    def send(self, bot_token, chat_id, message):
+        """Reiht eine Nachricht ein und kehrt sofort zurück."""
+        if not bot_token or not chat_id:
+            logger.warning("Telegram Bot-Token oder Chat-ID nicht in secret.json konfiguriert. Überspringe Benachrichtigung.")
+            return False
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((bot_token, chat_id, message))
+            return True
+        except queue.Full:
+            self._done(1)
+            self.dropped += 1
+            logger.warning("Telegram-Warteschlange voll, Nachricht verworfen.")
+            return False
+
+    def flush(self, timeout=None):
+        """Wartet, bis alle eingereihten Nachrichten versendet sind (höchstens `timeout` Sekunden)."""
+        deadline = time.monotonic() + (self.flush_timeout if timeout is None else timeout)
+        self._flushing.set()
+        try:
+            with self._idle:
+                while self._pending > 0:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.warning(f"{self._pending} Telegram-Nachricht(en) nicht mehr gesendet.")
+                        return False
+                    self._idle.wait(remaining)
+            return True
+        finally:
+            self._flushing.clear()
+
+    def close(self, timeout=None):
+        flushed = self.flush(timeout)
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        return flushed
+
+    def _done(self, count):
+        with self._idle:
+            self._pending -= count
+            if self._pending <= 0:
+                self._idle.notify_all()
+
+    def _collect(self, first):
+        # Weitere Nachrichten im Zeitfenster einsammeln; beim Flush nur noch das, was schon wartet
+        batch = [first]
+        deadline = time.monotonic() + self.coalesce_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if self._flushing.is_set() or remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, False
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch, stop = self._collect(item)
+            chats = {}
+            for bot_token, chat_id, message in batch:
+                chats.setdefault((bot_token, chat_id), []).append(escape_markdown(message))
+            for (bot_token, chat_id), messages in chats.items():
+                limiter = self._limiters.setdefault(chat_id, TokenBucket(self.messages_per_second, 1))
+                try:
+                    for chunk in split_message('\n\n'.join(messages)):
+                        _post_message(bot_token, chat_id, chunk, limiter)
+                except Exception as e:
+                    logger.error(f"Ausnahme beim Senden der Telegram-Nachricht: {e}")
+            self._done(len(batch))
+
+
+def get_dispatcher():
+    """Gemeinsamer Dispatcher des Prozesses; wird beim ersten Aufruf gestartet und beim Beenden geleert."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = TelegramDispatcher()
+            atexit.register(_dispatcher.close)
+        return _dispatcher
+
+
+def queue_telegram_message(bot_token, chat_id, message):
+    """Nicht-blockierende Variante von `send_telegram_message` über den gemeinsamen Dispatcher."""
+    return get_dispatcher().send(bot_token, chat_id, message)
@@ -5,6 +5,7 @@ SCRIPT_DIR=$(cd -- "$(dirname -- "${BASH_SOURCE[0]}")" &> /dev/null && pwd)
 VENV_PATH="$SCRIPT_DIR/code/.venv/bin/activate"
 GLOBAL_OPTIMIZER="$SCRIPT_DIR/code/analysis/global_optimizer_pymoo.py"
 LOCAL_REFINER="$SCRIPT_DIR/code/analysis/local_refiner_optuna.py"
+WALK_FORWARD="$SCRIPT_DIR/code/analysis/walk_forward.py"
 BACKTESTER="$SCRIPT_DIR/code/analysis/run_backtest.py" # NEU
 CANDIDATES_FILE="$SCRIPT_DIR/code/analysis/optimization_candidates.json"
 CACHE_DIR="$SCRIPT_DIR/code/analysis/historical_data"
@@ -23,6 +24,44 @@ else
     exit 1
 fi
 
+# --- Ohne Rückfragen (z.B. Cron): ./run_optimization_pipeline.sh --job-spec <datei.json> [--jobs N] ---
+# --- Walk-Forward (z.B. nächtlich):  ./run_optimization_pipeline.sh --walk-forward <datei.json> [--jobs N] ---
+JOB_SPEC=""
+WALK_FORWARD_SPEC=""
+N_CORES=""
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --job-spec) JOB_SPEC="$2"; shift 2 ;;
+        --walk-forward) WALK_FORWARD_SPEC="$2"; shift 2 ;;
+        --jobs) N_CORES="$2"; shift 2 ;;
+        *) echo -e "${RED}Unbekannte Option: $1${NC}"; deactivate; exit 1 ;;
+    esac
+done
+
+if [ -n "$WALK_FORWARD_SPEC" ]; then
+    N_CORES=${N_CORES:-$(nproc)}
+    echo -e "${GREEN}>>> STARTE WALK-FORWARD mit Job-Datei $WALK_FORWARD_SPEC ($N_CORES Kerne)...${NC}"
+    python3 "$WALK_FORWARD" --jobs "$N_CORES" --job-spec "$WALK_FORWARD_SPEC"
+    status=$?
+    deactivate
+    exit $status
+fi
+
+if [ -n "$JOB_SPEC" ]; then
+    N_CORES=${N_CORES:-$(nproc)}
+    echo -e "${GREEN}>>> STARTE STUFE 1 mit Job-Datei $JOB_SPEC ($N_CORES Kerne)...${NC}"
+    if ! python3 "$GLOBAL_OPTIMIZER" --jobs "$N_CORES" --job-spec "$JOB_SPEC" || [ ! -f "$CANDIDATES_FILE" ]; then
+        echo -e "${RED}Fehler: Stufe 1 hat keine Ergebnisse geliefert. Breche ab.${NC}"
+        deactivate
+        exit 1
+    fi
+    echo -e "\n${GREEN}>>> STARTE STUFE 2: Lokale Verfeinerung mit Optuna...${NC}"
+    python3 "$LOCAL_REFINER" --jobs "$N_CORES"
+    status=$?
+    deactivate
+    exit $status
+fi
+
 # --- Hauptmenü ---
 echo -e "${BLUE}======================================================="
 echo "       Analyse- & Optimierungs-Werkzeuge"